@@ -0,0 +1,516 @@
+"""benchmarks/benchmark.py
+
+Benchmarks of the bookblock logic layer.
+
+Runs the benchmarks on synthetic scans (see synthetic.py), writes the
+results as JSON file and compares them with the results of a baseline
+run.  A benchmark whose median time exceeds the one of the baseline by
+more than the threshold counts as regression - and makes the run fail.
+
+Usage:
+
+  # Record a baseline
+  python -m benchmarks.benchmark --output baseline.json
+
+  # Compare a later run with the baseline
+  python -m benchmarks.benchmark --output current.json --baseline baseline.json
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import sys, os, io, json, platform, tempfile, statistics, subprocess
+from pathlib import PosixPath
+from contextlib import contextmanager, redirect_stdout
+from time import perf_counter, strftime
+
+import click
+
+from benchmarks.synthetic import generate_scans, g_paper_sizes, g_formats
+from newskylabs.tools.bookblock.utils.logger import configure_logger
+
+## =========================================================
+## Benchmark registry
+## ---------------------------------------------------------
+
+# Version of the result file format
+g_results_version = 1
+
+# The registered benchmarks: [(name, function, needs scans?)]
+g_benchmarks = []
+
+def benchmark(name, scans=True):
+    """
+    Register a benchmark function.
+
+    The function is called once per repetition with the benchmark
+    context and has to time exactly one section with
+    `with context.measure():' - the setup before is not timed.
+
+    SCANS: does the benchmark use the synthetic scans?
+    """
+
+    def register(function):
+        g_benchmarks.append((name, function, scans))
+        return function
+
+    return register
+
+class BenchmarkContext:
+    """
+    The settings and synthetic scans shared by the benchmarks
+    and the collected timings.
+    """
+
+    def __init__(self, scans, work_dir, image_mode, jobs):
+        self.scans = scans
+        self.work_dir = work_dir
+        self.image_mode = image_mode
+        self.jobs = jobs
+        self.num_scans = len(scans['scan-paths']) if scans else 0
+        self._samples = []
+
+    def get_settings(self, pages=None, target_dir=None):
+        """
+        Return fresh settings for the synthetic scans.
+        """
+
+        from newskylabs.tools.bookblock.utils.settings import Settings
+
+        if pages is None:
+            pages = '0-{}lr'.format(self.num_scans - 1)
+
+        if target_dir is None:
+            target_dir = str(self.work_dir / 'pages')
+        os.makedirs(target_dir, exist_ok=True)
+
+        return Settings() \
+            .set_debug_level('warning') \
+            .set_image_mode(self.image_mode) \
+            .set_view_mode('page') \
+            .set_source_dir(self.scans['source-dir']) \
+            .set_target_dir(target_dir) \
+            .set_source_file_format(self.scans['source-file-format']) \
+            .set_target_file_format('page%03d.png') \
+            .set_geometry(self.scans['geometry']) \
+            .set_pages(pages) \
+            .set_jobs(self.jobs)
+
+    @contextmanager
+    def measure(self):
+        start = perf_counter()
+        yield
+        self._samples.append(perf_counter() - start)
+
+    def take_samples(self):
+        samples, self._samples = self._samples, []
+        return samples
+
+## =========================================================
+## Benchmarks
+## ---------------------------------------------------------
+
+@benchmark('pages.init_page_list')
+def bench_init_page_list(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+
+    # A long book with a few irregular segments
+    pages = Pages(context.get_settings(pages='0l,1-9999lr,10000r,10001-10499lr'))
+    with context.measure():
+        pages._init_page_list()
+
+@benchmark('page.load_scan')
+def bench_load_scan(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+    from newskylabs.tools.bookblock.logic.page import Page
+
+    # A new Page - the scan is not cached yet
+    settings = context.get_settings()
+    page_spec = Pages(settings).get_page_spec(0)
+    page = Page(settings)
+    with context.measure():
+        page.load_scan(page_spec)
+
+@benchmark('page.load_scan.cached')
+def bench_load_scan_cached(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+    from newskylabs.tools.bookblock.logic.page import Page
+
+    settings = context.get_settings()
+    page_spec = Pages(settings).get_page_spec(0)
+    page = Page(settings)
+    page.load_scan(page_spec)
+    with context.measure():
+        page.load_scan(page_spec)
+
+@benchmark('page.get_page')
+def bench_get_page(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+    from newskylabs.tools.bookblock.logic.page import Page
+
+    settings = context.get_settings()
+    page_spec = Pages(settings).get_page_spec(1)
+    page = Page(settings)
+    with context.measure():
+        page.get_page(page_spec)
+
+@benchmark('page.store_page')
+def bench_store_page(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+    from newskylabs.tools.bookblock.logic.page import Page
+
+    settings = context.get_settings()
+    page_spec = Pages(settings).get_page_spec(0)
+    page = Page(settings)
+    with context.measure():
+        page.store_page(page_spec)
+
+@benchmark('bookblock.store_pages')
+def bench_store_pages(context):
+    from newskylabs.tools.bookblock.logic.bookblock import BookBlock
+
+    bookblock = BookBlock(context.get_settings())
+    with redirect_stdout(io.StringIO()):
+        with context.measure():
+            bookblock.store_pages()
+    bookblock.shutdown()
+
+def import_get_texture_buffer():
+    """
+    Import get_texture_buffer() from the Kivy layer -
+    keeping Kivy away from the command line arguments and quiet.
+    """
+
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+    from newskylabs.tools.bookblock.kivy.opencvimage import get_texture_buffer
+    return get_texture_buffer
+
+@benchmark('opencvimage.texture_buffer')
+def bench_texture_buffer(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+    from newskylabs.tools.bookblock.logic.page import Page
+    get_texture_buffer = import_get_texture_buffer()
+
+    # A page owned by the caller -
+    # as returned by Page.get_page(copy=True)
+    settings = context.get_settings()
+    page_spec = Pages(settings).get_page_spec(0)
+    page = Page(settings).get_page(page_spec, copy=True)
+    with context.measure():
+        get_texture_buffer(page)
+
+@benchmark('opencvimage.texture_buffer.readonly')
+def bench_texture_buffer_readonly(context):
+    from newskylabs.tools.bookblock.logic.pages import Pages
+    from newskylabs.tools.bookblock.logic.page import Page
+    get_texture_buffer = import_get_texture_buffer()
+
+    # A read-only view of a cached scan -
+    # copied into a reused staging buffer
+    settings = context.get_settings()
+    page_spec = Pages(settings).get_page_spec(0)
+    page = Page(settings).get_page(page_spec)
+    page.flags.writeable = False
+    staging, size, colorfmt = get_texture_buffer(page)
+    with context.measure():
+        get_texture_buffer(page, staging)
+
+## =========================================================
+## Startup benchmarks
+## ---------------------------------------------------------
+
+# Modules the logic layer and the command line interface
+# must not import at startup - they are imported when needed
+g_deferred_modules = ('kivy', 'cv2', 'numpy')
+
+def run_python(*args):
+    """
+    Run a fresh python interpreter with ARGS
+    and fail when it does not exit successfully.
+    """
+
+    # Make the package importable from the same place
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+
+    process = subprocess.run([sys.executable] + list(args), env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip() or
+                           "{} exited with {}".format(' '.join(args), process.returncode))
+
+def bench_import(context, module):
+    """
+    Time importing MODULE in a fresh interpreter - and make sure
+    that none of the g_deferred_modules is imported along with it.
+    """
+
+    code = "import sys; import {}; " \
+        "deferred = [m for m in {!r} if m in sys.modules]; " \
+        "sys.exit('Imported at startup: ' + ', '.join(deferred) if deferred else 0)"\
+        .format(module, g_deferred_modules)
+
+    with context.measure():
+        run_python('-c', code)
+
+@benchmark('startup.python', scans=False)
+def bench_startup_python(context):
+    # The interpreter startup included in the other startup benchmarks
+    with context.measure():
+        run_python('-c', 'pass')
+
+@benchmark('startup.import.cli', scans=False)
+def bench_import_cli(context):
+    bench_import(context, 'newskylabs.tools.bookblock.scripts.bookblock')
+
+@benchmark('startup.import.logic.pages', scans=False)
+def bench_import_pages(context):
+    bench_import(context, 'newskylabs.tools.bookblock.logic.pages')
+
+@benchmark('startup.import.logic.bookblock', scans=False)
+def bench_import_bookblock(context):
+    bench_import(context, 'newskylabs.tools.bookblock.logic.bookblock')
+
+@benchmark('startup.version', scans=False)
+def bench_version(context):
+    with context.measure():
+        run_python('-m', 'newskylabs.tools.bookblock', '--version')
+
+## =========================================================
+## Running the benchmarks
+## ---------------------------------------------------------
+
+def select_benchmarks(selection=None):
+    """
+    Return the benchmarks whose name contains one of the strings
+    in SELECTION (all by default).
+    """
+
+    return [(name, function, scans) for name, function, scans in g_benchmarks
+            if not selection or any(s in name for s in selection)]
+
+def run_benchmarks(context, repeat, selection=None):
+    """
+    Run the benchmarks whose name contains one of the strings in
+    SELECTION (all by default) REPEAT times each.
+
+    Return a dictionary: name -> timing summary in milliseconds.
+    """
+
+    results = {}
+    for name, function, scans in select_benchmarks(selection):
+
+        print("  - {:40} ".format(name), end='', flush=True)
+
+        for _ in range(repeat):
+            function(context)
+        samples = context.take_samples()
+
+        results[name] = summarize(samples)
+        print("{:10.2f} ms".format(results[name]['median-ms']))
+
+    return results
+
+def summarize(samples):
+
+    def ms(seconds):
+        return round(seconds * 1000.0, 3)
+
+    return {
+        'repeat':     len(samples),
+        'min-ms':     ms(min(samples)),
+        'median-ms':  ms(statistics.median(samples)),
+        'mean-ms':    ms(statistics.mean(samples)),
+        'max-ms':     ms(max(samples)),
+        'samples-ms': [ms(sample) for sample in samples],
+    }
+
+def get_environment():
+    """
+    Return a description of the machine and library versions -
+    results are only comparable on the same environment.
+    """
+
+    import numpy as np
+    import cv2
+
+    return {
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'machine':  platform.machine(),
+        'cpus':     os.cpu_count(),
+        'numpy':    np.__version__,
+        'opencv':   cv2.__version__,
+    }
+
+## =========================================================
+## Comparing with a baseline
+## ---------------------------------------------------------
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare the RESULTS with the BASELINE results
+    and print a table of the changes of the median times.
+
+    Return the names of the benchmarks which are slower than the
+    baseline by more than THRESHOLD (0.1 = 10%).
+    """
+
+    if results['parameters'] != baseline.get('parameters'):
+        print("WARNING The benchmark parameters differ from the ones of the baseline:",
+              file=sys.stderr)
+        print("  - baseline: {}".format(baseline.get('parameters')), file=sys.stderr)
+        print("  - current:  {}".format(results['parameters']), file=sys.stderr)
+
+    if results['environment'] != baseline.get('environment'):
+        print("WARNING The environment differs from the one of the baseline.",
+              file=sys.stderr)
+
+    print("")
+    print("Comparison with the baseline (median, threshold {:.0%}):".format(threshold))
+    print("")
+
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            print("  - {:40} {:>10} {:10.2f} ms   (new)"\
+                  .format(name, '', current['median-ms']))
+            continue
+
+        ratio = current['median-ms'] / base['median-ms'] if base['median-ms'] else 1.0
+        status = ''
+        if ratio > 1.0 + threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1.0 - threshold:
+            status = 'improved'
+
+        print("  - {:40} {:10.2f} {:10.2f} ms {:+7.1%} {}"\
+              .format(name, base['median-ms'], current['median-ms'], ratio - 1.0, status))
+
+    print("")
+    return regressions
+
+## =========================================================
+## Main
+## ---------------------------------------------------------
+
+@click.command()
+@click.option('-o', '--output', 'output_path',
+              type=click.Path(dir_okay=False),
+              help="JSON file the results are written to " + \
+              "(default: benchmark-<time>.json).")
+@click.option('-B', '--baseline', 'baseline_path',
+              type=click.Path(exists=True, dir_okay=False),
+              help="JSON results of a baseline run to compare with.")
+@click.option('-T', '--threshold', default=0.1,
+              type=click.FloatRange(min=0.0),
+              help="Relative slowdown of the median time " + \
+              "counting as regression (default: 0.1 = 10%).")
+@click.option('-k', '--select', 'selection', multiple=True,
+              help="Only run the benchmarks whose name contains SELECT " + \
+              "(can be given more than once).")
+@click.option('-r', '--repeat', default=5,
+              type=click.IntRange(min=1),
+              help="Number of repetitions of each benchmark.")
+@click.option('-n', '--scans', 'num_scans', default=4,
+              type=click.IntRange(min=2),
+              help="Number of synthetic scans.")
+@click.option('--dpi', default=300,
+              type=click.IntRange(min=10),
+              help="Resolution of the synthetic scans.")
+@click.option('--paper', default='a4',
+              type=click.Choice(sorted(g_paper_sizes)),
+              help="Paper size of the synthetic pages.")
+@click.option('--image-mode', default='color',
+              type=click.Choice(['color', 'grayscale']),
+              help="Image mode of the scans and pages.")
+@click.option('--format', 'file_format', default='png',
+              type=click.Choice(sorted(g_formats)),
+              help="File format of the synthetic scans.")
+@click.option('-j', '--jobs', default=1,
+              type=click.IntRange(min=0),
+              help="Worker processes of bookblock.store_pages.")
+@click.option('-w', '--work-dir',
+              type=click.Path(file_okay=False),
+              help="Directory for the scans and pages - " + \
+              "keeping the scans between runs " + \
+              "(default: a temporary directory).")
+def main(output_path, baseline_path, threshold, selection, repeat,
+         num_scans, dpi, paper, image_mode, file_format, jobs, work_dir):
+    """Benchmark the bookblock logic layer on synthetic scans.
+    """
+
+    # Only log warnings and errors of the logic layer
+    configure_logger('warning')
+
+    parameters = {
+        'scans':      num_scans,
+        'dpi':        dpi,
+        'paper':      paper,
+        'image-mode': image_mode,
+        'format':     file_format,
+        'jobs':       jobs,
+        'repeat':     repeat,
+    }
+
+    with tempfile.TemporaryDirectory(prefix='bookblock-benchmark-') as tmp_dir:
+
+        work_dir = PosixPath(work_dir or tmp_dir).expanduser()
+
+        # Only generate the scans when they are used
+        scans = None
+        if any(uses_scans for name, function, uses_scans in select_benchmarks(selection)):
+            print("")
+            print("Generating synthetic scans...")
+            scans = generate_scans(work_dir / 'scans', num_scans, dpi, paper,
+                                   image_mode == 'color', file_format)
+
+        print("")
+        print("Running benchmarks:")
+        print("")
+        context = BenchmarkContext(scans, work_dir, image_mode, jobs)
+        benchmarks = run_benchmarks(context, repeat, selection)
+
+    results = {
+        'version':     g_results_version,
+        'created':     strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters':  parameters,
+        'environment': get_environment(),
+        'benchmarks':  benchmarks,
+    }
+
+    if output_path is None:
+        output_path = 'benchmark-{}.json'.format(strftime('%Y%m%d-%H%M%S'))
+    with open(output_path, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print("")
+    print("Results written to {}".format(output_path))
+
+    if baseline_path is None:
+        return
+
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare_results(results, baseline, threshold)
+    if regressions:
+        print("ERROR {} regressions: {}".format(len(regressions), ', '.join(regressions)),
+              file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
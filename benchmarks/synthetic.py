@@ -0,0 +1,280 @@
+"""benchmarks/synthetic.py
+
+Synthetic book scans.
+
+Generates two-page scans - a dark scanner lid with two pages of
+paper showing lines of `words' and a shadow at the gutter - at a
+configurable resolution, paper size, image mode and file format.
+
+The scans are random but reproducible: the same parameters and seed
+always produce the same scan.
+
+Usage:
+
+  python -m benchmarks.synthetic -o /tmp/scans -n 10 --dpi 300 --format tiff
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import os
+from pathlib import PosixPath
+
+import click
+import numpy as np
+import cv2
+
+## =========================================================
+## Layout
+## ---------------------------------------------------------
+
+# Paper sizes (width, height) in inches
+g_paper_sizes = {
+    'a4':     (8.27, 11.69),
+    'a5':     (5.83,  8.27),
+    'letter': (8.5,  11.0),
+}
+
+# File formats: format -> (file name extension, cv2.imwrite parameters)
+g_formats = {
+    'png':  ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+    'tiff': ('.tif', []),
+    'jpeg': ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 90]),
+}
+
+# Width of the scanner lid visible around each page in inches
+g_border = 0.4
+
+# Line pitch and word height in inches
+g_line_pitch = 0.18
+g_word_height = 0.09
+
+# Width of the gutter shadow in inches
+g_gutter_shadow = 0.3
+
+# Gray values (BGR in color mode)
+g_lid_color   = (52, 50, 48)
+g_paper_color = (222, 236, 242)
+g_ink_color   = (40, 38, 36)
+
+def get_layout(dpi=300, paper='a4'):
+    """
+    Return the layout of a two-page scan in pixels:
+
+      - scan-size:   (height, width) of the scan
+      - page-size:   (height, width) of each page
+      - page-offset: (left, top) offset of each page
+                     in its half of the scan
+      - geometry:    the bookblock geometry of the pages
+    """
+
+    paper_width, paper_height = g_paper_sizes[paper]
+
+    page_width  = int(round(paper_width  * dpi))
+    page_height = int(round(paper_height * dpi))
+    border      = int(round(g_border * dpi))
+
+    # Each half of the scan shows one page surrounded by the lid
+    half_width  = page_width + 2 * border
+    scan_height = page_height + 2 * border
+
+    return {
+        'scan-size':   (scan_height, 2 * half_width),
+        'page-size':   (page_height, page_width),
+        'page-offset': (border, border),
+        'geometry':    '{}x{}+{}+{}'.format(page_width, page_height, border, border),
+    }
+
+## =========================================================
+## generate_scan()
+## ---------------------------------------------------------
+
+def generate_scan(dpi=300, paper='a4', color=True, seed=0):
+    """
+    Return a synthetic two-page scan as numpy array:
+    (height, width, 3) BGR when COLOR is True,
+    (height, width) grayscale otherwise.
+    """
+
+    rng = np.random.default_rng(seed)
+    layout = get_layout(dpi, paper)
+    scan_height, scan_width = layout['scan-size']
+    page_height, page_width = layout['page-size']
+    offset_left, offset_top = layout['page-offset']
+    half_width = scan_width // 2
+
+    # Work on a single channel -
+    # the color is applied at the end
+    lid, paper_value, ink = 0, 1, 2
+    scan = np.full((scan_height, scan_width), lid, dtype=np.uint8)
+
+    for side in ('left', 'right'):
+        x0 = offset_left + (half_width if side == 'right' else 0)
+        y0 = offset_top
+        scan[y0:y0+page_height, x0:x0+page_width] = paper_value
+        draw_words(scan[y0:y0+page_height, x0:x0+page_width], dpi, ink, rng)
+
+    # Map to gray values
+    if color:
+        palette = np.array([g_lid_color, g_paper_color, g_ink_color], dtype=np.int16)
+    else:
+        palette = np.array([[sum(c) // 3] for c in (g_lid_color, g_paper_color, g_ink_color)],
+                           dtype=np.int16)
+    image = palette[scan]
+
+    # Gutter shadow: darken the paper towards the fold
+    shadow_width = int(g_gutter_shadow * dpi)
+    if shadow_width > 0:
+        ramp = np.linspace(0.6, 1.0, shadow_width)
+        shade = np.ones(scan_width)
+        left_edge = offset_left + page_width
+        right_edge = half_width + offset_left
+        shade[left_edge-shadow_width:left_edge] = ramp[::-1]
+        shade[right_edge:right_edge+shadow_width] = ramp
+        shade = shade.reshape((1, scan_width, 1))
+        image = (image * shade).astype(np.int16)
+
+    # Sensor noise - which makes the scans compress realistically
+    noise = rng.integers(-6, 7, size=(scan_height, scan_width), dtype=np.int16)
+    image += noise[:, :, np.newaxis]
+
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    if not color:
+        image = image[:, :, 0]
+
+    return image
+
+def draw_words(page, dpi, ink, rng):
+    """
+    Draw lines of `words' - dark rectangles of random width -
+    into PAGE.
+    """
+
+    page_height, page_width = page.shape
+    margin = int(0.8 * dpi)
+    line_pitch = max(int(g_line_pitch * dpi), 2)
+    word_height = max(int(g_word_height * dpi), 1)
+    space = max(int(0.06 * dpi), 1)
+
+    for y in range(margin, page_height - margin - word_height, line_pitch):
+
+        # Paragraph ends are shorter
+        line_end = page_width - margin
+        if rng.random() < 0.12:
+            line_end = margin + int(rng.random() * (line_end - margin))
+
+        x = margin
+        while True:
+            word_width = int(rng.integers(2, 12) * 0.04 * dpi)
+            if x + word_width > line_end:
+                break
+            page[y:y+word_height, x:x+word_width] = ink
+            x += word_width + space
+
+## =========================================================
+## generate_scans()
+## ---------------------------------------------------------
+
+def write_scan(scan_path, scan, file_format='png'):
+    """
+    Write SCAN in FILE_FORMAT (png, tiff, jpeg) to SCAN_PATH.
+    """
+
+    extension, params = g_formats[file_format]
+    if not cv2.imwrite(str(scan_path), scan, params):
+        raise IOError("Failed to write scan: {}".format(scan_path))
+
+def generate_scans(scan_dir, num_scans, dpi=300, paper='a4', color=True,
+                   file_format='png', seed=0):
+    """
+    Write NUM_SCANS synthetic scans to SCAN_DIR.
+
+    Scans which already exist are not generated again
+    (the file names contain all parameters).
+
+    Return a dictionary with the settings needed to cut out the pages:
+    source-dir, source-file-format, geometry, scan-size and the list
+    of scan-paths.
+    """
+
+    scan_dir = PosixPath(scan_dir).expanduser()
+    scan_dir.mkdir(parents=True, exist_ok=True)
+
+    extension, params = g_formats[file_format]
+    source_file_format = 'scan-{}-{}dpi-{}-s{}-%03d{}'\
+        .format(paper, dpi, 'color' if color else 'gray', seed, extension)
+
+    scan_paths = []
+    for scan in range(num_scans):
+        scan_path = scan_dir / (source_file_format % scan)
+        if not scan_path.exists():
+            image = generate_scan(dpi, paper, color, seed + scan)
+            tmp_path = scan_path.with_name('tmp-{}-{}'.format(os.getpid(), scan_path.name))
+            write_scan(tmp_path, image, file_format)
+            os.replace(str(tmp_path), str(scan_path))
+        scan_paths.append(str(scan_path))
+
+    layout = get_layout(dpi, paper)
+
+    return {
+        'source-dir':         str(scan_dir),
+        'source-file-format': source_file_format,
+        'geometry':           layout['geometry'],
+        'scan-size':          layout['scan-size'],
+        'scan-paths':         scan_paths,
+    }
+
+## =========================================================
+## Main
+## ---------------------------------------------------------
+
+@click.command()
+@click.option('-o', '--output-dir', required=True,
+              type=click.Path(file_okay=False),
+              help="Directory the scans are written to.")
+@click.option('-n', '--scans', 'num_scans', default=10,
+              type=click.IntRange(min=1),
+              help="Number of scans.")
+@click.option('--dpi', default=300,
+              type=click.IntRange(min=10),
+              help="Resolution of the scans.")
+@click.option('--paper', default='a4',
+              type=click.Choice(sorted(g_paper_sizes)),
+              help="Paper size of the pages.")
+@click.option('--image-mode', default='color',
+              type=click.Choice(['color', 'grayscale']),
+              help="Color or grayscale scans.")
+@click.option('--format', 'file_format', default='png',
+              type=click.Choice(sorted(g_formats)),
+              help="File format of the scans.")
+@click.option('--seed', default=0,
+              help="Seed of the random page content.")
+def main(output_dir, num_scans, dpi, paper, image_mode, file_format, seed):
+    """Generate synthetic two-page book scans.
+    """
+
+    scans = generate_scans(output_dir, num_scans, dpi, paper,
+                           image_mode == 'color', file_format, seed)
+
+    scan_height, scan_width = scans['scan-size']
+    print("Generated {} scans of {}x{} pixels in {}"\
+          .format(num_scans, scan_width, scan_height, scans['source-dir']))
+    print("")
+    print("Cut out the pages with:")
+    print("")
+    print("  bookblock --source-dir {} --source-file-format {} --geometry {} --pages 0-{}lr"\
+          .format(scans['source-dir'], scans['source-file-format'],
+                  scans['geometry'], num_scans - 1))
+    print("")
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -10,8 +10,6 @@ __copyright__   = "Copyright 2019 Dietrich Bollmann"
 __license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
 __date__        = "2019/10/11"
 
-__version__     = '0.0.1.dev1'
-
 from newskylabs.tools.bookblock.scripts.bookblock import bookblock
 
 ## =========================================================
@@ -0,0 +1,332 @@
+"""newskylabs/tools/bookblock/gui/latency.py:
+
+Input-to-photon latency of the bookblock GUI.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from collections import deque
+from time import perf_counter
+
+from kivy.logger import Logger
+from kivy.core.window import Window
+from kivy.uix.label import Label
+from kivy.graphics import Color, Rectangle
+
+from newskylabs.tools.bookblock.logic.runstats import get_run_stats
+
+## =========================================================
+## class LatencyTracker
+## ---------------------------------------------------------
+
+# Number of latencies kept per view mode and cache hit / miss
+g_latency_window = 200
+
+# Log a summary after this many measurements
+g_latency_log_interval = 20
+
+# Upper bounds of the histogram buckets in milliseconds
+g_latency_buckets = (50, 100, 200, 500, 1000, 2000)
+
+class LatencyTracker:
+    """
+    Measures the time from an input event (Next Image, Previous
+    Image, a navigation key, a jump or toggling the view mode) until
+    the frame showing the resulting page has been drawn - that is
+    until the window is flipped after OpenCVImage.set_image().
+
+    While a page is being loaded a new input event replaces the
+    measurement: the latency of a burst of events is measured from
+    the last event - the one the user waits for.
+
+    The latencies are kept in rolling windows per view mode and
+    cache hit / miss (was the scan of the page already decoded when
+    it was requested?).  They are shown in the debug overlay (see
+    LatencyOverlay), logged to the session log and added to the run
+    report.
+
+    Each measurement is split into:
+
+      - settle:  waiting for the end of a burst of navigation events
+      - load:    loading the page in the loader thread
+      - display: set_image() - converting and uploading the texture
+      - frame:   waiting for the frame showing the new texture
+    """
+
+    def __init__(self, window=g_latency_window, log_interval=g_latency_log_interval):
+        self._window = window
+        self._log_interval = log_interval
+
+        # The pending measurement - a dictionary of timestamps
+        self._pending = None
+
+        # Measurement waiting for the next frame
+        self._waiting_for_frame = None
+
+        # (view mode, 'hit' / 'miss') -> latencies in seconds
+        self._latencies = {}
+
+        # Breakdown of the last measurement
+        self._last = None
+
+        self._num_measurements = 0
+        self._listeners = []
+
+        Window.bind(on_flip=self.on_flip)
+
+    def bind(self, listener):
+        """
+        Call LISTENER(tracker) after each measurement.
+        """
+        self._listeners.append(listener)
+
+    def start(self, action):
+        """
+        An input event ACTION has happened.
+        """
+
+        self._pending = {
+            'action': action,
+            'input':  perf_counter(),
+        }
+
+    def loading(self, generation, view_mode, cache_hit):
+        """
+        The page of navigation GENERATION is requested.
+        """
+
+        pending = self._pending
+        if pending is None or 'load' in pending:
+            return
+
+        pending['generation'] = generation
+        pending['view-mode'] = view_mode
+        pending['cache'] = 'hit' if cache_hit else 'miss'
+        pending['load'] = perf_counter()
+
+    def loaded(self, generation):
+        """
+        The page of GENERATION has been loaded
+        and is about to be shown.
+        """
+
+        pending = self._pending
+        if pending is not None and pending.get('generation') == generation:
+            pending['loaded'] = perf_counter()
+
+    def shown(self, generation):
+        """
+        The page of GENERATION has been passed to set_image() -
+        the measurement ends with the next frame.
+        """
+
+        pending = self._pending
+        if pending is None or pending.get('generation') != generation \
+           or 'loaded' not in pending:
+            return
+
+        pending['shown'] = perf_counter()
+        self._waiting_for_frame = pending
+        self._pending = None
+
+    def cancel(self, generation):
+        """
+        The page of GENERATION could not be loaded.
+        """
+
+        pending = self._pending
+        if pending is not None and pending.get('generation') == generation:
+            self._pending = None
+
+    def on_flip(self, window):
+
+        measurement = self._waiting_for_frame
+        if measurement is None:
+            return
+
+        self._waiting_for_frame = None
+        measurement['frame'] = perf_counter()
+        self.add(measurement)
+
+    def add(self, measurement):
+        """
+        Add a completed MEASUREMENT.
+        """
+
+        latency = measurement['frame'] - measurement['input']
+        key = (measurement['view-mode'], measurement['cache'])
+
+        latencies = self._latencies.get(key)
+        if latencies is None:
+            latencies = self._latencies[key] = deque(maxlen=self._window)
+        latencies.append(latency)
+
+        self._last = {
+            'action':  measurement['action'],
+            'key':     key,
+            'total':   latency,
+            'settle':  measurement['load']   - measurement['input'],
+            'load':    measurement['loaded'] - measurement['load'],
+            'display': measurement['shown']  - measurement['loaded'],
+            'frame':   measurement['frame']  - measurement['shown'],
+        }
+
+        # Add the latency to the run report as well
+        get_run_stats().add('latency-{}-{}'.format(*key), latency)
+
+        Logger.debug("LatencyTracker: {action} ({key[0]} mode, cache {key[1]}): "
+                     "{total:.3f}s = settle {settle:.3f}s + load {load:.3f}s + "
+                     "display {display:.3f}s + frame {frame:.3f}s"\
+                     .format(**self._last))
+
+        self._num_measurements += 1
+        if self._num_measurements % self._log_interval == 0:
+            self.log_summary()
+
+        for listener in self._listeners:
+            listener(self)
+
+    def has_measurements(self):
+        return bool(self._latencies)
+
+    def get_summary(self):
+        """
+        Return the latency statistics of the rolling windows:
+        a list of (view mode, cache, count, p50, p95, max, histogram)
+        with the latencies in milliseconds and the histogram as list
+        of counts per bucket of g_latency_buckets plus one for the
+        larger latencies.
+        """
+
+        summary = []
+        for key in sorted(self._latencies):
+            latencies = sorted(1000.0 * latency for latency in self._latencies[key])
+            histogram = [0] * (len(g_latency_buckets) + 1)
+            for latency in latencies:
+                bucket = 0
+                while bucket < len(g_latency_buckets) and latency >= g_latency_buckets[bucket]:
+                    bucket += 1
+                histogram[bucket] += 1
+
+            view_mode, cache = key
+            summary.append((view_mode, cache, len(latencies),
+                            get_percentile(latencies, 50),
+                            get_percentile(latencies, 95),
+                            latencies[-1],
+                            histogram))
+
+        return summary
+
+    def format_summary(self):
+        """
+        Return the latency statistics as text.
+        """
+
+        bounds = ['<{}'.format(bound) for bound in g_latency_buckets] + \
+            ['>={}'.format(g_latency_buckets[-1])]
+
+        lines = ["Input-to-photon latency (ms), last {}:".format(self._window),
+                 "mode  cache     n    p50    p95    max  | " + \
+                 ' '.join('{:>5}'.format(bound) for bound in bounds)]
+        for view_mode, cache, count, p50, p95, maximum, histogram in self.get_summary():
+            lines.append("{:5} {:5} {:5} {:6.0f} {:6.0f} {:6.0f}  | {}"\
+                         .format(view_mode, cache, count, p50, p95, maximum,
+                                 ' '.join('{:>5}'.format(n) for n in histogram)))
+
+        last = self._last
+        if last is not None:
+            lines.append("last: {action} {total_ms:.0f} ms = settle {settle_ms:.0f} + "
+                         "load {load_ms:.0f} + display {display_ms:.0f} + frame {frame_ms:.0f}"\
+                         .format(action=last['action'],
+                                 **{name + '_ms': 1000.0 * last[name]
+                                    for name in ('total', 'settle', 'load', 'display', 'frame')}))
+
+        return '\n'.join(lines)
+
+    def log_summary(self):
+        if not self.has_measurements():
+            return
+
+        for line in self.format_summary().split('\n'):
+            Logger.info("LatencyTracker: {}".format(line))
+
+def get_percentile(values, percentile):
+    """
+    Return the PERCENTILE (0 - 100) of the sorted list VALUES.
+    """
+
+    index = min(len(values) - 1, int(percentile / 100.0 * len(values)))
+    return values[index]
+
+## =========================================================
+## class LatencyOverlay
+## ---------------------------------------------------------
+
+class LatencyOverlay(Label):
+    """
+    On-screen debug overlay showing the latency statistics
+    of a LatencyTracker in the upper left corner of the window.
+    """
+
+    def __init__(self, tracker, **kwargs):
+        kwargs.setdefault('font_name', 'RobotoMono-Regular')
+        kwargs.setdefault('font_size', '12sp')
+        kwargs.setdefault('color', (1, 1, 1, 1))
+        kwargs.setdefault('halign', 'left')
+        kwargs.setdefault('valign', 'top')
+        kwargs.setdefault('size_hint', (None, None))
+        kwargs.setdefault('padding', (8, 8))
+        super(LatencyOverlay, self).__init__(**kwargs)
+
+        self._tracker = tracker
+        tracker.bind(self.on_measurement)
+
+        # Semi-transparent background
+        with self.canvas.before:
+            Color(0, 0, 0, 0.7)
+            self._background = Rectangle(pos=self.pos, size=self.size)
+
+        self.bind(texture_size=self.update_layout)
+        Window.bind(size=self.update_layout)
+
+        self.update_text()
+
+    def is_shown(self):
+        return self.parent is not None
+
+    def toggle(self):
+        """
+        Show or hide the overlay.
+        """
+
+        if self.is_shown():
+            Window.remove_widget(self)
+        else:
+            self.update_text()
+            Window.add_widget(self)
+
+    def on_measurement(self, tracker):
+        if self.is_shown():
+            self.update_text()
+
+    def update_text(self):
+        text = self._tracker.format_summary()
+        if not self._tracker.has_measurements():
+            text += "\n(no page shown yet)"
+        self.text = text
+
+    def update_layout(self, *args):
+        self.size = self.texture_size
+        self.pos = (0, Window.height - self.height)
+        self._background.pos = self.pos
+        self._background.size = self.size
+
+## =========================================================
+## =========================================================
+
+## fin.
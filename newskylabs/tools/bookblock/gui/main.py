@@ -15,10 +15,11 @@ __date__        = "2019/10/14"
 ## ---------------------------------------------------------
 
 # General Python libs
-import sys, os
+import sys, os, logging
 from pathlib import Path, PosixPath
 from os.path import dirname
 from time import strftime
+from concurrent.futures import ThreadPoolExecutor
 
 # Numpy
 import numpy as np
@@ -30,14 +31,70 @@ kivy.require('1.11.1')
 from kivy.app import App
 from kivy.logger import Logger, LOG_LEVELS, FileHandler
 from kivy.config import Config
+from kivy.clock import Clock
+from kivy.core.window import Window
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.label import Label
+from kivy.uix.textinput import TextInput
 
 from newskylabs.tools.bookblock.utils.settings import Settings
+from newskylabs.tools.bookblock.utils.logger import use_handlers
+from newskylabs.tools.bookblock.utils.config import get_geometry_section
 from newskylabs.tools.bookblock.logic.bookblock import BookBlock
+from newskylabs.tools.bookblock.logic.page import parse_geometry, format_geometry
+from newskylabs.tools.bookblock.logic.profiler import get_profiler, profiled
 from newskylabs.tools.bookblock.kivy.opencvimage import OpenCVImage
+from newskylabs.tools.bookblock.gui.navigation import NavigationScheduler
+from newskylabs.tools.bookblock.gui.latency import LatencyTracker, LatencyOverlay
+
+## =========================================================
+## Keyboard navigation
+## ---------------------------------------------------------
+
+# Key codes => number of pages to move
+g_navigation_keys = {
+    275:  1,       # right
+    274:  1,       # down
+    281:  1,       # page down
+    32:   1,       # space
+    276: -1,       # left
+    273: -1,       # up
+    280: -1,       # page up
+    8:   -1,       # backspace
+    278: -(2**31), # home
+    279:   2**31,  # end
+}
+
+## =========================================================
+## Geometry editing
+## ---------------------------------------------------------
+
+# Key codes => direction in which to move / resize the bounding box
+#   shift + arrow key = move the bounding box
+#   ctrl  + arrow key = resize the bounding box
+#   with alt the bounding box is moved / resized faster
+g_geometry_keys = {
+    275: ( 1,  0), # right
+    276: (-1,  0), # left
+    274: ( 0,  1), # down
+    273: ( 0, -1), # up
+}
+
+# Number of (full resolution) pixels to move / resize the bounding box
+g_geometry_step      = 1
+g_geometry_fast_step = 10
+
+# Key code of ctrl + s = save the geometry
+g_save_geometry_key = 115
+
+## =========================================================
+## Latency overlay
+## ---------------------------------------------------------
+
+# Key code of F3 = show / hide the latency overlay
+g_latency_overlay_key = 284
 
 ## =========================================================
 ## GUI / App
@@ -47,11 +104,17 @@ class BookBlockApp(App):
 
     def __init__(self, settings):
         self._settings = settings
+        super(BookBlockApp, self).__init__()
+
+        # Keep the decoded scans across sessions 
+        # in a persistent cache in the config dir
+        if settings.get_disk_cache_dir() is None:
+            config_dir = self.get_create_config_dir()
+            settings.set_disk_cache_dir('{}/cache'.format(config_dir))
 
         # Book block image server
         bookblock = BookBlock(settings)
         self._image_server = bookblock
-        return super(BookBlockApp, self).__init__()
         
     def get_create_config_dir(self):
         """
@@ -171,6 +234,10 @@ class BookBlockApp(App):
         # Set log level
         Logger.setLevel(log_level_code)
 
+        # Log the messages of the logic layer via Kivy's handlers as well
+        # (Kivy installs its console and file handlers at the root logger)
+        use_handlers(logging.root.handlers, log_level_code)
+
         # En- / Disable logger
         Logger.logfile_activated = bool(log_enable)
 
@@ -229,6 +296,15 @@ class BookBlockApp(App):
         Config.set('graphics', 'width',  config.getint('gui', 'width'))
         Config.set('graphics', 'height', config.getint('gui', 'height'))
 
+        # Scans are previewed at a reduced resolution
+        # matching the size of the image viewer
+        # - start with the size of the window
+        self._settings.set_preview_size((config.getint('gui', 'width'),
+                                         config.getint('gui', 'height')))
+
+        # Keyboard navigation
+        Window.bind(on_key_down=self.on_key_down)
+
         # Build the GUI
         return self.build_GUI()
 
@@ -244,23 +320,41 @@ class BookBlockApp(App):
         #   |       Image       |  
         #   |                   |  
         #   |                   |  
-        #   +---+---+---+---+---+
-        #   | < | > | m | a | c |
-        #   +---+---+---+---+---+
+        #   +-------------------+
+        #   |      Status       |  
+        #   +---+---+---+---+---+---+---+---+
+        #   | < | > | j | g | m | s | a | c |
+        #   +---+---+---+---+---+---+---+---+
         # 
+        #   Status = the current page, a loading message 
+        #            or the geometry while it is edited
         #   < = previous image
         #   > = previous image
+        #   j = jump target: page number (730),
+        #       scan and side (12l, 12r, s12) or fraction (50%)
+        #   g = go: jump to the target
         #   m = mode: toggle view mode:
         #     - scan with bounding box
+        #       (drag the bounding box to move it, 
+        #        drag its edges to resize it)
         #     - resulting page
+        #   s = save the geometry of the source directory
+        #       to ~/.bookblock/config.ini
         #   a = apply
         #   c = cancel and exit
         # 
+        #   F3 shows / hides the input-to-photon latency overlay
+        # 
         # --------------------------------------
         
         # Image Viewer
         image_viewer_layout = self.build_image_viewer()
-        image_viewer_layout.size_hint = (1.0, 0.9)
+        image_viewer_layout.size_hint = (1.0, 0.85)
+
+        # Status Bar
+        status_label = Label(text='')
+        status_label.size_hint = (1.0, 0.05)
+        self._status_label = status_label
 
         # Buttons
         button_layout = self.build_buttons()
@@ -269,9 +363,29 @@ class BookBlockApp(App):
         # Assemble the GUI
         gui_layout = BoxLayout(orientation='vertical', size=(800, 200), padding=4, spacing=4)
         gui_layout.add_widget(image_viewer_layout)
+        gui_layout.add_widget(status_label)
         gui_layout.add_widget(button_layout)
 
-        # Load the first image
+        # Coalesce bursts of navigation events
+        self._navigation = NavigationScheduler(self)
+
+        # Measure the time from an input event 
+        # until the resulting page is on the screen
+        self._latency = LatencyTracker()
+        self._latency_overlay = LatencyOverlay(self._latency)
+
+        # Pages are decoded by a worker thread
+        # to keep the GUI responsive
+        self._loader = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix='bookblock-loader')
+        self._pending_load = None
+
+        # The page and scan size of the shown image
+        self._shown_page_spec = None
+        self._shown_scan_size = None
+
+        # Start loading the first image -
+        # the window opens without waiting for it
         self._image_server.reset()
         self.redraw_image()
 
@@ -283,6 +397,8 @@ class BookBlockApp(App):
         # Using OpenCVImage
         # which allows to show OpenCV images in a Kivy GUI
         image = OpenCVImage()
+        image.bind(size=self.on_image_viewer_size)
+        image.bind(on_bounding_box=self.on_bounding_box_edited)
 
         # Assemble Image Viewer layout
         image_viewer_layout = BoxLayout(orientation='horizontal', padding=0, spacing=0)
@@ -292,6 +408,13 @@ class BookBlockApp(App):
         # Return the image viewer layout
         return image_viewer_layout
 
+    def on_image_viewer_size(self, instance, size):
+
+        # Adapt the resolution of the scan previews
+        # to the size of the image viewer
+        width, height = size
+        self._settings.set_preview_size((int(width), int(height)))
+
     def build_buttons(self):
 
         # Previous Image Button
@@ -304,10 +427,24 @@ class BookBlockApp(App):
         next_button.bind(on_press=self.next_image)
         self._next_button = next_button
 
+        # Jump Target Input
+        jump_input = TextInput(multiline=False,
+                               hint_text='page / scan+side / %')
+        jump_input.bind(on_text_validate=self.jump_to_page)
+        self._jump_input = jump_input
+
+        # Go Button
+        go_button = Button(text='Go')
+        go_button.bind(on_press=self.jump_to_page)
+
         # Toggle View Mode Button
         toogle_view_mode_button = ToggleButton(text='Scan Mode')
         toogle_view_mode_button.bind(on_press=self.toggle_view_mode)
 
+        # Save Geometry Button
+        save_geometry_button = Button(text='Save Geometry')
+        save_geometry_button.bind(on_press=self.save_geometry)
+
         # Apply Button
         apply_button = Button(text='Apply')
         apply_button.bind(on_press=self.apply)
@@ -320,7 +457,10 @@ class BookBlockApp(App):
         button_layout = BoxLayout(orientation='horizontal', padding=0, spacing=1)
         button_layout.add_widget(previous_button)
         button_layout.add_widget(next_button)
+        button_layout.add_widget(jump_input)
+        button_layout.add_widget(go_button)
         button_layout.add_widget(toogle_view_mode_button)
+        button_layout.add_widget(save_geometry_button)
         button_layout.add_widget(apply_button)
         button_layout.add_widget(exit_button)
 
@@ -328,16 +468,84 @@ class BookBlockApp(App):
         return button_layout
 
     def redraw_image(self):
-        img_path = self._image_server.get_current_page()
-
-        # Do nothing - when the current page has not been found
-        if not isinstance(img_path, (str, np.ndarray)):
-            return None
-        
         self.update_button_states()
-        self._image_viewer.set_image(img_path)
+        self.load_current_page(self._navigation.get_generation())
+
+    @profiled('navigation')
+    def load_current_page(self, generation):
+        """
+        Decode the current page in the loader thread.
+        The page is shown when it is ready -
+        unless the navigation has moved on in the meantime.
+        """
+
+        self._image_server.print_current_page()
+        page_spec = self._image_server.get_current_page_spec()
+        self._image_server.prefetch()
+
+        # A page still waiting to be loaded is not needed any more
+        if self._pending_load is not None:
+            self._pending_load.cancel()
+
+        self._status_label.text = "Loading page {}  [scan {}, {} side]..."\
+            .format(page_spec['page'], page_spec['scan'], page_spec['side'])
+
+        self._latency.loading(generation, self._settings.get_view_mode(),
+                              self._image_server.is_page_cached(page_spec))
+
+        load_page = get_profiler().wrap('navigation', self._image_server.load_page)
+        future = self._loader.submit(load_page, page_spec)
+        future.add_done_callback(
+            lambda future: Clock.schedule_once(
+                lambda dt: self.on_page_loaded(future, page_spec, generation)))
+        self._pending_load = future
+
+    @profiled('navigation')
+    def on_page_loaded(self, future, page_spec, generation):
+        """
+        Called in the Kivy main thread 
+        when the loader thread has decoded a page.
+        """
+
+        if future.cancelled():
+            return
+
+        # Superseded by a newer navigation event?
+        if not self._navigation.is_current(generation):
+            Logger.debug('BookBlockApp: Ignoring superseded page')
+            return
+
+        # Superseded by a newer load of the same generation?
+        if future is not self._pending_load:
+            return
+        self._pending_load = None
+
+        try:
+            image, scan_size = future.result()
+        except (Exception, SystemExit) as error:
+            Logger.error("BookBlockApp: Failed to load page {}: {}: {}"\
+                         .format(page_spec['page'], type(error).__name__, error))
+            self._status_label.text = "Failed to load page {}".format(page_spec['page'])
+            self._latency.cancel(generation)
+            return
+
+        self._latency.loaded(generation)
+
+        self._status_label.text = "Page {}  [scan {}, {} side]"\
+            .format(page_spec['page'], page_spec['scan'], page_spec['side'])
+        self.show_image(image, page_spec, scan_size)
 
-    def show_image(self, image):
+        # The latency is measured up to the next frame
+        self._latency.shown(generation)
+
+    def show_image(self, image, page_spec=None, scan_size=None):
+        """
+        Show IMAGE.  
+
+        In scan view mode SCAN_SIZE is the full resolution size of
+        the scan and the bounding box of PAGE_SPEC is shown as an
+        overlay.
+        """
 
         # When no file has been found do nothing
         if not isinstance(image, (str, np.ndarray)):
@@ -345,6 +553,25 @@ class BookBlockApp(App):
 
         self._image_viewer.set_image(image)
 
+        self._shown_page_spec = page_spec
+        self._shown_scan_size = scan_size
+        self.update_bounding_box()
+
+    def update_bounding_box(self):
+        """
+        Update the bounding box overlay of the shown scan -
+        without touching the image.
+        """
+
+        page_spec = self._shown_page_spec
+        scan_size = self._shown_scan_size
+        if page_spec is None or scan_size is None:
+            self._image_viewer.set_bounding_box(None)
+            return
+
+        bounding_box = self._image_server.get_bounding_box(page_spec, scan_size)
+        self._image_viewer.set_bounding_box(bounding_box, scan_size)
+
     def update_button_states(self):
 
         first_image = self._image_server.is_first_page()
@@ -369,17 +596,176 @@ class BookBlockApp(App):
 
     def previous_image(self, instance):
         Logger.debug('BookBlockApp: The button <%s> has been pressed' % instance.text)
-
-        img_file = self._image_server.get_previous_page()
-        self.show_image(img_file)
-        self.update_button_states()
+        self._latency.start('previous')
+        self.move(-1)
 
     def next_image(self, instance):
         Logger.debug('BookBlockApp: The button <%s> has been pressed' % instance.text)
+        self._latency.start('next')
+        self.move(1)
 
-        img_file = self._image_server.get_next_page()
-        self.show_image(img_file)
-        self.update_button_states()
+    def move(self, delta):
+        """
+        Move the current page by DELTA pages.
+        Bursts of moves are coalesced by the navigation scheduler.
+        """
+        self._navigation.navigate(lambda: self._image_server.move(delta))
+
+    def render_current_page(self, generation):
+        """
+        Render the current page -
+        unless the navigation has moved on in the meantime.
+        """
+
+        self.load_current_page(generation)
+
+    @profiled('navigation')
+    def show_preview(self):
+        """
+        Show a preview of the current page 
+        when its scan has already been decoded.
+        """
+
+        preview, scan_size = self._image_server.get_current_preview()
+        if preview is not None:
+            page_spec = self._image_server.get_current_page_spec()
+            self.show_image(preview, page_spec, scan_size)
+
+    def on_key_down(self, window, key, scancode, codepoint, modifiers):
+
+        # Keys typed into the jump target input are not for navigation
+        if self._jump_input.focus:
+            return False
+
+        # Show / hide the latency overlay
+        if key == g_latency_overlay_key:
+            self._latency_overlay.toggle()
+            return True
+
+        # Save the geometry
+        if key == g_save_geometry_key and 'ctrl' in modifiers:
+            self.save_geometry()
+            return True
+
+        # Move / resize the bounding box
+        if 'shift' in modifiers or 'ctrl' in modifiers:
+            direction = g_geometry_keys.get(key)
+            if direction is None:
+                return False
+
+            step = g_geometry_fast_step if 'alt' in modifiers else g_geometry_step
+            dx, dy = direction
+            self.nudge_geometry(dx * step, dy * step, resize='ctrl' in modifiers)
+            return True
+
+        delta = g_navigation_keys.get(key)
+        if delta is None:
+            return False
+
+        self._latency.start('key')
+        self.move(delta)
+        return True
+
+    def jump_to_page(self, instance):
+        target = self._jump_input.text
+        Logger.debug('BookBlockApp: Jumping to page <%s>' % target)
+
+        if self._image_server.seek_target(target) is None:
+            print("Page not found: '{}'".format(target))
+            return
+
+        # Render the target page right away
+        self._latency.start('jump')
+        self._navigation.navigate(lambda: None, settle=False)
+
+    def nudge_geometry(self, dx, dy, resize=False):
+        """
+        Move the bounding box by DX, DY pixels -
+        or resize it when RESIZE is True.
+        """
+
+        width, height, offset_left, offset_top = \
+            parse_geometry(self._image_server.get_geometry())
+
+        if resize:
+            width  = max(1, width  + dx)
+            height = max(1, height + dy)
+        else:
+            offset_left = max(0, offset_left + dx)
+            offset_top  = max(0, offset_top  + dy)
+
+        self.change_geometry(format_geometry(width, height, offset_left, offset_top))
+
+    def on_bounding_box_edited(self, instance, bounding_box):
+        """
+        The bounding box has been dragged in the image viewer.
+        """
+
+        page_spec = self._shown_page_spec
+        scan_size = self._shown_scan_size
+        if page_spec is None or scan_size is None:
+            return
+
+        geometry = self._image_server\
+            .get_geometry_of_bounding_box(page_spec, bounding_box, scan_size)
+        self.change_geometry(geometry)
+
+    def change_geometry(self, geometry):
+        """
+        Change the geometry and update the shown image
+        from the already decoded scan.
+        """
+
+        if geometry == self._image_server.get_geometry():
+            return
+
+        self._image_server.set_geometry(geometry)
+        self._status_label.text = "Geometry: {}".format(geometry)
+
+        # A page which is still being loaded 
+        # is cut out with the old geometry - load it again
+        if self._pending_load is not None:
+            self.redraw_image()
+            return
+
+        view_mode = self._settings.get_view_mode()
+        if view_mode == 'scan':
+            # Only the overlay has to be updated
+            self.update_bounding_box()
+
+        elif view_mode == 'page':
+            # Cut out the page again from the cached scan
+            preview, scan_size = self._image_server.get_current_preview()
+            if preview is not None:
+                page_spec = self._image_server.get_current_page_spec()
+                self.show_image(preview, page_spec, scan_size)
+            else:
+                self.redraw_image()
+
+    def save_geometry(self, instance=None):
+        """
+        Save the geometry of the scans in the source directory 
+        to ~/.bookblock/config.ini.
+
+        The saved geometry is used by default 
+        when bookblock is started again on the same source directory
+        without a --geometry option (see load_saved_geometry()).
+        """
+
+        geometry = self._image_server.get_geometry()
+        source_dir = self._settings.get_source_dir()
+        section = get_geometry_section(source_dir)
+
+        config = self.config
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, 'geometry', geometry)
+        config.write()
+
+        print("Saved geometry {} of {} to {}"\
+              .format(geometry, source_dir, self.get_application_config()))
+        print("It is used for {} when no --geometry is given.".format(source_dir))
+        self._status_label.text = "Saved geometry: {}".format(geometry)
 
     def toggle_view_mode(self, instance):
         
@@ -401,8 +787,26 @@ class BookBlockApp(App):
 
         # Redraw the image
         # in the current view mode
+        self._latency.start('view-mode')
         self.redraw_image()
 
+    def on_stop(self):
+
+        # Stop loading pages
+        self._loader.shutdown(wait=False)
+
+        # Stop prefetching
+        self._image_server.shutdown()
+
+        # Log the scan cache hits and misses of the session
+        self._image_server.log_cache_stats()
+
+        # Log the input-to-photon latencies of the session
+        self._latency.log_summary()
+
+        # Report the time spent in each stage
+        self._image_server.write_run_report('gui')
+
     def apply(self, instance):
         Logger.debug('BookBlockApp: The button <%s> has been pressed' % instance.text)
 
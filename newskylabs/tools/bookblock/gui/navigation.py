@@ -0,0 +1,107 @@
+"""newskylabs/tools/bookblock/gui/navigation.py:
+
+Navigation scheduler of the bookblock GUI.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from time import monotonic
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+## =========================================================
+## class NavigationScheduler
+## ---------------------------------------------------------
+
+class NavigationScheduler:
+    """
+    Coalesce bursts of navigation events into a single target page.
+
+    Each navigation event (a click on Next / Previous, a pressed or
+    held arrow key...) only moves the current page - which is cheap.
+    The current page is rendered when no further navigation event has
+    arrived for SETTLE_DELAY seconds, so only the page the user
+    finally lands on is decoded.
+
+    Every navigation event starts a new generation.  Renderings of
+    older generations have been superseded and are ignored.
+
+    During a burst of events a low resolution preview made from
+    already decoded scans is shown at most every PREVIEW_INTERVAL
+    seconds.
+    """
+
+    def __init__(self, app, settle_delay=0.1, preview_interval=0.2):
+        self._app = app
+        self._settle_delay = settle_delay
+        self._preview_interval = preview_interval
+
+        # The current generation of navigation events
+        self._generation = 0
+
+        # Time of the last navigation event and the last preview
+        self._last_event_time = None
+        self._last_preview_time = 0.0
+
+        self._render_trigger = Clock.create_trigger(self._render, settle_delay)
+
+    def navigate(self, move, settle=True):
+        """
+        Call MOVE() to move the current page
+        and schedule rendering the new current page.
+
+        When SETTLE is False - for example when jumping to a page -
+        the new current page is rendered right away.
+        """
+
+        move()
+        self._generation += 1
+
+        if not settle:
+            self._last_event_time = None
+            self._app.update_button_states()
+            self._render_trigger.cancel()
+            self._render(0)
+            return
+
+        # Part of a burst of navigation events?
+        now = monotonic()
+        in_burst = self._last_event_time is not None and \
+            now - self._last_event_time < self._settle_delay
+        self._last_event_time = now
+
+        self._app.update_button_states()
+
+        # Show a cheap preview during bursts
+        if in_burst and now - self._last_preview_time >= self._preview_interval:
+            self._last_preview_time = now
+            self._app.show_preview()
+
+        # (Re)start the settle timer
+        self._render_trigger.cancel()
+        self._render_trigger()
+
+    def get_generation(self):
+        return self._generation
+
+    def is_current(self, generation):
+        """
+        Has no navigation event arrived since GENERATION?
+        """
+        return generation == self._generation
+
+    def _render(self, dt):
+        generation = self._generation
+        Logger.debug("NavigationScheduler: Rendering generation {}".format(generation))
+        self._app.render_current_page(generation)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -17,8 +17,61 @@ import numpy as np
 import cv2
 
 from kivy.uix.image import Image
+from kivy.graphics import Color, Line
 from kivy.graphics.texture import Texture
 
+from newskylabs.tools.bookblock.logic.runstats import get_run_stats
+
+## =========================================================
+## get_texture_buffer(image, staging=None)
+## ---------------------------------------------------------
+
+def get_texture_buffer(image, staging=None):
+    """
+    Return the buffer, size and Kivy color format
+    for uploading the OpenCV image IMAGE into a Kivy texture.
+
+    Color images are uploaded as BGR textures, grayscale images as
+    luminance textures - without converting them to color first.
+    The buffer is the image array itself when it is contiguous
+    already; otherwise (for example for a page which is a view of a
+    scan) only the image region is copied into a contiguous array.
+
+    Kivy only accepts writable buffers.  Read-only images (like the
+    cached scans) are copied into the STAGING array - when it has the
+    right shape and type - to avoid allocating a new array for every
+    image.
+    """
+
+    # Color or Grayscale image?
+    # cv2.IMREAD_GRAYSCALE => ex shape = (600, 800)    => len(shape) = 2
+    # cv2.IMREAD_COLOR     => ex shape = (600, 800, 3) => len(shape) = 3
+    if len(image.shape) == 2:
+        colorfmt = 'luminance'
+    else:
+        # OpenCV uses BGR color format: BGR was more popular among camera
+        # manufacturers then RGB when OpenCV was created...
+        colorfmt = 'bgr'
+
+    # Get size of image
+    height, width = image.shape[:2]
+
+    # Ensure a contiguous buffer
+    # and pass it as one dimensional array
+    # (reshaping a contiguous array does not copy the data)
+    buffer = np.ascontiguousarray(image).reshape(-1)
+
+    # Ensure a writable buffer
+    if not buffer.flags.writeable:
+        if staging is None or \
+           staging.shape != buffer.shape or \
+           staging.dtype != buffer.dtype:
+            staging = np.empty_like(buffer)
+        np.copyto(staging, buffer)
+        buffer = staging
+
+    return buffer, (width, height), colorfmt
+
 ## =========================================================
 ## class OpenCVImage()
 ## 
@@ -28,13 +81,58 @@ from kivy.graphics.texture import Texture
 class OpenCVImage(Image):
     """
     A kivy widget to display OpenCV images.
+
+    The texture is reused as long as the size and the color format of
+    the images do not change.  The image data is uploaded directly
+    from the image buffer; the different vertical orientation of
+    OpenCV images (top-left origin) and textures (bottom-left origin)
+    is handled by flipping the texture coordinates instead of the
+    pixels.  Setting the same image array again does not upload it
+    again.
+
+    A bounding box can be shown as an overlay on top of the image.
+    It is drawn by a canvas instruction - the image data is never
+    touched - so moving the bounding box is cheap.  The bounding box
+    can be moved and resized by dragging it; each change dispatches
+    an on_bounding_box event.
     """
 
+    __events__ = ('on_bounding_box',)
+
+    _image    = None
+    _staging  = None
+    _cbuffer  = None
+    _colorfmt = None
+    _texture  = None
+
+    # Bounding box overlay:
+    # ((x1, y1), (x2, y2)) in the coordinates of an image of size
+    # (height, width) = _bounding_box_image_size
+    _bounding_box = None
+    _bounding_box_image_size = None
+
+    # Bounding box settings
+    bb_color      = (0.0, 0.0, 0.0, 1.0) # Black
+    bb_line_width = 1.5
+
+    # Distance in pixels from the edges of the bounding box
+    # within which dragging resizes the bounding box
+    bb_grab_margin = 8
+
+    def __init__(self, **kwargs):
+        super(OpenCVImage, self).__init__(**kwargs)
+
+        # Keep the overlay in place 
+        # when the widget is moved or resized
+        self.bind(pos=self.update_overlay,
+                  size=self.update_overlay,
+                  norm_image_size=self.update_overlay)
+
     def populate_texture(self, texture):
         """
         Blit the image buffer.
         """
-        texture.blit_buffer(self._cbuffer, colorfmt='bgr', bufferfmt='ubyte')
+        texture.blit_buffer(self._cbuffer, colorfmt=self._colorfmt, bufferfmt='ubyte')
 
     def set_image(self, image, image_mode=None):
         """
@@ -73,51 +171,241 @@ class OpenCVImage(Image):
                             "are allowed as parameter of set_image()!"\
                             .format(type(image))
             )
-                        
-        # Kivy only has colore textures:
-        # Convert Grayscale images to color
-        # and leave Color images as they are
-        # Color or Grayscale image?
-        # cv2.IMREAD_GRAYSCALE => ex shape = (600, 800)    => len(shape) = 2
-        # cv2.IMREAD_COLOR     => ex shape = (600, 800, 3) => len(shape) = 3
-        if len(image.shape) == 2:
-            # Convert Grayscale image to RGB
-            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
-
-        # Get size of image
-        width, height = image.shape[:2]
-
-        # Flip image vertically
-        # (Switch between top-left and bottom-left image origin)
-        image = cv2.flip(image, 0)
-
-        # Flatten the image array 
-        # into a one dimensional array
-        image = image.flatten()
-        
-        # Convert the image array to Python bytes 
-        # containing the raw data bytes in the array
-        image = image.tostring()
+
+        # The image is shown already.
+        # Cached scans are read-only, 
+        # so the same array always has the same content
+        if image is self._image:
+            return
+        self._image = image
+
+        # Get a contiguous buffer of the image data
+        run_stats = get_run_stats()
+        with run_stats.time('convert'):
+            buffer, size, colorfmt = get_texture_buffer(image, self._staging)
+
+        # Buffers copied from the image are owned by the widget
+        # and can be reused for staging the following images
+        if not np.may_share_memory(buffer, image):
+            self._staging = buffer
 
         # Store a handle to the image buffer 
         # to make it accessible from the redraw handler
-        self._cbuffer = image
+        self._cbuffer  = buffer
+        self._colorfmt = colorfmt
+
+        # Reuse the texture 
+        # when the size and color format have not changed
+        texture = self._texture
+        if texture is None or \
+           tuple(texture.size) != size or \
+           texture.colorfmt != colorfmt:
+
+            # Create a texture of the given size and color format
+            texture = Texture.create(size=size, colorfmt=colorfmt, bufferfmt='ubyte')
 
-        # Create a BGR texture of the given height
-        # (OpenCV uses BGR color format: BGR was more popular among camera
-        # manufacturers then RGB when OpenCV was created...)
-        texture = Texture.create(size=(height, width), colorfmt='bgr', bufferfmt='ubyte')
-        
-        # Add a handler to reload the texture 
-        # when the image widget has been resized
-        texture.add_reload_observer(self.populate_texture)
+            # Flip the texture coordinates vertically
+            # (Switch between top-left and bottom-left image origin)
+            texture.flip_vertical()
+
+            # Add a handler to reload the texture 
+            # when the image widget has been resized
+            texture.add_reload_observer(self.populate_texture)
+
+            self._texture = texture
 
         # Now blit the texture buffer
-        self.populate_texture(texture)
+        with run_stats.time('upload'):
+            self.populate_texture(texture)
+        run_stats.count('textures-uploaded')
 
         # Display the texture
         # in the image widget
-        self.texture = texture
+        if self.texture is texture:
+            # The texture has been updated in place
+            self.canvas.ask_update()
+        else:
+            self.texture = texture
+
+    def set_bounding_box(self, bounding_box, image_size=None):
+        """
+        Show BOUNDING_BOX = ((x1, y1), (x2, y2)) as an overlay.
+
+        The coordinates of the bounding box refer to an image of
+        IMAGE_SIZE = (height, width) - for example the full resolution
+        scan of which the shown image is a reduced preview.
+        When no IMAGE_SIZE is given the size of the shown image is used.
+
+        When BOUNDING_BOX is None the overlay is removed.
+        """
+
+        if image_size is None and self._image is not None:
+            image_size = self._image.shape[:2]
+
+        self._bounding_box = bounding_box
+        self._bounding_box_image_size = image_size
+        self.update_overlay()
+
+    def get_image_transform(self):
+        """
+        Return (x0, top, scale_x, scale_y) mapping the coordinates of
+        the bounding box image to widget coordinates:
+
+          widget x = x0  + x * scale_x
+          widget y = top - y * scale_y
+
+        The image origin is top-left, the widget origin is bottom-left.
+        """
+
+        # Size and position of the image in the widget
+        # (the image is centered and keeps its aspect ratio)
+        image_width, image_height = self.norm_image_size
+        x0 = self.x + (self.width  - image_width)  / 2.0
+        y0 = self.y + (self.height - image_height) / 2.0
+
+        # Scale from image to widget coordinates
+        height, width = self._bounding_box_image_size
+        scale_x = image_width  / float(width)
+        scale_y = image_height / float(height)
+
+        return x0, y0 + image_height, scale_x, scale_y
+
+    def widget_to_image(self, x, y):
+        """
+        Map the widget coordinates X, Y 
+        to the coordinates of the bounding box image.
+        """
+
+        x0, top, scale_x, scale_y = self.get_image_transform()
+        return ((x - x0) / scale_x, (top - y) / scale_y)
+
+    def update_overlay(self, *args):
+        """
+        Redraw the bounding box overlay
+        mapped from image to widget coordinates.
+        """
+
+        self.canvas.after.clear()
+
+        bounding_box = self._bounding_box
+        if bounding_box is None or not self._bounding_box_image_size:
+            return
+
+        x0, top, scale_x, scale_y = self.get_image_transform()
+
+        (x1, y1), (x2, y2) = bounding_box
+        left   = x0  + x1 * scale_x
+        bottom = top - (y2 + 1) * scale_y
+        box_width  = (x2 - x1 + 1) * scale_x
+        box_height = (y2 - y1 + 1) * scale_y
+
+        with self.canvas.after:
+            Color(*self.bb_color)
+            Line(rectangle=(left, bottom, box_width, box_height),
+                 width=self.bb_line_width)
+
+    ## Editing the bounding box
+    ## 
+    ## Dragging inside of the bounding box moves it,
+    ## dragging one of its edges or corners resizes it.
+    ## Each change dispatches an on_bounding_box event.
+
+    def get_grabbed_edges(self, x, y):
+        """
+        Return the edges of the bounding box grabbed 
+        by touching the widget at X, Y:
+
+        - a set of 'left', 'right', 'top' and 'bottom'
+          when touching the edges or corners,
+        - all four edges when touching the inside,
+        - None when touching the outside.
+        """
+
+        x0, top, scale_x, scale_y = self.get_image_transform()
+
+        # The bounding box in widget coordinates
+        (x1, y1), (x2, y2) = self._bounding_box
+        left   = x0  + x1 * scale_x
+        right  = x0  + (x2 + 1) * scale_x
+        upper  = top - y1 * scale_y
+        lower  = top - (y2 + 1) * scale_y
+
+        margin = self.bb_grab_margin
+        if not (left - margin <= x <= right + margin and
+                lower - margin <= y <= upper + margin):
+            return None
+
+        edges = set()
+        if abs(x - left)  <= margin: edges.add('left')
+        if abs(x - right) <= margin: edges.add('right')
+        if abs(y - upper) <= margin: edges.add('top')
+        if abs(y - lower) <= margin: edges.add('bottom')
+
+        if not edges:
+            edges = {'left', 'right', 'top', 'bottom'}
+
+        return edges
+
+    def on_touch_down(self, touch):
+
+        if self._bounding_box is None or \
+           not self._bounding_box_image_size or \
+           not self.collide_point(*touch.pos):
+            return super(OpenCVImage, self).on_touch_down(touch)
+
+        edges = self.get_grabbed_edges(*touch.pos)
+        if edges is None:
+            return super(OpenCVImage, self).on_touch_down(touch)
+
+        touch.grab(self)
+        touch.ud['bounding_box_edit'] = \
+            (edges, self.widget_to_image(*touch.pos), self._bounding_box)
+        return True
+
+    def on_touch_move(self, touch):
+
+        if touch.grab_current is not self:
+            return super(OpenCVImage, self).on_touch_move(touch)
+
+        edges, (start_x, start_y), bounding_box = touch.ud['bounding_box_edit']
+
+        # Distance dragged in image coordinates
+        x, y = self.widget_to_image(*touch.pos)
+        dx = int(round(x - start_x))
+        dy = int(round(y - start_y))
+
+        # Move the grabbed edges
+        (x1, y1), (x2, y2) = bounding_box
+        if 'left'   in edges: x1 += dx
+        if 'right'  in edges: x2 += dx
+        if 'top'    in edges: y1 += dy
+        if 'bottom' in edges: y2 += dy
+
+        # Do not turn the bounding box inside out
+        x2 = max(x1, x2)
+        y2 = max(y1, y2)
+
+        bounding_box = ((x1, y1), (x2, y2))
+        if bounding_box != self._bounding_box:
+            self.set_bounding_box(bounding_box, self._bounding_box_image_size)
+            self.dispatch('on_bounding_box', bounding_box)
+
+        return True
+
+    def on_touch_up(self, touch):
+
+        if touch.grab_current is not self:
+            return super(OpenCVImage, self).on_touch_up(touch)
+
+        touch.ungrab(self)
+        return True
+
+    def on_bounding_box(self, bounding_box):
+        """
+        Default handler of the on_bounding_box event
+        dispatched when the bounding box has been edited.
+        """
+        pass
 
 ## =========================================================
 ## =========================================================
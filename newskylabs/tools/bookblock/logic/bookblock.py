@@ -10,15 +10,28 @@ __copyright__   = "Copyright 2019 Dietrich Bollmann"
 __license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
 __date__        = "2019/10/18"
 
-from kivy.logger import Logger
+import sys
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from newskylabs.tools.bookblock.logic.pages import Pages
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+from newskylabs.tools.bookblock.logic.pages import Pages, parse_page_target
 from newskylabs.tools.bookblock.logic.page import Page
+from newskylabs.tools.bookblock.logic.pipeline import PagePipeline
+from newskylabs.tools.bookblock.logic.prefetcher import Prefetcher
+from newskylabs.tools.bookblock.logic.manifest import Manifest, get_mtime
+from newskylabs.tools.bookblock.logic.preflight import Preflight
+from newskylabs.tools.bookblock.logic.runstats import get_run_stats
+from newskylabs.tools.bookblock.logic.profiler import profiled
    
 ## =========================================================
 ## class BookBlock
 ## ---------------------------------------------------------
 
+# Number of scans submitted per worker process at a time
+g_tasks_per_job = 2
+
 class BookBlock:
     """
     Book Block Cutter class.
@@ -36,51 +49,455 @@ class BookBlock:
         page = Page(settings)
         self._page = page
 
+        # Decode the scans of the neighbouring pages
+        # in the background while the current page is inspected.
+        # The prefetcher is created when navigating the first time -
+        # batch runs do not need it (see prefetch())
+        self._prefetcher = None
+
     def reset(self):
         self._pages.reset()
 
+    def shutdown(self):
+        if self._prefetcher:
+            self._prefetcher.shutdown()
+
+    def prefetch(self):
+
+        if self._prefetcher is None:
+            prefetch_ahead  = self._settings.get_prefetch_ahead()
+            prefetch_behind = self._settings.get_prefetch_behind()
+            if not (prefetch_ahead or prefetch_behind):
+                return
+            self._prefetcher = Prefetcher(self._page, self._pages,
+                                          prefetch_ahead, prefetch_behind)
+
+        self._prefetcher.update()
+
     def get_previous_page(self):
 
         page_spec = self._pages.get_previous_page()
-        Logger.debug("BookBlock: page_spec: {}".format(page_spec))
-        self._pages.print_current_page()
-        page = self._page.get(page_spec)
-        Logger.debug("BookBlock: type(page): {}".format(type(page)))
-        return page
+        return self._get_page(page_spec)
 
     def get_current_page(self):
 
         page_spec = self._pages.get_current_page()
-        Logger.debug("BookBlock: page_spec: {}".format(page_spec))
-        self._pages.print_current_page()
-        page = self._page.get(page_spec)
-        Logger.debug("BookBlock: type(page): {}".format(type(page)))
-        return page
+        return self._get_page(page_spec)
 
     def get_next_page(self):
 
         page_spec = self._pages.get_next_page()
+        return self._get_page(page_spec)
+
+    def move(self, delta):
+        """
+        Move the current page by DELTA pages without decoding it.
+        The neighbours of the new current page are prefetched.
+
+        Return the page spec of the new current page.
+        """
+
+        page_spec = self._pages.move(delta)
+        self.prefetch()
+        return page_spec
+
+    def get_current_page_spec(self):
+        """
+        Return the page spec of the current page without decoding it.
+        """
+
+        return self._pages.get_current_page()
+
+    def print_current_page(self):
+        self._pages.print_current_page()
+
+    def load_page(self, page_spec):
+        """
+        Decode and cut out the page PAGE_SPEC.
+
+        Return the page in the current view mode together with the
+        full resolution size of its scan in scan view mode - or None
+        in the other view modes.  See Page.get_view().
+
+        Does not touch the current page, 
+        so it can be called from a worker thread.
+        """
+
+        page, scan_size = self._page.get_view(page_spec)
+        Logger.debug("BookBlock: type(page): {}".format(type(page)))
+        return page, scan_size
+
+    def is_page_cached(self, page_spec):
+        """
+        Has the scan of PAGE_SPEC already been decoded?
+        """
+        return self._page.is_cached(page_spec)
+
+    def get_bounding_box(self, page_spec, scan_size):
+        """
+        Return the bounding box of PAGE_SPEC 
+        in the full resolution coordinates of a scan of size SCAN_SIZE.
+        """
+
+        return self._page.calculate_bounding_box(page_spec, scan_size)
+
+    def get_geometry(self):
+        return self._settings.get_geometry()
+
+    def set_geometry(self, geometry):
+        """
+        Change the geometry of the pages.
+
+        The decoded scans stay valid, 
+        so the pages can be cut out again without touching the disk.
+        """
+
+        Logger.debug("BookBlock: Geometry: {}".format(geometry))
+        self._settings.set_geometry(geometry)
+
+    def get_geometry_of_bounding_box(self, page_spec, bounding_box, scan_size):
+        """
+        Return the geometry string resulting in BOUNDING_BOX 
+        for PAGE_SPEC and a scan of size SCAN_SIZE.
+        """
+
+        return self._page.calculate_geometry(page_spec, bounding_box, scan_size)
+
+    def get_current_preview(self):
+        """
+        Return a preview of the current page 
+        made from an already decoded scan -
+        or None when the scan has not been decoded yet -
+        together with the size of the scan like load_page().
+        """
+
+        page_spec = self._pages.get_current_page()
+        return self._page.get_cached_preview(page_spec)
+
+    def get_page_by_number(self, page):
+        """
+        Jump to the page with the page number PAGE.
+        """
+
+        page_spec = self._pages.seek_page(page)
+        return self._get_page(page_spec)
+
+    def get_page_by_scan(self, scan, side=None):
+        """
+        Jump to the page on the given SIDE of SCAN.
+        """
+
+        page_spec = self._pages.seek_scan(scan, side)
+        return self._get_page(page_spec)
+
+    def get_page_by_fraction(self, fraction):
+        """
+        Jump to the page at FRACTION (0.0 - 1.0) of the book.
+        """
+
+        page_spec = self._pages.seek_fraction(fraction)
+        return self._get_page(page_spec)
+
+    def get_page_by_target(self, target):
+        """
+        Jump to the page given by the TARGET string.
+        See parse_page_target() for the syntax of TARGET.
+
+        Only the scan of the target page is decoded.
+        Return None when the target is malformed or not found.
+        """
+
+        page_spec = self.seek_target(target)
+        return self._get_page(page_spec)
+
+    def seek_target(self, target):
+        """
+        Make the page given by the TARGET string the current page
+        without decoding it.
+
+        Return its page spec or None 
+        when the target is malformed or not found.
+        """
+
+        parsed_target = parse_page_target(target)
+        if parsed_target is None:
+            return None
+
+        kind, value = parsed_target
+        if kind == 'page':
+            return self._pages.seek_page(value)
+        elif kind == 'scan':
+            scan, side = value
+            return self._pages.seek_scan(scan, side)
+        else: # kind == 'fraction'
+            return self._pages.seek_fraction(value)
+
+    def _get_page(self, page_spec):
+
         Logger.debug("BookBlock: page_spec: {}".format(page_spec))
+
+        # Page not found
+        if page_spec is None:
+            return None
+
         self._pages.print_current_page()
         page = self._page.get(page_spec)
         Logger.debug("BookBlock: type(page): {}".format(type(page)))
+        self.prefetch()
         return page
 
+    def write_run_report(self, mode):
+        """
+        Write the JSON run report with the per-stage timing statistics
+        of the session (MODE = 'batch' or 'gui').
+
+        Return the path of the report.
+        """
+
+        run_stats = get_run_stats()
+        cache_stats = self._page.get_scan_cache().get_stats()
+        run_stats.count('scan-cache-hits',   cache_stats['hits'])
+        run_stats.count('scan-cache-misses', cache_stats['misses'])
+
+        return run_stats.write_report(mode, self._settings.get_report_path())
+
+    def log_cache_stats(self):
+        self._page.get_scan_cache().log_stats()
+
+        disk_cache = self._page.get_disk_cache()
+        if disk_cache is not None:
+            disk_cache.log_stats()
+
     def is_first_page(self):
         return self._pages.is_first_page()
 
     def is_last_page(self):
         return self._pages.is_last_page()
 
+    def preflight(self):
+        """
+        Check all pages before generating them.
+        Return the Preflight object with the problems found.
+        """
+
+        return Preflight(self._settings, self._pages.get_pages(), self._page).run()
+
+    def dry_run(self):
+        """
+        Check all pages and print an estimate 
+        of the amounts of data and the runtime 
+        without generating any page.
+
+        Return True when no problems have been found.
+        """
+
+        preflight = self.preflight()
+        preflight.print_report()
+        return preflight.is_ok()
+
+    @profiled('apply')
     def store_pages(self):
+        """
+        Generate and store all pages.
+
+        Depending on the settings the pages are generated 
+        serially, by a pool of worker processes 
+        or in a pipeline of reader, decoder and writer threads.
+
+        In incremental mode only the pages are generated 
+        whose inputs have changed since they have been generated last.
+
+        All pages are checked by a preflight check first.
+        When problems are found, they are reported at once
+        and no page is generated.
+
+        Return True when all pages have been stored successfully.
+        """
+
+        # Check all pages first
+        preflight = self.preflight()
+        preflight.print_problems()
+        if not preflight.is_ok():
+            return False
+
+        # Get the page specs grouped by scan:
+        # each scan is decoded only once
+        # and all of its pages are cut out of the same buffer.
+        # The groups are created lazily while the pages are generated
+        scan_groups = self._pages.get_scan_groups()
+        num_pages = self._pages.get_number_of_images()
+
+        # Incremental mode:
+        # skip the pages which are up to date
+        # (the remaining scan groups are collected in a list
+        # to record them in the manifest afterwards)
+        manifest = None
+        num_skipped = 0
+        if self._settings.get_incremental():
+            manifest = Manifest(self._settings)
+            scan_groups, num_skipped = self._skip_up_to_date_pages(scan_groups, manifest)
+            num_pages -= num_skipped
+
+            # Remember the modification times of the existing pages
+            # to notice which pages have actually been written
+            page_mtimes = {
+                page_spec['page-path']: get_mtime(page_spec['page-path'])
+                for scan, page_specs in scan_groups
+                for page_spec in page_specs
+            }
+
+        jobs = self._settings.get_jobs()
+        if jobs and jobs > 1:
+            if self._settings.get_pipeline():
+                Logger.warning("BookBlock: Ignoring the pipeline - "
+                               "generating the pages using {} worker processes".format(jobs))
+            failures = self._store_pages_parallel(scan_groups, jobs, num_pages)
+        elif self._settings.get_pipeline():
+            queue_depth = self._settings.get_queue_depth()
+            pipeline = PagePipeline(self._page, queue_depth)
+            failures = pipeline.run(scan_groups)
+        else:
+            failures = self._store_pages_serial(scan_groups)
+
+        # Log the scan cache hits and misses
+        self.log_cache_stats()
+
+        # Record the generated pages in the manifest -
+        # only the pages which have actually been written
+        if manifest is not None:
+            num_rebuilt = 0
+            for scan, page_specs in scan_groups:
+                for page_spec in page_specs:
+                    page_path = page_spec['page-path']
+                    mtime = get_mtime(page_path)
+                    if mtime is not None and mtime != page_mtimes[page_path]:
+                        manifest.record(page_spec)
+                        num_rebuilt += 1
+            manifest.save()
+
+            print("Rebuilt {} pages, skipped {} up-to-date pages."\
+                  .format(num_rebuilt, num_skipped))
+
+        # Report all failures at once
+        for scan, error in failures:
+            print("ERROR Failed to generate the pages of scan {}: {}: {}"\
+                  .format(scan, type(error).__name__, error), file=sys.stderr)
+
+        return not failures
+
+    def _skip_up_to_date_pages(self, scan_groups, manifest):
+        """
+        Remove the pages which are up to date from SCAN_GROUPS.
+
+        Return the remaining scan groups 
+        and the number of skipped pages.
+        """
+
+        remaining_scan_groups = []
+        num_skipped = 0
+        for scan, page_specs in scan_groups:
+
+            remaining_page_specs = []
+            for page_spec in page_specs:
+                if manifest.is_up_to_date(page_spec):
+                    Logger.debug("BookBlock: Page is up to date: {}"\
+                                 .format(page_spec['page-path']))
+                    num_skipped += 1
+                else:
+                    remaining_page_specs.append(page_spec)
+
+            if remaining_page_specs:
+                remaining_scan_groups.append((scan, remaining_page_specs))
+
+        return remaining_scan_groups, num_skipped
+
+    def _store_pages_serial(self, scan_groups):
+
+        failures = []
+        for scan, page_specs in scan_groups:
+
+            try:
+                page_paths = self._page.store_scan_pages(page_specs)
+            except (Exception, SystemExit) as error:
+                failures.append((scan, error))
+                continue
+
+            for page_path in page_paths:
+                print("Generated page {}".format(page_path))
+
+        return failures
+
+    def _store_pages_parallel(self, scan_groups, jobs, num_pages):
+
+        Logger.debug("BookBlock: Generating pages using {} worker processes".format(jobs))
+
+        # The scan groups are created lazily -
+        # only a bounded number of tasks is submitted at a time
+        max_pending = g_tasks_per_job * jobs
+        scan_groups = iter(scan_groups)
+
+        num_done = 0
+        failures = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+
+            # Shard the page specs by scan
+            pending = {}
+            while True:
+
+                # Keep the workers busy
+                for scan, page_specs in islice(scan_groups, max_pending - len(pending)):
+                    future = executor.submit(store_scan_pages, self._settings, page_specs)
+                    pending[future] = (scan, page_specs)
+
+                if not pending:
+                    break
+
+                # Report progress and failures
+                # as soon as the workers have finished a scan
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scan, page_specs = pending.pop(future)
+                    try:
+                        page_paths, stats_state = future.result()
+                        get_run_stats().merge(stats_state)
+                    except (Exception, SystemExit) as error:
+                        num_done += len(page_specs)
+                        print("Failed to generate the pages of scan {} [{}/{}]"\
+                              .format(scan, num_done, num_pages))
+                        failures.append((scan, error))
+                        continue
+
+                    for page_path in page_paths:
+                        num_done += 1
+                        print("Generated page {} [{}/{}]".format(page_path, num_done, num_pages))
+
+        return failures
+
+## =========================================================
+## store_scan_pages(settings, page_specs)
+## ---------------------------------------------------------
+
+def store_scan_pages(settings, page_specs):
+    """
+    Worker process entry point:
+    Store the pages in PAGE_SPECS which all refer to the same scan
+    and return the list of the generated page paths
+    together with the timing statistics of the worker.
+
+    A scan which cannot be read or decoded and a page which cannot be
+    encoded or written raise an error - which is reported back to the
+    parent process by the future of the task.
+    """
+
+    # Only collect the statistics of this task
+    # (a forked worker inherits the statistics of the main process)
+    run_stats = get_run_stats()
+    run_stats.take_state()
 
-        # Get the complete list of page specs
-        page_specs = self._pages.get_pages()
-        for page_spec in page_specs:
+    page = Page(settings)
+    page_paths = page.store_scan_pages(page_specs)
 
-            page_path = page_spec['page-path']
-            print("Generating page {}".format(page_path))
-            self._page.store_page(page_spec)
+    return page_paths, run_stats.take_state()
 
 # TEST
 #| bookblock = BookBlock()
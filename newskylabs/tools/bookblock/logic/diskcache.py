@@ -0,0 +1,219 @@
+"""newskylabs/tools/bookblock/logic/diskcache.py
+
+Persistent cache of decoded scans.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import os, hashlib
+from pathlib import PosixPath
+from threading import Lock
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## class DiskCache
+## ---------------------------------------------------------
+
+# Version of the cache file format.
+# Changing it invalidates all cached scans.
+g_disk_cache_version = 1
+
+# Suffix of the cache files
+g_disk_cache_suffix = '.npy'
+
+class DiskCache:
+    """
+    A persistent least recently used cache of decoded scans.
+
+    Decoded scans - in full or preview resolution - are stored as
+    uncompressed numpy arrays (.npy files) in the cache directory.
+    Loading them is a matter of memory mapping the file, which is
+    much faster than decoding a compressed PNG or TIFF scan again
+    when a book is opened in a later session.
+
+    The cache key consists of the path, modification time and size
+    of the scan and the OpenCV imread flag (image mode and reduction).
+    When a scan is changed on disk its key changes; the stale cache
+    file is evicted eventually.
+
+    The size of the cache is limited by a budget in bytes.  The
+    modification time of a cache file records its last use; when the
+    budget is exceeded the least recently used files are removed.
+
+    Several processes can share a cache directory: cache files are
+    written to a temporary file first and renamed atomically.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self._cache_dir = PosixPath(cache_dir).expanduser()
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+
+        # Total size of the cache files -
+        # determined when the cache is used first
+        self._bytes = None
+
+        # Statistics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_key(self, scan_path, imread_flag):
+        """
+        Return the key of the scan SCAN_PATH decoded with IMREAD_FLAG.
+        """
+
+        stat = os.stat(scan_path)
+        return (os.path.abspath(scan_path), stat.st_mtime_ns, stat.st_size, imread_flag)
+
+    def get_path(self, key):
+        """
+        Return the path of the cache file of KEY.
+        """
+
+        digest = hashlib.sha1(repr((g_disk_cache_version, key)).encode('utf-8')).hexdigest()
+        return self._cache_dir / (digest + g_disk_cache_suffix)
+
+    def get(self, key):
+        """
+        Return the scan cached under KEY as read-only memory mapped
+        array - or None when it is not cached.
+        """
+
+        import numpy as np
+
+        path = self.get_path(key)
+        try:
+            scan_data = np.load(str(path), mmap_mode='r', allow_pickle=False)
+
+            # Mark the cache file as recently used
+            os.utime(str(path))
+
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        except (OSError, ValueError) as error:
+            # A truncated or otherwise broken cache file
+            Logger.warning("DiskCache: Removing broken cache file {}: {}"\
+                           .format(path, error))
+            self._remove(path)
+            with self._lock:
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+        return scan_data
+
+    def put(self, key, scan_data):
+        """
+        Store SCAN_DATA under KEY
+        and evict the least recently used cache files
+        exceeding the budget.
+        """
+
+        import numpy as np
+
+        nbytes = scan_data.nbytes
+        if nbytes > self._max_bytes:
+            # The scan does not fit into the cache at all
+            return
+
+        path = self.get_path(key)
+        tmp_path = path.with_name('{}.{}.tmp'.format(path.stem, os.getpid()))
+        try:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open('wb') as cache_file:
+                np.save(cache_file, scan_data, allow_pickle=False)
+            os.replace(str(tmp_path), str(path))
+
+        except OSError as error:
+            Logger.warning("DiskCache: Failed to cache scan {}: {}".format(key[0], error))
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._get_total_size()
+            else:
+                self._bytes += path.stat().st_size
+
+            if self._bytes > self._max_bytes:
+                self._evict()
+
+    def _get_total_size(self):
+        """
+        Return the total size of all cache files.
+        """
+
+        total = 0
+        for path in self._cache_dir.glob('*' + g_disk_cache_suffix):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+
+        return total
+
+    def _evict(self):
+        """
+        Remove the least recently used cache files
+        until the cache fits into the budget again.
+        """
+
+        # Cache files ordered by their last use
+        entries = []
+        for path in self._cache_dir.glob('*' + g_disk_cache_suffix):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        entries.sort()
+
+        self._bytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if self._bytes <= self._max_bytes:
+                break
+            self._remove(path)
+            self._bytes -= size
+            self._evictions += 1
+            Logger.debug("DiskCache: Evicted: {}".format(path))
+
+    def _remove(self, path):
+        try:
+            os.remove(str(path))
+        except FileNotFoundError:
+            pass
+
+    def get_stats(self):
+        """
+        Return a dictionary with the cache statistics.
+        """
+
+        with self._lock:
+            return {
+                'hits':      self._hits,
+                'misses':    self._misses,
+                'evictions': self._evictions,
+                'max-bytes': self._max_bytes,
+            }
+
+    def log_stats(self):
+        stats = self.get_stats()
+        Logger.info("DiskCache: {hits} hits, {misses} misses, {evictions} evictions, "
+                    "{max-bytes} bytes budget"\
+                    .format(**stats))
+
+## =========================================================
+## =========================================================
+
+## fin.
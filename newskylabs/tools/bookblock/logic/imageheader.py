@@ -0,0 +1,153 @@
+"""newskylabs/tools/bookblock/logic/imageheader.py
+
+Image header probing.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import struct
+
+## =========================================================
+## probe_image_size(path)
+## ---------------------------------------------------------
+
+# Signatures of the supported image formats
+g_png_signature     = b'\x89PNG\r\n\x1a\n'
+g_jpeg_signature    = b'\xff\xd8'
+g_tiff_signatures   = (b'II*\x00', b'MM\x00*')
+
+# JPEG start of frame markers (containing the image size)
+g_jpeg_sof_markers = {0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7,
+                      0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+
+# TIFF tags of the image size
+g_tiff_tag_image_width  = 256
+g_tiff_tag_image_length = 257
+
+def probe_image_size(path):
+    """
+    Return the size (height, width) of the PNG, JPEG or TIFF image
+    PATH - or None when the format is not supported or the header is
+    malformed.
+
+    Only the image header is read; no pixels are decoded.
+
+    Note: The EXIF orientation of JPEG images is not taken into
+    account - which is irrelevant for scans as they are usually not
+    rotated by EXIF tags.
+    """
+
+    with open(path, 'rb') as f:
+        signature = f.read(8)
+
+        try:
+            if signature.startswith(g_png_signature):
+                return probe_png_size(f)
+
+            elif signature.startswith(g_jpeg_signature):
+                return probe_jpeg_size(f)
+
+            elif signature[:4] in g_tiff_signatures:
+                return probe_tiff_size(f, signature[:2])
+
+        except struct.error:
+            # Truncated header
+            return None
+
+    return None
+
+def probe_png_size(f):
+    """
+    The IHDR chunk follows the signature:
+    length (4), type (4), width (4), height (4), ...
+    """
+
+    f.seek(8)
+    length, chunk_type, width, height = struct.unpack('>I4sII', f.read(16))
+    if chunk_type != b'IHDR':
+        return None
+
+    return (height, width)
+
+def probe_jpeg_size(f):
+    """
+    Walk the JPEG segments until the start of frame segment:
+    precision (1), height (2), width (2), ...
+    """
+
+    f.seek(2)
+    while True:
+
+        # Find the next marker
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+
+        marker = f.read(1)
+        while marker == b'\xff':
+            # Fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+
+        # Markers without a segment
+        if marker == 0xd8 or 0xd0 <= marker <= 0xd7 or marker == 0x01:
+            continue
+
+        # End of image or start of scan - no frame header found
+        if marker in (0xd9, 0xda):
+            return None
+
+        length, = struct.unpack('>H', f.read(2))
+        if marker in g_jpeg_sof_markers:
+            precision, height, width = struct.unpack('>BHH', f.read(5))
+            return (height, width)
+
+        f.seek(length - 2, 1)
+
+def probe_tiff_size(f, byte_order):
+    """
+    Read the image width and length tags of the first IFD.
+    """
+
+    endian = '<' if byte_order == b'II' else '>'
+
+    f.seek(4)
+    ifd_offset, = struct.unpack(endian + 'I', f.read(4))
+    f.seek(ifd_offset)
+    num_entries, = struct.unpack(endian + 'H', f.read(2))
+
+    width = height = None
+    for _ in range(num_entries):
+        tag, field_type, count, value = struct.unpack(endian + 'HHI4s', f.read(12))
+        if tag not in (g_tiff_tag_image_width, g_tiff_tag_image_length):
+            continue
+
+        # SHORT or LONG
+        if field_type == 3:
+            value, = struct.unpack(endian + 'H', value[:2])
+        else:
+            value, = struct.unpack(endian + 'I', value)
+
+        if tag == g_tiff_tag_image_width:
+            width = value
+        else:
+            height = value
+
+    if width is None or height is None:
+        return None
+
+    return (height, width)
+
+## =========================================================
+## =========================================================
+
+## fin.
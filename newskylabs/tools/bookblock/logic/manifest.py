@@ -0,0 +1,210 @@
+"""newskylabs/tools/bookblock/logic/manifest.py
+
+Manifest of the generated pages.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import os, json, hashlib
+from pathlib import PosixPath
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## class Manifest
+## ---------------------------------------------------------
+
+# Name of the manifest file in the target directory
+g_manifest_file_name = '.bookblock-manifest.json'
+
+# Version of the manifest file format
+g_manifest_version = 1
+
+class Manifest:
+    """
+    A manifest stored in the target directory recording for each
+    generated page the inputs it has been generated from:
+
+    - the path, modification time, size and hash of the scan,
+    - the geometry, side and image mode,
+    - the output format.
+
+    Pages whose inputs have not changed since they have been
+    generated last are up to date and do not have to be generated
+    again.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+        target_dir = settings.get_target_dir()
+        self._path = PosixPath(target_dir).expanduser() / g_manifest_file_name
+
+        # Scan infos computed during this run: scan path -> info
+        self._scan_infos = {}
+
+        self.load()
+
+    def load(self):
+        """
+        Load the manifest from the target directory.
+        """
+
+        self._pages = {}
+        if not self._path.exists():
+            return
+
+        try:
+            with self._path.open() as manifest_file:
+                manifest = json.load(manifest_file)
+        except ValueError as error:
+            Logger.warning("Manifest: Ignoring malformed manifest {}: {}"\
+                           .format(self._path, error))
+            return
+
+        if manifest.get('version') != g_manifest_version:
+            Logger.warning("Manifest: Ignoring manifest {} of version {}"\
+                           .format(self._path, manifest.get('version')))
+            return
+
+        self._pages = manifest.get('pages', {})
+
+    def save(self):
+        """
+        Save the manifest to the target directory.
+        """
+
+        manifest = {
+            'version': g_manifest_version,
+            'pages':   self._pages,
+        }
+
+        # Write to a temporary file first
+        # to never leave a truncated manifest behind
+        tmp_path = self._path.with_name(self._path.name + '.tmp')
+        with tmp_path.open('w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(str(tmp_path), str(self._path))
+
+    def get_scan_info(self, scan_path, with_hash=True):
+        """
+        Return the modification time, size and - when WITH_HASH is
+        True - hash of the scan SCAN_PATH.
+        """
+
+        info = self._scan_infos.get(scan_path)
+        if info is None:
+            stat = os.stat(scan_path)
+            info = {
+                'scan-mtime': stat.st_mtime_ns,
+                'scan-size':  stat.st_size,
+            }
+            self._scan_infos[scan_path] = info
+
+        if with_hash and 'scan-hash' not in info:
+            info['scan-hash'] = hash_file(scan_path)
+
+        return info
+
+    def get_page_inputs(self, page_spec):
+        """
+        Return the inputs of the page PAGE_SPEC
+        apart from the scan file infos.
+        """
+
+        return {
+            'scan-path':  page_spec['scan-path'],
+            'geometry':   self._settings.get_geometry(),
+            'side':       page_spec['side'],
+            'image-mode': self._settings.get_image_mode(),
+            'format':     PosixPath(page_spec['page-path']).suffix.lower(),
+        }
+
+    def is_up_to_date(self, page_spec):
+        """
+        Is the page PAGE_SPEC up to date?
+        """
+
+        page_path = page_spec['page-path']
+        scan_path = page_spec['scan-path']
+
+        record = self._pages.get(page_path)
+        if record is None:
+            return False
+
+        # Has the page been deleted?
+        if not os.path.exists(page_path):
+            return False
+
+        # Has a setting changed?
+        for key, value in self.get_page_inputs(page_spec).items():
+            if record.get(key) != value:
+                return False
+
+        # Has the scan been changed?
+        if not os.path.exists(scan_path):
+            return False
+
+        info = self.get_scan_info(scan_path, with_hash=False)
+        if info['scan-mtime'] == record.get('scan-mtime') and \
+           info['scan-size']  == record.get('scan-size'):
+            return True
+
+        # The scan has been touched -
+        # compare the hash to see whether its content has changed
+        info = self.get_scan_info(scan_path)
+        if info['scan-hash'] == record.get('scan-hash'):
+            record.update(info)
+            return True
+
+        return False
+
+    def record(self, page_spec):
+        """
+        Record the inputs of the generated page PAGE_SPEC.
+        """
+
+        record = self.get_page_inputs(page_spec)
+        record.update(self.get_scan_info(page_spec['scan-path']))
+        self._pages[page_spec['page-path']] = record
+
+## =========================================================
+## get_mtime(path)
+## ---------------------------------------------------------
+
+def get_mtime(path):
+    """
+    Return the modification time of the file PATH in nanoseconds -
+    or None when it does not exist.
+    """
+
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+## =========================================================
+## hash_file(path)
+## ---------------------------------------------------------
+
+def hash_file(path, block_size=1024 * 1024):
+    """
+    Return the SHA-1 hash of the file PATH.
+    """
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+## =========================================================
+## =========================================================
+
+## fin.
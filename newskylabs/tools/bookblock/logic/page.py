@@ -10,17 +10,20 @@ __copyright__   = "Copyright 2019 Dietrich Bollmann"
 __license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
 __date__        = "2019/10/18"
 
-import sys, re
+import sys, os, re
 
 from pathlib import Path, PosixPath
 
-from kivy.logger import Logger
+from newskylabs.tools.bookblock.utils.logger import Logger
 
-# Numpy
-import numpy as np
+# Note: numpy and OpenCV are imported when they are needed
+# - importing them takes longer than all the rest of bookblock
+# and is not needed to plan or check the pages
 
-# OpenCV
-import cv2
+from newskylabs.tools.bookblock.logic.scancache import ScanCache
+from newskylabs.tools.bookblock.logic.diskcache import DiskCache
+from newskylabs.tools.bookblock.logic.imageheader import probe_image_size
+from newskylabs.tools.bookblock.logic.runstats import get_run_stats
 
 ## =========================================================
 ## parse_geometry(geometry)
@@ -32,6 +35,8 @@ g_regexp_geometry = re.compile('(\d+)x(\d+)\+(\d+)\+(\d+)')
 def parse_geometry(geometry):
     """
     Example: 600x800+22+41
+
+    Raise a ValueError when GEOMETRY is malformed.
     """
 
     m = g_regexp_geometry.match(geometry)
@@ -46,11 +51,45 @@ def parse_geometry(geometry):
         return (width, height, offset_left, offset_top)
 
     else:
-        Logger.debug("parse_geometry(): From page {} to page {} left side {} right side {}"\
-              .format(from_page, to_page, left_side, right_side))
-            
-        print("ERROR Malformed geometry: '{}'".format(geometry), file=sys.stderr)
-        exit(-1)
+        raise ValueError("Malformed geometry: '{}'".format(geometry))
+
+## =========================================================
+## format_geometry(width, height, offset_left, offset_top)
+## ---------------------------------------------------------
+
+def format_geometry(width, height, offset_left, offset_top):
+    """
+    Inverse of parse_geometry().
+    Example: (600, 800, 22, 41) => 600x800+22+41
+    """
+
+    return '{}x{}+{}+{}'.format(width, height, offset_left, offset_top)
+
+## =========================================================
+## is_image(data)
+## ---------------------------------------------------------
+
+def is_image(data):
+    """
+    Is DATA an image - a numpy array
+    (or the path of a scan in raw view mode)?
+    Missing scans are returned as None or False.
+    """
+
+    if isinstance(data, str):
+        return True
+
+    # When DATA is an array, numpy has been imported already
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(data, numpy.ndarray)
+
+## =========================================================
+## Reduced resolution decoding
+## ---------------------------------------------------------
+
+# Scale factors supported by OpenCV's reduced resolution reads
+# (cv2.IMREAD_REDUCED_COLOR_2/4/8 and cv2.IMREAD_REDUCED_GRAYSCALE_2/4/8)
+g_reductions = (8, 4, 2)
 
 ## =========================================================
 ## class Page:
@@ -63,6 +102,37 @@ class Page:
     def __init__(self, settings):
         self._settings = settings
 
+        # LRU cache of decoded scans
+        cache_size = settings.get_cache_size()
+        self._scan_cache = ScanCache(cache_size * 1024 * 1024)
+
+        # Persistent cache of decoded scans
+        # surviving the end of the session
+        disk_cache_dir  = settings.get_disk_cache_dir()
+        disk_cache_size = settings.get_disk_cache_size()
+        if disk_cache_dir and disk_cache_size:
+            self._disk_cache = DiskCache(disk_cache_dir, disk_cache_size * 1024 * 1024)
+        else:
+            self._disk_cache = None
+
+        # Modification time of each scan when it was last loaded:
+        # scan path -> st_mtime_ns.
+        # Used to look up decoded scans in the scan cache
+        # without accessing the file system
+        self._scan_mtimes = {}
+
+        # Full resolution size (height, width) of the last decoded scan.
+        # Used to choose the reduction factor of previews
+        # as all scans of a book normally have the same size.
+        self._scan_size = None
+        self._scan_size_exact = False
+
+    def get_scan_cache(self):
+        return self._scan_cache
+
+    def get_disk_cache(self):
+        return self._disk_cache
+
     def get(self, page_spec):
 
         # Get the view mode
@@ -70,11 +140,12 @@ class Page:
         Logger.debug("Page: View mode: {}".format(view_mode))
 
         # Depending on the view mode return one of:
-        # - scan with bounding boxraw scan
+        # - preview of the scan 
+        #   (the bounding box is drawn as an overlay by the GUI)
         # - page corresponding to the bounding box
         # - scan as it is
         if view_mode == 'scan':
-            page = self.get_scan_with_bounding_box(page_spec)
+            page = self.get_scan_preview(page_spec)
             Logger.debug("Page: scan type(page): {}".format(type(page)))
 
         elif view_mode == 'page':
@@ -87,11 +158,35 @@ class Page:
 
         Logger.debug("Pages: type(page): {}".format(type(page)))
         return page
+
+    def get_view(self, page_spec):
+        """
+        Return the page PAGE_SPEC in the current view mode
+        together with the full resolution size (height, width) of its
+        scan in scan view mode - or None in the other view modes.
+
+        The size of the scan allows to map the bounding box of the
+        page onto the preview of the scan.
+        """
+
+        if self._settings.get_view_mode() == 'scan':
+            scan, reduction = self.load_scan_preview(page_spec)
+            if scan is None:
+                return None, None
+            return scan, self.get_full_scan_size(scan.shape[:2], reduction)
+
+        return self.get(page_spec), None
         
     def get_scan_raw(self, page_spec):
         return page_spec['scan-path']
 
-    def load_scan(self, page_spec):
+    def load_scan(self, page_spec, reduction=1):
+        """
+        Load the scan of PAGE_SPEC.
+
+        When REDUCTION is 2, 4 or 8 the scan is decoded at
+        1/REDUCTION of its full resolution.
+        """
 
         # Extract page info
         scan = page_spec['scan']
@@ -113,18 +208,245 @@ class Page:
         Logger.debug(msg)
       
         # Ensure that the scan file exists
+        self.check_scan_file(scan_path)
+
+        # Select image mode
+        image_mode = self.get_imread_flag(reduction)
+
+        # Has the scan already been decoded?
+        cache_key = self.get_cache_key(scan_path, reduction)
+
+        # Load an color image in grayscale -
+        # unless the scan has been cached already
+        # Note: cached scans are read-only
+        scan_data = self._scan_cache.get_or_load(
+            cache_key, lambda: self.decode_scan_file(scan_path, image_mode))
+
+        # Remember the size of the scan
+        if scan_data is not None:
+            self.update_scan_size(scan_data.shape[:2], reduction)
+    
+        # Return the loaded scan data
+        return scan_data
+
+    def decode_scan_file(self, scan_path, image_mode):
+        """
+        Decode the scan SCAN_PATH with the imread flag IMAGE_MODE -
+        or load it from the persistent disk cache 
+        when it has been decoded in an earlier session.
+        """
+
+        disk_cache = self._disk_cache
+        if disk_cache is None:
+            return self.decode_scan(self.read_file(scan_path), image_mode)
+
+        key = disk_cache.get_key(scan_path, image_mode)
+        with get_run_stats().time('read'):
+            scan_data = disk_cache.get(key)
+        if scan_data is None:
+            scan_data = self.decode_scan(self.read_file(scan_path), image_mode)
+            if scan_data is not None:
+                disk_cache.put(key, scan_data)
+
+        return scan_data
+
+    def get_cache_key(self, scan_path, reduction=1):
+        """
+        Return the key of the scan SCAN_PATH decoded with REDUCTION
+        in the scan cache.
+
+        The modification time is part of the key 
+        in order to notice when a scan has been changed on disk.
+        """
+
+        image_mode = self.get_imread_flag(reduction)
+        mtime = os.stat(scan_path).st_mtime_ns
+        self._scan_mtimes[scan_path] = mtime
+
+        return (scan_path, image_mode, mtime)
+
+    def peek_scan(self, scan_path, reduction=1):
+        """
+        Return the scan SCAN_PATH decoded with REDUCTION
+        when it is in the scan cache - or None.
+
+        The scan file is not accessed: the modification time
+        recorded when the scan has been loaded last is used
+        for the cache key.  Changes on disk are noticed
+        when the scan is loaded the next time.
+        """
+
+        mtime = self._scan_mtimes.get(scan_path)
+        if mtime is None:
+            return None
+
+        image_mode = self.get_imread_flag(reduction)
+        return self._scan_cache.peek((scan_path, image_mode, mtime))
+
+    def get_cached_preview(self, page_spec):
+        """
+        Return a preview of PAGE_SPEC in the current view mode
+        made from a scan which has already been decoded - 
+        or None when the scan is not in the scan cache.
+
+        Like get_view() the preview is returned together with the full
+        resolution size of the scan in scan view mode.
+
+        No scan is loaded from disk, which makes previews cheap enough
+        to be shown while the user is navigating quickly.
+        """
+
+        scan_path = page_spec['scan-path']
+
+        # Find any decoded version of the scan
+        view_reduction = self.get_view_reduction()
+        for reduction in (view_reduction, 1) + g_reductions:
+            scan = self.peek_scan(scan_path, reduction)
+            if scan is not None:
+                break
+        else:
+            return None, None
+
+        if self._settings.get_view_mode() == 'scan':
+            # Subsample the scan to the preview resolution
+            # (slicing with a step creates a view - nothing is copied)
+            step = max(1, view_reduction // reduction)
+            preview = scan[::step, ::step] if step > 1 else scan
+            return preview, self.get_full_scan_size(scan.shape[:2], reduction)
+
+        else:
+            return self.cut_page(scan, page_spec, reduction=reduction), None
+
+    def is_cached(self, page_spec):
+        """
+        Has the scan of PAGE_SPEC already been decoded 
+        in the resolution of the current view mode?
+        """
+
+        scan_path = page_spec['scan-path']
+        return self.peek_scan(scan_path, self.get_view_reduction()) is not None
+
+    def update_scan_size(self, scan_size, reduction):
+        """
+        Remember the full resolution size of the last decoded scan.
+        """
+
+        if reduction == 1:
+            self._scan_size = tuple(scan_size)
+            self._scan_size_exact = True
+
+        elif not self._scan_size_exact:
+            height, width = scan_size
+            self._scan_size = (height * reduction, width * reduction)
+
+    def get_full_scan_size(self, scan_size, reduction):
+        """
+        Return the full resolution size of a scan
+        of size SCAN_SIZE decoded with the given REDUCTION.
+        """
+
+        if reduction == 1:
+            return tuple(scan_size)
+
+        # OpenCV rounds the size of reduced images up
+        # - prefer the exactly known size when it matches
+        height, width = scan_size
+        if self._scan_size_exact:
+            full_height, full_width = self._scan_size
+            if (full_height + reduction - 1) // reduction == height and \
+               (full_width  + reduction - 1) // reduction == width:
+                return self._scan_size
+
+        return (height * reduction, width * reduction)
+
+    def get_preview_reduction(self):
+        """
+        Choose the reduction factor for decoding previews.
+
+        The largest factor is chosen which still results in an image
+        at least as large as the preview size given in the settings.
+        When the preview size or the size of the scans is not known
+        the scans are decoded at full resolution.
+        """
+
+        preview_size = self._settings.get_preview_size()
+        if not preview_size or not self._scan_size:
+            return 1
+
+        preview_width, preview_height = preview_size
+        scan_height, scan_width = self._scan_size
+        for reduction in g_reductions:
+            if scan_width  // reduction >= preview_width and \
+               scan_height // reduction >= preview_height:
+                return reduction
+
+        return 1
+
+    def get_view_reduction(self):
+        """
+        Return the reduction factor used to decode scans
+        in the current view mode.
+
+        Only the scan view mode shows a preview of the whole scan.
+        """
+
+        if self._settings.get_view_mode() == 'scan':
+            return self.get_preview_reduction()
+        else:
+            return 1
+
+    def prefetch(self, page_spec):
+        """
+        Decode the scan of PAGE_SPEC into the scan cache
+        in order to have it ready when it is shown.
+        """
+
+        # Nothing to do when the scan has been decoded already
+        reduction = self.get_view_reduction()
+        if self.peek_scan(page_spec['scan-path'], reduction) is not None:
+            return
+
+        # Missing scans are reported when they are shown
+        try:
+            self.load_scan(page_spec, reduction)
+        except FileNotFoundError:
+            pass
+
+    def check_scan_file(self, scan_path):
+        """
+        Ensure that the scan file SCAN_PATH exists.
+        Raise a FileNotFoundError otherwise.
+        """
+
         if not Path(scan_path).exists():
-            # No file has been found 
-            # print an ERROR and exit
-            print("ERROR File not found: {}".format(scan_path), file=sys.stderr)
-            sys.exit(2)
+            raise FileNotFoundError("File not found: {}".format(scan_path))
+
+    def get_imread_flag(self, reduction=1):
+        """
+        Return the OpenCV imread flag corresponding to the image mode
+        and the REDUCTION factor (1, 2, 4 or 8).
+        """
+
+        import cv2
+
+        image_mode = self._settings.get_image_mode()
 
         # Select image mode
         if image_mode == 'color':
-            image_mode = cv2.IMREAD_COLOR
+            return {
+                1: cv2.IMREAD_COLOR,
+                2: cv2.IMREAD_REDUCED_COLOR_2,
+                4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8,
+            }[reduction]
 
         elif image_mode == 'grayscale':
-            image_mode = cv2.IMREAD_GRAYSCALE
+            return {
+                1: cv2.IMREAD_GRAYSCALE,
+                2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+            }[reduction]
 
         else:
             # ERROR:
@@ -135,11 +457,52 @@ class Page:
                             "Only `color' and `grayscale' are defined."\
                             .format(type(image_mode))
             )
-            
-        # Load an color image in grayscale
-        scan_data = cv2.imread(scan_path, image_mode)
-    
-        # Return the loaded scan data
+
+    def read_scan_file(self, page_spec):
+        """
+        Read the encoded scan data of PAGE_SPEC from disk
+        without decoding it.
+        """
+
+        scan_path = page_spec['scan-path']
+        Logger.debug("Page: Reading scan file: {}".format(scan_path))
+
+        # Ensure that the scan file exists
+        self.check_scan_file(scan_path)
+
+        return self.read_file(scan_path)
+
+    def read_file(self, scan_path):
+        """
+        Read the encoded scan data from SCAN_PATH.
+        """
+
+        run_stats = get_run_stats()
+        with run_stats.time('read'):
+            scan_file_data = Path(scan_path).read_bytes()
+        run_stats.count('bytes-read', len(scan_file_data))
+
+        return scan_file_data
+
+    def decode_scan(self, scan_file_data, image_mode=None):
+        """
+        Decode the scan data read by read_scan_file()
+        using the imread flag IMAGE_MODE - 
+        by default the one of the image mode at full resolution.
+        """
+
+        import numpy as np
+        import cv2
+
+        if image_mode is None:
+            image_mode = self.get_imread_flag()
+
+        run_stats = get_run_stats()
+        with run_stats.time('decode'):
+            buffer = np.frombuffer(scan_file_data, dtype=np.uint8)
+            scan_data = cv2.imdecode(buffer, image_mode)
+        run_stats.count('scans-decoded')
+
         return scan_data
 
     def calculate_bounding_box(self, page_spec, scan_size):
@@ -187,7 +550,54 @@ class Page:
         # Return boundng box
         return (bb_p1, bb_p2)
 
-    def get_scan_with_bounding_box(self, page_spec): # wech, side, mode):
+    def calculate_geometry(self, page_spec, bounding_box, scan_size):
+        """
+        Inverse of calculate_bounding_box():
+        Return the geometry string resulting in BOUNDING_BOX 
+        for the page PAGE_SPEC of a scan of size SCAN_SIZE.
+        """
+
+        # Extract page info
+        side = page_spec['side']
+
+        # Size of scan
+        scan_height, scan_width = scan_size
+        half_scan_width = int(scan_width / 2)
+
+        # Bounding box
+        (x1, y1), (x2, y2) = bounding_box
+
+        # The geometry is relative to the left page
+        if side == 'right':
+            x1 -= half_scan_width
+            x2 -= half_scan_width
+
+        # Offsets can not be negative
+        bb_offset_left = max(0, x1)
+        bb_offset_top  = max(0, y1)
+        bb_width       = max(1, x2 - x1 + 1)
+        bb_height      = max(1, y2 - y1 + 1)
+
+        return format_geometry(bb_width, bb_height, bb_offset_left, bb_offset_top)
+
+    def get_scan_preview(self, page_spec):
+        """
+        Return a preview of the scan of PAGE_SPEC.
+
+        The preview is the cached scan itself - 
+        nothing is drawn into it.
+        """
+
+        scan, reduction = self.load_scan_preview(page_spec)
+        return scan
+
+    def load_scan_preview(self, page_spec):
+        """
+        Load a preview of the scan of PAGE_SPEC 
+        at a resolution matching the preview size.
+
+        Return the preview and the reduction it has been decoded with.
+        """
 
         # Extract page info
         scan = page_spec['scan']
@@ -202,7 +612,7 @@ class Page:
 
         # Print settings
         msg = \
-            "DEBUG [Page] Draw bounding box on scanned page:\n" + \
+            "DEBUG [Page] Load preview of scanned page:\n" + \
             "\n" + \
             "  - scan:        {}\n".format(scan) + \
             "  - side:        {}\n".format(side) + \
@@ -212,30 +622,51 @@ class Page:
             "\n"
         Logger.debug(msg)
       
-        # Load the scan
-        scan = self.load_scan(page_spec)
+        # Before the first scan has been decoded
+        # read its size from the image header
+        if self._scan_size is None and Path(scan_path).exists():
+            scan_size = probe_image_size(scan_path)
+            if scan_size is not None:
+                self.update_scan_size(scan_size, 1)
 
-        # When the scan has not been found return False
-        if not isinstance(scan, (str, np.ndarray)):
-            return None
+        # Load a preview of the scan
+        # at a resolution matching the preview size
+        reduction = self.get_preview_reduction()
+        scan = self.load_scan(page_spec, reduction)
+
+        # When the scan has not been found return None
+        if not is_image(scan):
+            return None, reduction
+
+        return scan, reduction
+
+    def get_bounding_box(self, page_spec, scan, reduction=1):
+        """
+        Return the bounding box of PAGE_SPEC in the coordinates of
+        SCAN which has been decoded with the given REDUCTION.
+        """
+
+        # Full resolution
+        if reduction == 1:
+            return self.calculate_bounding_box(page_spec, scan.shape[:2])
 
-        # Get the size of the scan
-        scan_size = scan.shape[:2]
+        # Get the full resolution size of the scan
+        scan_size = self.get_full_scan_size(scan.shape[:2], reduction)
 
         # Calculate the Bounding Box
+        # and scale it to the resolution of the scan
         bb_p1, bb_p2 = self.calculate_bounding_box(page_spec, scan_size)
+        bb_p1 = (bb_p1[0] // reduction, bb_p1[1] // reduction)
+        bb_p2 = (bb_p2[0] // reduction, bb_p2[1] // reduction)
 
-        # Bounding box settings
-        bb_color      = 0 # Black
-        bb_line_width = 2 # 2px line thickness
+        return (bb_p1, bb_p2)
 
-        # Draw bounding box
-        cv2.rectangle(scan, bb_p1, bb_p2, bb_color, bb_line_width)
+    def get_page(self, page_spec, copy=False):
+        """
+        Return the page specified by PAGE_SPEC.
 
-        # Return scan with bounding box
-        return scan
-    
-    def get_page(self, page_spec):
+        See cut_page() for the meaning of COPY.
+        """
 
         # Extract page info
         scan = page_spec['scan']
@@ -264,14 +695,40 @@ class Page:
         scan = self.load_scan(page_spec)
 
         # When the scan has not been found return False
-        if not isinstance(scan, (str, np.ndarray)):
+        if not is_image(scan):
             return False
 
-        # Get the size of the scan
-        scan_size = scan.shape[:2]
+        # Cut out the page
+        return self.cut_page(scan, page_spec, copy=copy)
+
+    def cut_page(self, scan, page_spec, copy=False, reduction=1):
+        """
+        Cut out the page specified by PAGE_SPEC
+        from the already loaded SCAN 
+        which has been decoded with the given REDUCTION.
+
+        View vs. owned contract:
+
+        - When COPY is False (the default) the page is returned as a
+          numpy view sharing its buffer with SCAN - no pixel data is
+          copied.  As the view shares the buffer of SCAN, it inherits
+          its flags: a page cut out of a cached scan is read-only and
+          keeps the whole scan alive as long as it is referenced.
+          This is what the cache, the writer and the texture upload
+          need, as they only read the page.
+
+        - When COPY is True an owned, writable and contiguous copy of
+          the page region only is returned.  Use it when the page has
+          to be modified or kept independently of the scan.
+        """
+
+        with get_run_stats().time('crop'):
+            return self._cut_page(scan, page_spec, copy, reduction)
+
+    def _cut_page(self, scan, page_spec, copy, reduction):
 
         # Calculate the Bounding Box
-        bb_p1, bb_p2 = self.calculate_bounding_box(page_spec, scan_size)
+        bb_p1, bb_p2 = self.get_bounding_box(page_spec, scan, reduction)
 
         # Calculate the page area
         x1, y1 = bb_p1
@@ -283,8 +740,9 @@ class Page:
         
         # Cut out page
         Logger.debug("Page: Cutting out area: x: {}, y: {}, w: {}, h: {}".format(x, y, w, h))
-        page = scan.copy()
-        page = page[y:y+h, x:x+w]
+        page = scan[y:y+h, x:x+w]
+        if copy:
+            page = page.copy()
 
         # Return the page data
         return page
@@ -317,19 +775,100 @@ class Page:
         page = self.get_page(page_spec)
 
         # When the page has not been found return False
-        if not isinstance(page, (str, np.ndarray)):
+        if not is_image(page):
             return False
 
+        # Save the page
+        self.write_page(page, page_path)
+
+    def store_scan_pages(self, page_specs):
+        """
+        Store all pages in PAGE_SPECS.
+
+        All page specs have to refer to the same scan.
+        The scan is decoded only once
+        and all pages are cut out of the same buffer.
+
+        Like PagePipeline the scan cache and the disk cache
+        are bypassed - each scan is stored only once.
+
+        Return the list of the written page paths.
+        Raise a ValueError when the scan could not be decoded.
+        """
+
+        # Nothing to do?
+        if not page_specs:
+            return []
+
+        # Decode the scan only once
+        scan = self.decode_scan(self.read_scan_file(page_specs[0]))
+
+        # When the scan could not be decoded raise an error
+        if not is_image(scan):
+            raise ValueError("Could not decode scan: {}"\
+                             .format(page_specs[0]['scan-path']))
+
+        # Cut out and save all requested pages
+        page_paths = []
+        for page_spec in page_specs:
+            page = self.cut_page(scan, page_spec)
+            self.write_page(page, page_spec['page-path'])
+            page_paths.append(page_spec['page-path'])
+
+        return page_paths
+
+    def write_page(self, page, page_path):
+        """
+        Save the PAGE data to PAGE_PATH.
+        """
+
+        # Save image
+        page_file_data = self.encode_page(page, page_path)
+        self.write_page_file(page_file_data, page_path)
+
+    def encode_page(self, page, page_path):
+        """
+        Encode the PAGE data in the image format 
+        given by the file extension of PAGE_PATH
+        and return the encoded bytes.
+        """
+
+        import cv2
+
+        extension = PosixPath(page_path).suffix
+        with get_run_stats().time('encode'):
+            success, page_file_data = cv2.imencode(extension, page)
+        if not success:
+            raise ValueError("Could not encode page: {}".format(page_path))
+
+        return page_file_data.tobytes()
+
+    def write_page_file(self, page_file_data, page_path):
+        """
+        Save the page data encoded by encode_page() to PAGE_PATH.
+        """
+
         # Ensure that the page directory exists
+        self.ensure_page_dir(page_path)
+
+        # Save image
+        Logger.debug("Pages: Storing image: {}".format(page_path))
+        run_stats = get_run_stats()
+        with run_stats.time('write'):
+            PosixPath(page_path).write_bytes(page_file_data)
+        run_stats.count('bytes-written', len(page_file_data))
+        run_stats.count('pages-written')
+
+    def ensure_page_dir(self, page_path):
+        """
+        Ensure that the directory of PAGE_PATH exists.
+        """
+
         page_dir = PosixPath(page_path).parent
         if not page_dir.exists():
             Logger.debug("Pages: Creating page directory: {}".format(str(page_dir)))
             page_dir.mkdir(parents=True, exist_ok=True)
 
-        # Save image
-        Logger.debug("Pages: Storing image: {}".format(page_path))
-        cv2.imwrite(page_path, page)
-
 ## =========================================================
 ## =========================================================
 
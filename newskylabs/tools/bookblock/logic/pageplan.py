@@ -0,0 +1,392 @@
+"""newskylabs/tools/bookblock/logic/pageplan.py
+
+Page plan.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from array import array
+from bisect import bisect_right
+from pathlib import PosixPath
+
+from newskylabs.tools.bookblock.logic.sourceindex import SourceIndex
+from newskylabs.tools.bookblock.logic.runstats import get_run_stats
+
+## =========================================================
+## Side codes
+## ---------------------------------------------------------
+
+# The sides of a scan are stored as codes: 0 = left, 1 = right
+g_sides = ('left', 'right')
+g_side_codes = {side: code for code, side in enumerate(g_sides)}
+
+# Maximal number of memoized file infos
+# (keeps the memory bounded when iterating over huge plans)
+g_max_memoized_file_infos = 4096
+
+## =========================================================
+## class PagePlan
+## ---------------------------------------------------------
+
+class PagePlan:
+    """
+    A compact, precompiled plan of the pages to be generated.
+
+    The plan is stored as a list of segments - one for each comma
+    separated part of the page specification - together with the
+    cumulative page counts of the segments.  A segment consists of
+    the first scan, the number of scans and the side codes of the
+    scans.  This way even huge ranges like `0-999999lr' are
+    expanded lazily on demand:
+
+    - len() is O(1),
+    - random access by index or page number is O(log n) in the
+      number of segments (by bisecting the cumulative counts),
+    - iterating creates the page specs one by one.
+
+    The page specs (dictionaries) are only created when accessing a
+    page; the file names and paths are resolved lazily and memoized
+    per scan and page.  The scan files are looked up in the source
+    index (see SourceIndex) listing the source directory only once;
+    scans which are not in the index fall back to the path given by
+    the source file format.
+
+    A page plan is cheap to slice, iterate and pickle (for example
+    to send it to worker processes): a slice shares the segments and
+    only restricts the range of page indices, and the memoized paths
+    are not pickled.
+    """
+
+    def __init__(self,
+                 source_dir, source_file_format,
+                 target_dir, target_file_format,
+                 segments=None, offsets=None, start=0, stop=None,
+                 source_index=None):
+
+        # File settings
+        self._source_dir         = source_dir
+        self._source_file_format = source_file_format
+        self._target_dir         = target_dir
+        self._target_file_format = target_file_format
+        self._source_index       = source_index
+
+        # The segments: (first scan, number of scans, side codes)
+        # and the index of the first page of each segment
+        self._segments = segments if segments is not None else []
+        self._offsets  = offsets  if offsets  is not None else array('q')
+
+        # The range of page indices covered by this plan
+        self._start = start
+        self._stop  = stop if stop is not None else self._get_total()
+
+        # Memoized file infos
+        self._scan_infos = {}
+        self._page_infos = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create an empty page plan
+        using the file settings of SETTINGS.
+        """
+
+        return cls(settings.get_source_dir(),
+                   settings.get_source_file_format(),
+                   settings.get_target_dir(),
+                   settings.get_target_file_format(),
+                   source_index=SourceIndex.from_settings(settings))
+
+    def _get_total(self):
+        """
+        Return the total number of pages in all segments.
+        """
+
+        if not self._segments:
+            return 0
+
+        first_scan, num_scans, side_codes = self._segments[-1]
+        return self._offsets[-1] + num_scans * len(side_codes)
+
+    def append_segment(self, scans, sides):
+        """
+        Append a segment consisting of
+        the given SIDES of the range of SCANS.
+        """
+
+        # Segments without pages are not needed
+        if not scans or not sides:
+            return
+
+        total = self._get_total()
+        self._segments.append((scans.start, len(scans),
+                               bytes(g_side_codes[side] for side in sides)))
+        self._offsets.append(total)
+        self._stop = total + len(scans) * len(sides)
+
+    ## Sequence protocol
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+
+        # Slice => page plan
+        if isinstance(index, slice):
+            indices = range(self._start, self._stop)[index]
+            if indices.step != 1:
+                raise ValueError("Page plans only support slices with step 1")
+            return PagePlan(self._source_dir, self._source_file_format,
+                            self._target_dir, self._target_file_format,
+                            self._segments, self._offsets,
+                            indices.start, max(indices.start, indices.stop),
+                            self._source_index)
+
+        # Index => page spec
+        return self.get_page_spec(index)
+
+    def __iter__(self):
+
+        if self._start >= self._stop:
+            return
+
+        # Iterate lazily over the segments
+        # starting with the segment of the first page
+        i = self._start
+        segment = bisect_right(self._offsets, i) - 1
+        while i < self._stop:
+            first_scan, num_scans, side_codes = self._segments[segment]
+            offset = self._offsets[segment]
+            num_sides = len(side_codes)
+            end = min(self._stop, offset + num_scans * num_sides)
+            while i < end:
+                local = i - offset
+                yield self._make_page_spec(first_scan + local // num_sides,
+                                           side_codes[local % num_sides],
+                                           i + 1)
+                i += 1
+            segment += 1
+
+    def iter_scans(self):
+        """
+        Yield the scans of the plan in order as (scan, sides, page)
+        triples: the sides of the scan in the plan and the page number
+        of its first side - without creating any page spec.
+        """
+
+        if self._start >= self._stop:
+            return
+
+        i = self._start
+        segment = bisect_right(self._offsets, i) - 1
+        while i < self._stop:
+            first_scan, num_scans, side_codes = self._segments[segment]
+            offset = self._offsets[segment]
+            num_sides = len(side_codes)
+            end = min(self._stop, offset + num_scans * num_sides)
+            while i < end:
+                local = i - offset
+                side_index = local % num_sides
+                scan_end = min(end, i + num_sides - side_index)
+                sides = tuple(g_sides[side_code]
+                              for side_code in side_codes[side_index:side_index + scan_end - i])
+                yield first_scan + local // num_sides, sides, i + 1
+                i = scan_end
+            segment += 1
+
+    def iter_scan_groups(self):
+        """
+        Yield the page specs grouped by scan as (scan, page_specs) pairs
+        in the order of the plan.
+
+        The groups are created lazily one by one.  As the pages of a
+        scan are consecutive in a segment, each group holds the pages
+        of one scan in one segment - or in adjacent segments referring
+        to the same scan (like `5l,5r').
+        """
+
+        group_scan, group = None, []
+        for page_spec in self:
+            if group and page_spec['scan'] != group_scan:
+                yield group_scan, group
+                group = []
+            group_scan = page_spec['scan']
+            group.append(page_spec)
+
+        if group:
+            yield group_scan, group
+
+    ## Pickling
+
+    def __getstate__(self):
+
+        # Do not pickle the memoized file infos
+        state = self.__dict__.copy()
+        state['_scan_infos'] = {}
+        state['_page_infos'] = {}
+        return state
+
+    ## Accessors
+
+    def _locate(self, index):
+        """
+        Return the scan, side code and page number
+        of the page with the given INDEX.
+        """
+
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("Page plan index out of range: {}".format(index))
+
+        # Find the segment by bisecting the cumulative page counts
+        i = self._start + index
+        segment = bisect_right(self._offsets, i) - 1
+        first_scan, num_scans, side_codes = self._segments[segment]
+        local = i - self._offsets[segment]
+        num_sides = len(side_codes)
+
+        return (first_scan + local // num_sides,
+                side_codes[local % num_sides],
+                i + 1)
+
+    def get_scan(self, index):
+        return self._locate(index)[0]
+
+    def get_side(self, index):
+        return g_sides[self._locate(index)[1]]
+
+    def get_page(self, index):
+        return self._locate(index)[2]
+
+    def get_index_of_page(self, page):
+        """
+        Return the index of the page with the page number PAGE.
+        """
+
+        # Pages are numbered consecutively starting with 1
+        index = page - 1 - self._start
+        if not 0 <= index < len(self):
+            raise IndexError("Page not in page plan: {}".format(page))
+
+        return index
+
+    def get_index_of_scan(self, scan, side=None):
+        """
+        Return the index of the page on the given SIDE of SCAN.
+        When no SIDE is given, return the index of the first page of SCAN.
+
+        The segments are searched in order, 
+        so the first occurrence of the scan is found.
+        """
+
+        for segment, (first_scan, num_scans, side_codes) in enumerate(self._segments):
+
+            # Is the scan part of the segment?
+            if not first_scan <= scan < first_scan + num_scans:
+                continue
+
+            # Is the side part of the segment?
+            if side is None:
+                side_index = 0
+            elif g_side_codes[side] in side_codes:
+                side_index = side_codes.index(g_side_codes[side])
+            else:
+                continue
+
+            i = self._offsets[segment] + (scan - first_scan) * len(side_codes) + side_index
+            if self._start <= i < self._stop:
+                return i - self._start
+
+        raise IndexError("Scan not in page plan: {} {}".format(scan, side or ''))
+
+    def get_page_spec(self, index):
+        """
+        Return the page spec of the page with the given INDEX.
+        """
+
+        scan, side_code, page = self._locate(index)
+        return self._make_page_spec(scan, side_code, page)
+
+    def get_page_spec_by_page(self, page):
+        """
+        Return the page spec of the page with the page number PAGE.
+        """
+
+        return self.get_page_spec(self.get_index_of_page(page))
+
+    def _make_page_spec(self, scan, side_code, page):
+
+        spec = {
+            'scan': scan,
+            'side': g_sides[side_code],
+            'page': page,
+        }
+        spec.update(self.get_scan_file_infos(scan))
+        spec.update(self.get_page_file_infos(page))
+
+        return spec
+
+    ## File infos
+
+    def get_scan_file_infos(self, scan):
+        """
+        Return the (memoized) file infos of the given SCAN.
+        """
+
+        infos = self._scan_infos.get(scan)
+        if infos is None:
+            with get_run_stats().time('resolve'):
+                infos = self._resolve_scan_file_infos(scan)
+            if len(self._scan_infos) >= g_max_memoized_file_infos:
+                self._scan_infos.clear()
+            self._scan_infos[scan] = infos
+
+        return infos
+
+    def _resolve_scan_file_infos(self, scan):
+
+        scan_dir  = self._source_dir
+        scan_file = None
+        if self._source_index is not None:
+            scan_file = self._source_index.get_file(scan)
+        if scan_file is None:
+            scan_file = self._source_file_format % scan
+        scan_path = str((PosixPath(scan_dir) / scan_file).expanduser())
+
+        return {
+            'scan-dir':  scan_dir,
+            'scan-file': scan_file,
+            'scan-path': scan_path,
+        }
+
+    def get_page_file_infos(self, page):
+        """
+        Return the (memoized) file infos of the given PAGE.
+        """
+
+        infos = self._page_infos.get(page)
+        if infos is None:
+            page_dir  = self._target_dir
+            page_file = self._target_file_format % page
+            page_path = str((PosixPath(page_dir) / page_file).expanduser())
+            infos = {
+                'page-dir':  page_dir,
+                'page-file': page_file,
+                'page-path': page_path,
+            }
+            if len(self._page_infos) >= g_max_memoized_file_infos:
+                self._page_infos.clear()
+            self._page_infos[page] = infos
+
+        return infos
+
+## =========================================================
+## =========================================================
+
+## fin.
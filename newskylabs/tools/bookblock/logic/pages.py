@@ -11,10 +11,10 @@ __license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.
 __date__        = "2019/10/18"
 
 import re
-from pathlib import PosixPath
-from copy import deepcopy
 
-from kivy.logger import Logger
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+from newskylabs.tools.bookblock.logic.pageplan import PagePlan
 
 ## =========================================================
 ## parse_page_spec(page_spec)
@@ -26,6 +26,8 @@ g_regexp_page_spec = re.compile('(\d+)(-(\d+))?(l?)(r?)')
 def parse_page_spec(page_spec):
     """
     Example: 0l,1-3lr,4r,56l
+
+    Raise a ValueError when PAGE_SPEC is malformed.
     """
 
     # DEBUG
@@ -51,7 +53,7 @@ def parse_page_spec(page_spec):
             pages = range(from_page, from_page+1)
                 
         # DEBUG
-        Logger.debug("parse_page_spec(): Pages: {}".format(list(pages)))
+        Logger.debug("parse_page_spec(): Pages: {}".format(pages))
 
         # Which sides should I cut out?
         sides = []
@@ -66,9 +68,50 @@ def parse_page_spec(page_spec):
         return (pages, sides)
 
     else:
-            
-        print("ERROR Malformed page spec: '{}'".format(page_spec), file=sys.stderr)
-        sys.exit(2)
+        raise ValueError("Malformed page spec: '{}'".format(page_spec))
+
+## =========================================================
+## parse_page_target(target)
+## ---------------------------------------------------------
+
+# Examples: 730, 12l, 12r, s12, 50%
+g_regexp_page_number  = re.compile(r'^\s*(\d+)\s*$')
+g_regexp_scan_side    = re.compile(r'^\s*s?(\d+)\s*([lr])\s*$')
+g_regexp_scan         = re.compile(r'^\s*s(\d+)\s*$')
+g_regexp_fraction     = re.compile(r'^\s*(\d+(\.\d*)?)\s*%\s*$')
+
+def parse_page_target(target):
+    """
+    Parse the target of a jump to a page:
+
+    - 730     => ('page', 730)               page number 730
+    - 12l     => ('scan', (12, 'left'))      left side of scan 12
+    - 12r     => ('scan', (12, 'right'))     right side of scan 12
+    - s12     => ('scan', (12, None))        first page of scan 12
+    - 50%     => ('fraction', 0.5)           middle of the book
+
+    Return None when TARGET is malformed.
+    """
+
+    m = g_regexp_page_number.match(target)
+    if m:
+        return ('page', int(m.group(1)))
+
+    m = g_regexp_scan_side.match(target)
+    if m:
+        side = 'left' if m.group(2) == 'l' else 'right'
+        return ('scan', (int(m.group(1)), side))
+
+    m = g_regexp_scan.match(target)
+    if m:
+        return ('scan', (int(m.group(1)), None))
+
+    m = g_regexp_fraction.match(target)
+    if m:
+        return ('fraction', float(m.group(1)) / 100)
+
+    Logger.debug("parse_page_target(): Malformed page target: {}".format(target))
+    return None
 
 ## =========================================================
 ## class Pages:
@@ -91,30 +134,20 @@ class Pages:
         # '0l,1-3lr,56l' => ['0l', '1-3lr', '56l']
         pages = self._settings.get_pages()
         page_specs = pages.split(",")
-    
-        page = 1
-        pages = []
+
+        # Compile the page specs into a compact page plan.
+        # The ranges of scans are not expanded -
+        # the pages are generated lazily on demand
+        plan = PagePlan.from_settings(self._settings)
         for page_spec in page_specs:
             scan_pages, sides = parse_page_spec(page_spec)
-
-            for scan in scan_pages:
-
-                for side in sides:
-
-                    page_spec = {
-                        'scan': scan,
-                        'side': side,
-                        'page': page,
-                    }
-                    pages.append(page_spec)
-
-                    page += 1
+            plan.append_segment(scan_pages, sides)
                 
         ## DEBUG
-        Logger.debug("Pages:pages: {}".format(pages))
+        Logger.debug("Pages: Number of pages: {}".format(len(plan)))
 
-        self._pages = pages
-        self._num_pages = len(pages)
+        self._pages = plan
+        self._num_pages = len(plan)
         self._first_page = 0
         self._last_page = self._num_pages -1
         self._current_page = 0
@@ -126,37 +159,29 @@ class Pages:
         self._current_page = 0
 
     def add_file_infos(self, spec):
+        spec.update(self._pages.get_scan_file_infos(spec['scan']))
+        spec.update(self._pages.get_page_file_infos(spec['page']))
 
-        scan_dir = self._settings.get_source_dir()
-        spec['scan-dir'] = scan_dir
-
-        formatstr = self._settings.get_source_file_format()
-        scan_file = formatstr % spec['scan']
-        spec['scan-file'] = scan_file
-
-        scan_path = str((PosixPath(scan_dir) / scan_file).expanduser())
-        spec['scan-path'] = scan_path
-        
-        page_dir = self._settings.get_target_dir()
-        spec['page-dir'] = page_dir
+    def get_pages(self):
+        """
+        Return the page plan of all pages.  
 
-        formatstr = self._settings.get_target_file_format()
-        page_file = formatstr % spec['page']
-        spec['page-file'] = page_file
+        Iterating over the page plan yields the page specs 
+        including the file infos.
+        """
+        return self._pages
 
-        page_path = str((PosixPath(page_dir) / page_file).expanduser())
-        spec['page-path'] = page_path
+    def get_scan_groups(self):
+        """
+        Return an iterator over the page specs of all pages 
+        grouped by scan as (scan, page_specs) pairs 
+        (see PagePlan.iter_scan_groups()).
 
-    def get_pages(self):
-        
-        # Get the page specs of all pages
-        page_specs = deepcopy(self._pages)
-
-        # Add file infos
-        for page_spec in page_specs:
-            self.add_file_infos(page_spec)
+        The groups are created lazily - 
+        no page spec is created up front.
+        """
 
-        return page_specs
+        return self._pages.iter_scan_groups()
 
     def get_previous_page(self):
 
@@ -167,9 +192,17 @@ class Pages:
             return self.get_current_page()
 
     def get_current_page(self):
-        spec = self._pages[self._current_page]
-        self.add_file_infos(spec)
-        return spec
+        return self.get_page_spec(self._current_page)
+
+    def get_current_index(self):
+        return self._current_page
+
+    def get_page_spec(self, index):
+        """
+        Return the page spec with the given INDEX
+        without moving the current page.
+        """
+        return self._pages.get_page_spec(index)
 
     def get_next_page(self):
 
@@ -181,12 +214,62 @@ class Pages:
 
         pass
 
+    def move(self, delta):
+        """
+        Move the current page by DELTA pages
+        (stopping at the first and last page).
+        Return the page spec of the new current page.
+        """
+
+        index = self._current_page + delta
+        self._current_page = min(max(index, self._first_page), self._last_page)
+        return self.get_current_page()
+
+    def seek_page(self, page):
+        """
+        Make the page with the page number PAGE the current page.
+        Return its page spec or None when there is no such page.
+        """
+
+        try:
+            index = self._pages.get_index_of_page(page)
+        except IndexError:
+            return None
+
+        self._current_page = index
+        return self.get_current_page()
+
+    def seek_scan(self, scan, side=None):
+        """
+        Make the page on the given SIDE of SCAN the current page.
+        When no SIDE is given, the first page of SCAN is used.
+        Return its page spec or None when there is no such page.
+        """
+
+        try:
+            index = self._pages.get_index_of_scan(scan, side)
+        except IndexError:
+            return None
+
+        self._current_page = index
+        return self.get_current_page()
+
+    def seek_fraction(self, fraction):
+        """
+        Make the page at FRACTION (0.0 - 1.0) of the book the current page.
+        Return its page spec.
+        """
+
+        fraction = min(max(fraction, 0.0), 1.0)
+        self._current_page = int(round(fraction * self._last_page))
+        return self.get_current_page()
+
     def is_first_page(self):
         first_image_index = 0
         return self._current_page == first_image_index
 
     def is_last_page(self):
-        last_image_index = len(self._pages) - 1
+        last_image_index = self._num_pages - 1
         return self._current_page == last_image_index
 
     def print_current_page(self):
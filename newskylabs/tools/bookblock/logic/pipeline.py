@@ -0,0 +1,168 @@
+"""newskylabs/tools/bookblock/logic/pipeline.py
+
+Streaming page generation pipeline.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from threading import Thread
+from queue import Queue
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+from newskylabs.tools.bookblock.logic.profiler import get_profiler
+
+## =========================================================
+## class PagePipeline
+## ---------------------------------------------------------
+
+class PagePipeline:
+    """
+    Generate and store pages in a streaming pipeline
+    consisting of three stages linked by bounded queues:
+
+      reader  --> decoder / cropper --> encoder / writer
+
+    - The reader thread reads the encoded scan files from disk.
+    - The decoder thread decodes the scans and cuts out the pages.
+    - The encoder / writer stage (running in the calling thread)
+      encodes the pages and writes them to disk.
+
+    This way disk I/O overlaps with the CPU bound work.  The queue
+    depth caps the number of scans held in each queue - and therefore
+    the number of decoded scans held in memory at once.
+    """
+
+    def __init__(self, page, queue_depth=2):
+        self._page = page
+        self._queue_depth = max(1, queue_depth)
+
+    def run(self, scan_groups):
+        """
+        Store the pages of all (scan, page_specs) pairs in SCAN_GROUPS.
+
+        Return the list of (scan, error) pairs
+        of the scans which could not be processed.
+        """
+
+        Logger.debug("PagePipeline: Generating pages with queue depth {}"\
+                     .format(self._queue_depth))
+
+        read_queue   = Queue(maxsize=self._queue_depth)
+        decode_queue = Queue(maxsize=self._queue_depth)
+
+        profiler = get_profiler()
+        reader = Thread(target=profiler.wrap('apply', self._read),
+                        args=(scan_groups, read_queue),
+                        name='bookblock-reader',
+                        daemon=True)
+        decoder = Thread(target=profiler.wrap('apply', self._decode),
+                         args=(read_queue, decode_queue),
+                         name='bookblock-decoder',
+                         daemon=True)
+        reader.start()
+        decoder.start()
+
+        failures = self._write(decode_queue)
+
+        reader.join()
+        decoder.join()
+
+        return failures
+
+    def _read(self, scan_groups, read_queue):
+        """
+        Reader stage: read the encoded scan files.
+        """
+
+        try:
+            for scan, page_specs in scan_groups:
+                try:
+                    scan_file_data = self._page.read_scan_file(page_specs[0])
+                    read_queue.put((scan, page_specs, scan_file_data, None))
+                except (Exception, SystemExit) as error:
+                    read_queue.put((scan, page_specs, None, error))
+
+        finally:
+            # Signal the end of the stream -
+            # also when the scan groups cannot be generated
+            read_queue.put(None)
+
+    def _decode(self, read_queue, decode_queue):
+        """
+        Decoder stage: decode the scans and cut out the pages.
+        """
+
+        try:
+            while True:
+                item = read_queue.get()
+                if item is None:
+                    break
+
+                scan, page_specs, scan_file_data, error = item
+                pages = None
+                if error is None:
+                    try:
+                        pages = self._cut_pages(page_specs, scan_file_data)
+                    except (Exception, SystemExit) as decode_error:
+                        error = decode_error
+
+                decode_queue.put((scan, page_specs, pages, error))
+
+        finally:
+            # Signal the end of the stream -
+            # even when the decoder fails unexpectedly,
+            # as the writer would wait forever otherwise
+            decode_queue.put(None)
+
+    def _cut_pages(self, page_specs, scan_file_data):
+        """
+        Decode the scan and cut out all pages of PAGE_SPECS.
+        """
+
+        # Decode the scan
+        scan_data = self._page.decode_scan(scan_file_data)
+        if scan_data is None:
+            raise ValueError("Could not decode scan: {}"\
+                             .format(page_specs[0]['scan-path']))
+
+        # Cut out the pages
+        return [self._page.cut_page(scan_data, page_spec)
+                for page_spec in page_specs]
+
+    def _write(self, decode_queue):
+        """
+        Encoder / writer stage: encode the pages and write them to disk.
+        """
+
+        failures = []
+        while True:
+            item = decode_queue.get()
+            if item is None:
+                break
+
+            scan, page_specs, pages, error = item
+            if error is not None:
+                failures.append((scan, error))
+                continue
+
+            try:
+                for page_spec, page in zip(page_specs, pages):
+                    page_path = page_spec['page-path']
+                    page_file_data = self._page.encode_page(page, page_path)
+                    self._page.write_page_file(page_file_data, page_path)
+                    print("Generated page {}".format(page_path))
+            except Exception as error:
+                failures.append((scan, error))
+
+        return failures
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,104 @@
+"""newskylabs/tools/bookblock/logic/prefetcher.py
+
+Background prefetching of neighbouring scans.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from concurrent.futures import ThreadPoolExecutor
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+from newskylabs.tools.bookblock.logic.profiler import get_profiler
+
+## =========================================================
+## class Prefetcher
+## ---------------------------------------------------------
+
+class Prefetcher:
+    """
+    Decode the scans of the pages next to the current page 
+    in background threads while the current page is inspected.
+
+    The pages are prefetched relative to the current page of PAGES
+    in the direction of navigation: NUM_AHEAD pages ahead and
+    NUM_BEHIND pages behind.  When the direction of navigation
+    changes, the pending prefetches which are not needed anymore are
+    cancelled.
+    """
+
+    def __init__(self, page, pages, num_ahead=2, num_behind=1, num_threads=2):
+        self._page = page
+        self._pages = pages
+        self._num_ahead = num_ahead
+        self._num_behind = num_behind
+        self._executor = ThreadPoolExecutor(max_workers=num_threads,
+                                            thread_name_prefix='bookblock-prefetch')
+
+        # Pending prefetches: page index -> future
+        self._futures = {}
+
+        # Navigation state
+        self._last_index = None
+        self._direction = 1
+
+    def update(self):
+        """
+        Prefetch the neighbours of the current page.
+        To be called after each navigation step.
+        """
+
+        index = self._pages.get_current_index()
+
+        # Direction of navigation
+        if self._last_index is not None and index != self._last_index:
+            direction = 1 if index > self._last_index else -1
+            if direction != self._direction:
+                Logger.debug("Prefetcher: Direction changed to {}".format(direction))
+            self._direction = direction
+        self._last_index = index
+
+        # Page indices to be prefetched -
+        # nearest pages first
+        num_pages = self._pages.get_number_of_images()
+        wanted = []
+        for distance in range(1, max(self._num_ahead, self._num_behind) + 1):
+            if distance <= self._num_ahead:
+                wanted.append(index + distance * self._direction)
+            if distance <= self._num_behind:
+                wanted.append(index - distance * self._direction)
+        wanted = [i for i in wanted if 0 <= i < num_pages]
+
+        # Cancel stale prefetches
+        for i in list(self._futures):
+            if i not in wanted:
+                if self._futures[i].cancel():
+                    Logger.debug("Prefetcher: Cancelled prefetching page index {}".format(i))
+                del self._futures[i]
+
+        # Start new prefetches
+        for i in wanted:
+            if i not in self._futures:
+                page_spec = self._pages.get_page_spec(i)
+                prefetch = get_profiler().wrap('navigation', self._page.prefetch)
+                self._futures[i] = self._executor.submit(prefetch, page_spec)
+
+    def shutdown(self):
+        """
+        Cancel all pending prefetches and stop the prefetch threads.
+        """
+
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,311 @@
+"""newskylabs/tools/bookblock/logic/preflight.py
+
+Preflight check of the pages to be generated.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import sys, os
+from pathlib import PosixPath
+from time import perf_counter
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+from newskylabs.tools.bookblock.logic.page import g_regexp_geometry
+from newskylabs.tools.bookblock.logic.imageheader import probe_image_size
+from newskylabs.tools.bookblock.logic.sourceindex import list_files
+
+## =========================================================
+## class Preflight
+## ---------------------------------------------------------
+
+# Number of bytes per pixel of the decoded scans
+g_bytes_per_pixel = {
+    'color':     3,
+    'grayscale': 1,
+}
+
+class Preflight:
+    """
+    A fast check of all pages before they are generated.
+
+    - The scan paths are resolved with a single listing of each
+      source directory - shared with the source index (see
+      list_files()) - instead of a stat per page.
+    - The size of each scan is read from its image header without
+      decoding any pixels.
+    - The bounding box of each page is checked to fit into its scan.
+    - The scans are walked one by one with the sides of each scan
+      (see PagePlan.iter_scans()) - no page spec is created.
+
+    All problems are collected and reported at once - instead of
+    stopping in the middle of a run when a missing scan is reached.
+
+    The collected sizes allow to estimate the number of pixels and
+    bytes to be processed and - after timing a sample scan - the
+    expected runtime (see print_report()).
+    """
+
+    def __init__(self, settings, pages, page):
+        self._settings = settings
+        self._pages = pages
+        self._page = page
+
+        # Directory listings: directory -> set of file names
+        self._listings = {}
+
+        # Problems preventing the pages from being generated
+        self._problems = []
+
+        # Issues which do not prevent generating the pages
+        self._warnings = []
+
+        # Scan infos: scan path -> (size, file size)
+        self._scans = {}
+
+        # Bounding boxes: (scan size, side) -> bounding box
+        self._bounding_boxes = {}
+
+        # Statistics
+        self._num_pages = 0
+        self._page_pixels = 0
+
+    def run(self):
+        """
+        Check all pages.  Return self.
+        """
+
+        self.check_target_dir()
+        if not self.check_geometry():
+            # Without a valid geometry
+            # the bounding boxes can not be checked
+            return self
+
+        self._num_pages = len(self._pages)
+        for scan, sides, page in self._pages.iter_scans():
+            self.check_scan(scan, sides, page)
+
+        return self
+
+    def check_target_dir(self):
+
+        target_dir = PosixPath(self._settings.get_target_dir()).expanduser()
+        if not target_dir.is_dir():
+            self._problems.append("Target directory not found: {}".format(target_dir))
+        elif not os.access(str(target_dir), os.W_OK):
+            self._problems.append("Target directory not writable: {}".format(target_dir))
+
+    def check_geometry(self):
+
+        geometry = self._settings.get_geometry()
+        if not geometry or not g_regexp_geometry.match(geometry):
+            self._problems.append("Malformed geometry: '{}'".format(geometry))
+            return False
+
+        return True
+
+    def check_scan(self, scan, sides, page):
+        """
+        Check the pages on the given SIDES of SCAN
+        starting with the page number PAGE.
+        """
+
+        scan_path = self._pages.get_scan_file_infos(scan)['scan-path']
+
+        # Probe the scan only once
+        scan_info = self._scans.get(scan_path)
+        if scan_info is None:
+            scan_info = self.probe_scan(scan, scan_path)
+            self._scans[scan_path] = scan_info
+
+        scan_size, file_size = scan_info
+        if scan_size is None:
+            return
+
+        # Does the bounding box fit into the scan?
+        scan_height, scan_width = scan_size
+        for page, side in enumerate(sides, page):
+            (x1, y1), (x2, y2) = self.get_bounding_box(scan_size, side)
+            if x1 < 0 or y1 < 0 or x2 >= scan_width or y2 >= scan_height:
+                self._problems.append(
+                    "Bounding box ({}, {}) - ({}, {}) of page {} [scan {}, {} side] "
+                    "exceeds the scan size {}x{}: {}"\
+                    .format(x1, y1, x2, y2, page, scan, side,
+                            scan_width, scan_height, scan_path))
+                continue
+
+            self._page_pixels += (x2 - x1 + 1) * (y2 - y1 + 1)
+
+    def get_bounding_box(self, scan_size, side):
+        """
+        Return the (memoized) bounding box 
+        of the page on SIDE of a scan of SCAN_SIZE.
+        """
+
+        key = (scan_size, side)
+        bounding_box = self._bounding_boxes.get(key)
+        if bounding_box is None:
+            bounding_box = self._page.calculate_bounding_box({'side': side}, scan_size)
+            self._bounding_boxes[key] = bounding_box
+
+        return bounding_box
+
+    def probe_scan(self, scan, scan_path):
+        """
+        Return the size (height, width) and file size 
+        of SCAN stored at SCAN_PATH - or None for unknown values.
+        """
+
+        if not self.is_listed(scan_path):
+            self._problems.append("Scan {} not found: {}"\
+                                  .format(scan, scan_path))
+            return (None, None)
+
+        try:
+            file_size = os.stat(scan_path).st_size
+            scan_size = probe_image_size(scan_path)
+        except OSError as error:
+            self._problems.append("Scan {} not readable: {}: {}"\
+                                  .format(scan, scan_path, error))
+            return (None, None)
+
+        if scan_size is None:
+            self._warnings.append("Size of scan {} unknown - "
+                                  "bounding boxes not checked: {}"\
+                                  .format(scan, scan_path))
+
+        return (scan_size, file_size)
+
+    def is_listed(self, path):
+        """
+        Does the file PATH exist?
+
+        The directory of PATH is looked up in the cached listings of
+        list_files() - the source directory has normally been listed
+        by the source index already.
+        """
+
+        directory, name = os.path.split(path)
+        listing = self._listings.get(directory)
+        if listing is None:
+            try:
+                listing = set(list_files(directory))
+            except OSError as error:
+                Logger.debug("Preflight: Cannot list {}: {}".format(directory, error))
+                listing = set()
+            self._listings[directory] = listing
+
+        return name in listing
+
+    def is_ok(self):
+        return not self._problems
+
+    def get_problems(self):
+        return self._problems
+
+    def get_warnings(self):
+        return self._warnings
+
+    def print_problems(self):
+        """
+        Print all problems and warnings to stderr.
+        """
+
+        for warning in self._warnings:
+            print("WARNING {}".format(warning), file=sys.stderr)
+
+        for problem in self._problems:
+            print("ERROR {}".format(problem), file=sys.stderr)
+
+        if self._problems:
+            print("ERROR Preflight check failed: {} problems found."\
+                  .format(len(self._problems)), file=sys.stderr)
+
+    def get_estimates(self):
+        """
+        Return a dictionary with the estimated amounts of data to be processed.
+        """
+
+        bytes_per_pixel = g_bytes_per_pixel.get(self._settings.get_image_mode(), 3)
+        scan_infos = [info for info in self._scans.values() if info[0] is not None]
+        scan_pixels = sum(height * width for (height, width), file_size in scan_infos)
+
+        return {
+            'pages':         self._num_pages,
+            'scans':         len(self._scans),
+            'scan-bytes':    sum(file_size for scan_size, file_size in scan_infos),
+            'scan-pixels':   scan_pixels,
+            'decoded-bytes': scan_pixels * bytes_per_pixel,
+            'page-pixels':   self._page_pixels,
+            'page-bytes':    self._page_pixels * bytes_per_pixel,
+        }
+
+    def time_sample_scan(self):
+        """
+        Decode the first scan and cut out and encode its pages
+        (without writing them).  Return the time taken in seconds
+        and the number of pages - or None when there is no readable scan.
+        """
+
+        for scan, page_specs in self._pages.iter_scan_groups():
+            scan_path = page_specs[0]['scan-path']
+            if self._scans.get(scan_path, (None, None))[0] is None:
+                continue
+
+            start = perf_counter()
+            scan_data = self._page.decode_scan(self._page.read_file(scan_path))
+            if scan_data is None:
+                continue
+            for page_spec in page_specs:
+                page = self._page.cut_page(scan_data, page_spec)
+                self._page.encode_page(page, page_spec['page-path'])
+            return perf_counter() - start, len(page_specs)
+
+        return None
+
+    def print_report(self):
+        """
+        Print a dry run report:
+        the problems found and the estimated amounts of data and runtime.
+        """
+
+        self.print_problems()
+
+        estimates = self.get_estimates()
+        megabyte = 1024.0 * 1024.0
+        megapixel = 1000.0 * 1000.0
+
+        print("")
+        print("Dry run:")
+        print("")
+        print("  - pages:              {}".format(estimates['pages']))
+        print("  - scans:              {}".format(estimates['scans']))
+        print("  - scan files:         {:.1f} MB".format(estimates['scan-bytes'] / megabyte))
+        print("  - scan pixels:        {:.1f} MPixel ({:.1f} MB decoded)"\
+              .format(estimates['scan-pixels'] / megapixel,
+                      estimates['decoded-bytes'] / megabyte))
+        print("  - page pixels:        {:.1f} MPixel ({:.1f} MB uncompressed)"\
+              .format(estimates['page-pixels'] / megapixel,
+                      estimates['page-bytes'] / megabyte))
+
+        # Estimate the runtime by timing a sample scan
+        sample = self.time_sample_scan() if self.is_ok() else None
+        if sample is not None:
+            seconds, num_pages = sample
+            jobs = max(1, self._settings.get_jobs() or 1)
+            seconds_per_page = seconds / num_pages
+            runtime = seconds_per_page * estimates['pages'] / jobs
+            print("  - estimated runtime:  {:.1f} s "
+                  "({:.3f} s per page, {} worker processes)"\
+                  .format(runtime, seconds_per_page, jobs))
+        print("")
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,337 @@
+"""newskylabs/tools/bookblock/logic/profiler.py
+
+Built-in profiler.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import sys, os, cProfile, pstats
+from pathlib import PosixPath
+from threading import Thread, Event, Lock, local, get_ident, current_thread, enumerate as enumerate_threads
+from time import strftime
+from contextlib import contextmanager
+from functools import wraps
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## class Profiler
+## ---------------------------------------------------------
+
+# What can be profiled:
+# - session:    the whole session
+# - navigation: loading and showing pages in the GUI
+# - apply:      generating and storing the pages
+g_profile_targets = ('session', 'navigation', 'apply')
+
+# Default directory of the profiles
+g_profile_dir = '~/.bookblock/profiles'
+
+# Interval of the stack sampler in seconds
+g_sample_interval = 0.005
+
+class Profiler:
+    """
+    Profiles a session or one of its stages with two profilers:
+
+    - cProfile: a deterministic profile of each thread taking part
+      in the profiled stage - merged and written as .pstats file
+      (see `python -m pstats' or snakeviz),
+
+    - a stack sampler: the stacks of the threads taking part in the
+      profiled stage are sampled every few milliseconds and written
+      in the collapsed stack format of flamegraph.pl / speedscope.
+
+    The stages are marked in the code with:
+
+      with get_profiler().section('navigation'):
+          ...
+
+    or with the @profiled('navigation') decorator - and functions
+    running in other threads with:
+
+      executor.submit(get_profiler().wrap('navigation', function), ...)
+
+    As long as the profiler has not been started, both cost next to
+    nothing.
+
+    Note: Worker processes (--jobs) are not profiled.
+    """
+
+    def __init__(self):
+        self._target = None
+        self._profile_dir = None
+        self._lock = Lock()
+
+        # Per thread: cProfile profile and section depth
+        self._thread_state = local()
+
+        # All profiles - to be merged
+        self._profiles = []
+
+        # Ids of the threads in a profiled section
+        self._active_threads = set()
+
+        # The profile of the main thread in session mode
+        self._session_profile = None
+
+        # Stack sampler
+        self._sampler = None
+        self._stop_sampler = Event()
+        self._samples = {}
+
+    def start(self, target, profile_dir=None):
+        """
+        Start profiling TARGET (see g_profile_targets).
+        """
+
+        if target not in g_profile_targets:
+            raise ValueError("Undefined profile target: {} - use one of: {}"\
+                             .format(target, ', '.join(g_profile_targets)))
+
+        self._target = target
+        self._profile_dir = profile_dir or g_profile_dir
+
+        # In session mode the main thread is profiled from now on
+        if target == 'session':
+            self._session_profile = self._enter(current_thread().ident)
+
+        self._stop_sampler.clear()
+        self._sampler = Thread(target=self._sample,
+                               name='bookblock-profiler',
+                               daemon=True)
+        self._sampler.start()
+
+        Logger.info("Profiler: Profiling {}".format(target))
+
+    def is_active(self):
+        return self._target is not None
+
+    def is_profiled(self, stage):
+        """
+        Is STAGE profiled?
+        """
+
+        return self._target == 'session' or self._target == stage
+
+    @contextmanager
+    def section(self, stage):
+        """
+        Profile the current thread while in the section -
+        when STAGE is profiled.
+        """
+
+        if not self.is_profiled(stage):
+            yield
+            return
+
+        thread_id = get_ident()
+        self._enter(thread_id)
+        try:
+            yield
+        finally:
+            self._exit(thread_id)
+
+    def wrap(self, stage, function):
+        """
+        Return FUNCTION wrapped into a section of STAGE -
+        for functions running in other threads.
+        """
+
+        if not self.is_profiled(stage):
+            return function
+
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            with self.section(stage):
+                return function(*args, **kwargs)
+
+        return profiled
+
+    def _enter(self, thread_id):
+
+        state = self._thread_state
+        if not hasattr(state, 'profile'):
+            state.profile = cProfile.Profile()
+            state.depth = 0
+            with self._lock:
+                self._profiles.append(state.profile)
+
+        if state.depth == 0:
+            try:
+                state.profile.enable()
+            except ValueError:
+                # Python >= 3.12: only one profile can be enabled
+                # at a time - it covers all threads
+                pass
+
+            with self._lock:
+                self._active_threads.add(thread_id)
+
+        state.depth += 1
+        return state.profile
+
+    def _exit(self, thread_id):
+
+        state = self._thread_state
+        state.depth -= 1
+        if state.depth == 0:
+            state.profile.disable()
+            with self._lock:
+                self._active_threads.discard(thread_id)
+
+    ## Stack sampler
+
+    def _sample(self):
+        """
+        Sample the stacks of the profiled threads
+        until the profiler is stopped.
+        """
+
+        sampler_id = get_ident()
+        while not self._stop_sampler.wait(g_sample_interval):
+
+            with self._lock:
+                active_threads = set(self._active_threads)
+
+            thread_names = {thread.ident: thread.name for thread in enumerate_threads()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                if self._target != 'session' and thread_id not in active_threads:
+                    continue
+
+                stack = get_collapsed_stack(frame, thread_names.get(thread_id, thread_id))
+                with self._lock:
+                    self._samples[stack] = self._samples.get(stack, 0) + 1
+
+    ## Results
+
+    def stop(self):
+        """
+        Stop profiling.
+        """
+
+        if self._sampler is not None:
+            self._stop_sampler.set()
+            self._sampler.join()
+            self._sampler = None
+
+        if self._session_profile is not None:
+            self._exit(current_thread().ident)
+            self._session_profile = None
+
+        self._target = None
+
+    def write(self, mode):
+        """
+        Stop profiling and write the merged cProfile profiles (.pstats)
+        and the collapsed stacks (.collapsed.txt) of the session
+        (MODE = 'batch' or 'gui') into the profile directory.
+
+        Return the paths of both files - or None when nothing has been
+        profiled.
+        """
+
+        if not self.is_active():
+            return None
+
+        target = self._target
+        self.stop()
+
+        profile_dir = PosixPath(self._profile_dir).expanduser()
+        base_name = 'bookblock-{}-{}-{}-{}'\
+            .format(mode, target, strftime('%Y%m%d-%H%M%S'), os.getpid())
+        pstats_path = profile_dir / (base_name + '.pstats')
+        collapsed_path = profile_dir / (base_name + '.collapsed.txt')
+
+        with self._lock:
+            profiles = list(self._profiles)
+            samples = dict(self._samples)
+
+        try:
+            profile_dir.mkdir(parents=True, exist_ok=True)
+
+            stats = None
+            for profile in profiles:
+                profile.create_stats()
+                if not profile.stats:
+                    continue
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            if stats is None:
+                Logger.warning("Profiler: Nothing has been profiled.")
+                return None
+            stats.dump_stats(str(pstats_path))
+
+            with collapsed_path.open('w') as collapsed_file:
+                for stack, count in sorted(samples.items()):
+                    collapsed_file.write('{} {}\n'.format(stack, count))
+
+        except OSError as error:
+            Logger.warning("Profiler: Failed to write the profile {}: {}"\
+                           .format(pstats_path, error))
+            return None
+
+        Logger.info("Profiler: Profile written to {}".format(pstats_path))
+        return (str(pstats_path), str(collapsed_path))
+
+def get_collapsed_stack(frame, thread_name):
+    """
+    Return the stack of FRAME in collapsed stack format:
+    thread;outermost function;...;innermost function
+    """
+
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_name,
+                                         os.path.basename(code.co_filename),
+                                         code.co_firstlineno))
+        frame = frame.f_back
+    names.append(str(thread_name))
+
+    # Semicolons separate the frames
+    return ';'.join(name.replace(';', ':') for name in reversed(names))
+
+## =========================================================
+## get_profiler()
+## ---------------------------------------------------------
+
+# The profiler of the current process
+g_profiler = Profiler()
+
+def get_profiler():
+    """
+    Return the profiler of the current process.
+    """
+    return g_profiler
+
+def profiled(stage):
+    """
+    Decorator running the decorated function
+    in a profiler section of STAGE.
+    """
+
+    def decorate(function):
+
+        @wraps(function)
+        def profiled_function(*args, **kwargs):
+            with g_profiler.section(stage):
+                return function(*args, **kwargs)
+
+        return profiled_function
+
+    return decorate
+
+## =========================================================
+## =========================================================
+
+## fin.
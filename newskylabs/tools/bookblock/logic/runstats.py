@@ -0,0 +1,319 @@
+"""newskylabs/tools/bookblock/logic/runstats.py
+
+Per-stage timing statistics and run reports.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import os, json, math
+from pathlib import PosixPath
+from threading import Lock
+from time import perf_counter, time, strftime, localtime
+from contextlib import contextmanager
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## Stages
+## ---------------------------------------------------------
+
+# The stages of generating and showing a page - in processing order
+g_stages = (
+    'resolve',  # resolving the scan paths
+    'read',     # reading the encoded scan files
+    'decode',   # decoding the scans
+    'crop',     # cutting out the pages
+    'convert',  # converting the pixel data for the texture
+    'encode',   # encoding the pages
+    'write',    # writing the page files
+    'upload',   # uploading the texture
+)
+
+# Resolution of the latency histograms:
+# each power of two is divided into 4 buckets (~19% wide)
+g_buckets_per_octave = 4
+
+# Default directory of the run reports
+g_report_dir = '~/.bookblock/reports'
+
+## =========================================================
+## class StageStats
+## ---------------------------------------------------------
+
+class StageStats:
+    """
+    Count, total, minimum, maximum and a log scale latency histogram
+    of the durations of one stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+        # Bucket index -> count
+        self.histogram = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+        bucket = get_bucket(seconds)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def merge(self, state):
+        """
+        Merge the state of another StageStats (see get_state()).
+        """
+
+        if not state['count']:
+            return
+
+        self.count += state['count']
+        self.total += state['total']
+        self.min = state['min'] if self.min is None else min(self.min, state['min'])
+        self.max = state['max'] if self.max is None else max(self.max, state['max'])
+        for bucket, count in state['histogram'].items():
+            bucket = int(bucket)
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + count
+
+    def get_state(self):
+        return {
+            'count':     self.count,
+            'total':     self.total,
+            'min':       self.min,
+            'max':       self.max,
+            'histogram': dict(self.histogram),
+        }
+
+    def get_percentile(self, percentile):
+        """
+        Return the upper bound of the histogram bucket
+        containing the given PERCENTILE (0 - 100) in seconds.
+        """
+
+        if not self.count:
+            return None
+
+        rank = percentile / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return min(get_bucket_upper_bound(bucket), self.max)
+
+        return self.max
+
+    def get_summary(self):
+        """
+        Return a summary of the stage in milliseconds.
+        """
+
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000.0, 3)
+
+        return {
+            'count':    self.count,
+            'total-ms': ms(self.total),
+            'mean-ms':  ms(self.total / self.count) if self.count else None,
+            'min-ms':   ms(self.min),
+            'p50-ms':   ms(self.get_percentile(50)),
+            'p95-ms':   ms(self.get_percentile(95)),
+            'p99-ms':   ms(self.get_percentile(99)),
+            'max-ms':   ms(self.max),
+            'histogram': {
+                str(ms(get_bucket_upper_bound(bucket))): count
+                for bucket, count in sorted(self.histogram.items())
+            },
+        }
+
+def get_bucket(seconds):
+    """
+    Return the histogram bucket of a duration of SECONDS.
+    """
+
+    microseconds = max(seconds * 1e6, 1.0)
+    return int(math.floor(math.log2(microseconds) * g_buckets_per_octave))
+
+def get_bucket_upper_bound(bucket):
+    """
+    Return the upper bound of BUCKET in seconds.
+    """
+
+    return 2.0 ** ((bucket + 1) / g_buckets_per_octave) / 1e6
+
+## =========================================================
+## class RunStats
+## ---------------------------------------------------------
+
+class RunStats:
+    """
+    Per-stage timing statistics and counters of a run.
+
+    The stages are timed with:
+
+      with run_stats.time('decode'):
+          ...
+
+    and the counters are incremented with:
+
+      run_stats.count('bytes-read', len(data))
+
+    RunStats is thread-safe.  Worker processes collect their own
+    statistics and send them to the main process (see take_state()
+    and merge()).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+            self._start_time = time()
+            self._start = perf_counter()
+
+    @contextmanager
+    def time(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter() - start)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.add(seconds)
+
+    def count(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def get_state(self):
+        """
+        Return the statistics as picklable / JSON serializable dictionary.
+        """
+
+        with self._lock:
+            return {
+                'stages':   {stage: stats.get_state()
+                             for stage, stats in self._stages.items()},
+                'counters': dict(self._counters),
+            }
+
+    def take_state(self):
+        """
+        Return the statistics collected so far (see get_state())
+        and start collecting anew - used by worker processes
+        which handle more than one task.
+        """
+
+        state = self.get_state()
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+
+        return state
+
+    def merge(self, state):
+        """
+        Merge the statistics STATE of a worker process.
+        """
+
+        with self._lock:
+            for stage, stage_state in state['stages'].items():
+                stats = self._stages.get(stage)
+                if stats is None:
+                    stats = self._stages[stage] = StageStats()
+                stats.merge(stage_state)
+
+            for counter, n in state['counters'].items():
+                self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def get_report(self, mode):
+        """
+        Return the run report as dictionary.
+        """
+
+        megabyte = 1024.0 * 1024.0
+
+        with self._lock:
+            elapsed = perf_counter() - self._start
+            counters = dict(self._counters)
+            pages = counters.get('pages-written', 0)
+            stage_names = [stage for stage in g_stages if stage in self._stages] + \
+                sorted(stage for stage in self._stages if stage not in g_stages)
+
+            return {
+                'mode':             mode,
+                'started':          strftime('%Y-%m-%dT%H:%M:%S', localtime(self._start_time)),
+                'elapsed-seconds':  round(elapsed, 3),
+                'pages':            pages,
+                'pages-per-second': round(pages / elapsed, 3) if elapsed > 0 else None,
+                'mb-read':          round(counters.get('bytes-read', 0) / megabyte, 3),
+                'mb-written':       round(counters.get('bytes-written', 0) / megabyte, 3),
+                'counters':         counters,
+                'stages':           {stage: self._stages[stage].get_summary()
+                                     for stage in stage_names},
+            }
+
+    def write_report(self, mode, report_path=None):
+        """
+        Write the run report as JSON file to REPORT_PATH -
+        by default into ~/.bookblock/reports/.
+
+        Return the path of the report.
+        """
+
+        report = self.get_report(mode)
+
+        if report_path is None:
+            report_dir = PosixPath(g_report_dir).expanduser()
+            report_name = 'bookblock-{}-{}-{}.json'\
+                .format(mode, strftime('%Y%m%d-%H%M%S'), os.getpid())
+            report_path = report_dir / report_name
+        else:
+            report_path = PosixPath(report_path).expanduser()
+
+        try:
+            report_path.parent.mkdir(parents=True, exist_ok=True)
+            with report_path.open('w') as report_file:
+                json.dump(report, report_file, indent=2)
+        except OSError as error:
+            Logger.warning("RunStats: Failed to write the run report {}: {}"\
+                           .format(report_path, error))
+            return None
+
+        Logger.info("RunStats: Run report written to {}".format(report_path))
+        return str(report_path)
+
+## =========================================================
+## get_run_stats()
+## ---------------------------------------------------------
+
+# The statistics of the current run (or worker process)
+g_run_stats = RunStats()
+
+def get_run_stats():
+    """
+    Return the statistics of the current run.
+    """
+    return g_run_stats
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,184 @@
+"""newskylabs/tools/bookblock/logic/scancache.py
+
+LRU cache of decoded scans.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from collections import OrderedDict
+from threading import Lock, Event
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## class ScanCache
+## ---------------------------------------------------------
+
+class ScanCache:
+    """
+    A least recently used cache of decoded scans.
+
+    The size of the cache is limited by a memory budget in bytes.
+    Each entry is counted by the size of its numpy array
+    (ndarray.nbytes).  When a new entry does not fit into the budget
+    the least recently used entries are evicted.
+
+    The cached arrays are marked read-only as they are shared
+    by all users of the cache.
+    """
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+        # Events signalling the end of scans currently being loaded
+        self._loading = {}
+
+        # Statistics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """
+        Return the scan cached under KEY or None.
+        """
+
+        with self._lock:
+            scan_data = self._entries.get(key)
+            if scan_data is None:
+                self._misses += 1
+                return None
+
+            # Mark the entry as most recently used
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return scan_data
+
+    def peek(self, key):
+        """
+        Return the scan cached under KEY or None
+        without counting a hit or miss 
+        and without marking the entry as recently used.
+        """
+
+        with self._lock:
+            return self._entries.get(key)
+
+    def get_or_load(self, key, load):
+        """
+        Return the scan cached under KEY.  
+
+        When the scan is not cached yet, call LOAD() to load it and
+        cache the result.  When the same scan is being loaded by
+        another thread already - for example by the prefetcher - wait
+        for it instead of decoding the scan a second time.
+        """
+
+        with self._lock:
+            scan_data = self._entries.get(key)
+            if scan_data is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return scan_data
+
+            loading = self._loading.get(key)
+            if loading is None:
+                # Load the scan in this thread
+                self._misses += 1
+                loading = Event()
+                self._loading[key] = loading
+                loader = True
+            else:
+                # The scan is being loaded by another thread
+                loader = False
+
+        if not loader:
+            loading.wait()
+            scan_data = self.get(key)
+            if scan_data is not None:
+                return scan_data
+
+            # The other thread failed to load the scan
+            # or the scan did not fit into the cache - 
+            # load it without caching
+            return load()
+
+        try:
+            scan_data = load()
+            if scan_data is not None:
+                self.put(key, scan_data)
+            return scan_data
+
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def put(self, key, scan_data):
+        """
+        Cache SCAN_DATA under KEY
+        and evict the least recently used entries
+        exceeding the memory budget.
+        """
+
+        # Cached scans are shared - protect them against modification
+        scan_data.flags.writeable = False
+
+        nbytes = scan_data.nbytes
+        if nbytes > self._max_bytes:
+            # The scan does not fit into the cache at all
+            return
+
+        with self._lock:
+            old_scan_data = self._entries.pop(key, None)
+            if old_scan_data is not None:
+                self._bytes -= old_scan_data.nbytes
+
+            self._entries[key] = scan_data
+            self._bytes += nbytes
+
+            # Evict the least recently used entries
+            while self._bytes > self._max_bytes:
+                evicted_key, evicted_scan_data = self._entries.popitem(last=False)
+                self._bytes -= evicted_scan_data.nbytes
+                self._evictions += 1
+                Logger.debug("ScanCache: Evicted: {}".format(evicted_key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """
+        Return a dictionary with the cache statistics.
+        """
+
+        with self._lock:
+            return {
+                'hits':      self._hits,
+                'misses':    self._misses,
+                'evictions': self._evictions,
+                'entries':   len(self._entries),
+                'bytes':     self._bytes,
+                'max-bytes': self._max_bytes,
+            }
+
+    def log_stats(self):
+        stats = self.get_stats()
+        Logger.info("ScanCache: {hits} hits, {misses} misses, {evictions} evictions, "
+                    "{entries} entries, {bytes} of {max-bytes} bytes used"\
+                    .format(**stats))
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,289 @@
+"""newskylabs/tools/bookblock/logic/sourceindex.py
+
+Index of the scans in the source directory.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import os, re
+from fnmatch import fnmatchcase
+from pathlib import PosixPath
+from threading import Lock
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## Natural sort
+## ---------------------------------------------------------
+
+g_regexp_digits = re.compile(r'(\d+)')
+
+def natural_sort_key(name):
+    """
+    Sort key ordering numbers by value:
+    scan2.png < scan10.png
+    """
+
+    return [int(part) if part.isdigit() else part.lower()
+            for part in g_regexp_digits.split(name)]
+
+## =========================================================
+## format_to_regexp(file_format)
+## ---------------------------------------------------------
+
+# printf style integer conversion: %d, %3d, %03d
+g_regexp_int_conversion = re.compile(r'%(0?\d*)d|%%')
+
+def format_to_regexp(file_format):
+    """
+    Convert the printf style FILE_FORMAT of the scan files
+    into a regular expression matching the file names
+    and capturing the scan number.
+
+    Example: scan%03d.png => scan( *\\d+)\\.png
+
+    The regular expression ignores the width of the scan number -
+    use is_formatted_scan_number() to check it.
+
+    Return None when FILE_FORMAT does not contain an integer conversion.
+    """
+
+    parts = []
+    position = 0
+    has_number = False
+    for m in g_regexp_int_conversion.finditer(file_format):
+        parts.append(re.escape(file_format[position:m.start()]))
+        if m.group(0) == '%%':
+            parts.append('%')
+        elif has_number:
+            # Only the first number is the scan number
+            parts.append(r'\d+')
+        else:
+            parts.append(r'( *\d+)')
+            has_number = True
+        position = m.end()
+    parts.append(re.escape(file_format[position:]))
+
+    if not has_number:
+        return None
+
+    return re.compile(''.join(parts))
+
+def get_scan_conversion(file_format):
+    """
+    Return the integer conversion of the scan number in FILE_FORMAT
+    (scan%03d.png => %03d) - or None.
+    """
+
+    for m in g_regexp_int_conversion.finditer(file_format):
+        if m.group(0) != '%%':
+            return m.group(0)
+
+    return None
+
+def is_formatted_scan_number(conversion, number):
+    """
+    Is the string NUMBER the scan number formatted by CONVERSION -
+    including its zero padding and width?
+
+    Example: for %03d `004' is, `4' and `0004' are not.
+    """
+
+    return conversion % int(number) == number
+
+## =========================================================
+## Directory listings
+## ---------------------------------------------------------
+
+# Cached directory listings:
+# (directory, recursive) -> ({directory: mtime}, [relative file names])
+g_listings = {}
+g_listings_lock = Lock()
+
+def list_files(directory, recursive=False):
+    """
+    Return the names of the files in DIRECTORY - relative to
+    DIRECTORY and including the files in subdirectories when
+    RECURSIVE is True.
+
+    The listing is cached together with the modification times of
+    the listed directories; as long as they do not change, the
+    directories are not listed again.
+    """
+
+    key = (directory, recursive)
+    with g_listings_lock:
+        cached = g_listings.get(key)
+
+    if cached is not None:
+        mtimes, names = cached
+        try:
+            if all(os.stat(path).st_mtime_ns == mtime for path, mtime in mtimes.items()):
+                return names
+        except OSError:
+            pass
+
+    mtimes = {}
+    names = []
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        path = os.path.join(directory, relative_dir)
+        with os.scandir(path) as entries:
+            mtimes[path] = os.stat(path).st_mtime_ns
+            for entry in entries:
+                name = os.path.join(relative_dir, entry.name)
+                if entry.is_file():
+                    names.append(name)
+                elif recursive and entry.is_dir():
+                    stack.append(name)
+
+    with g_listings_lock:
+        g_listings[key] = (mtimes, names)
+
+    return names
+
+## =========================================================
+## class SourceIndex
+## ---------------------------------------------------------
+
+# Prefix of regular expression source patterns
+g_regexp_prefix = 're:'
+
+class SourceIndex:
+    """
+    An in-memory index mapping scan numbers to scan file names.
+
+    The source directory is listed only once (see list_files()) -
+    instead of building and checking the path of each scan
+    separately, which is expensive on network file systems.
+
+    The scan files are found either
+
+    - by the SOURCE_FILE_FORMAT (scan%03d.png): the scan number is
+      parsed from the file name - missing scans are allowed; only
+      the names given by the format count, including the width of
+      the scan number (scan004.png, but not scan4.png or scan0004.png),
+    - by a glob PATTERN (*.png): the scans are numbered in natural
+      sort order of their names starting with 0,
+    - by a regular expression PATTERN prefixed with `re:'
+      (re:scan-(\\d+)\\.tif): the scan number is the first group -
+      or, when the expression has no group, the scans are numbered
+      in natural sort order.
+
+    When RECURSIVE is True the files in the subdirectories of the
+    source directory are indexed as well; the patterns are matched
+    against the path relative to the source directory.
+
+    The index is built lazily when it is used first.
+    """
+
+    def __init__(self, source_dir, source_file_format, pattern=None, recursive=False):
+        self._source_dir = source_dir
+        self._source_file_format = source_file_format
+        self._pattern = pattern
+        self._recursive = recursive
+
+        # Scan number -> file name relative to the source directory
+        self._files = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get_source_dir(),
+                   settings.get_source_file_format(),
+                   settings.get_source_pattern(),
+                   settings.get_source_recursive())
+
+    def __getstate__(self):
+
+        # Do not pickle the index -
+        # it is rebuilt when needed
+        state = self.__dict__.copy()
+        state['_files'] = None
+        return state
+
+    def get_files(self):
+        """
+        Return the mapping of scan numbers to scan file names.
+        """
+
+        if self._files is None:
+            self._files = self._build_index()
+
+        return self._files
+
+    def get_file(self, scan):
+        """
+        Return the name of the file of SCAN
+        relative to the source directory - or None.
+        """
+
+        return self.get_files().get(scan)
+
+    def get_scans(self):
+        """
+        Return the sorted list of the scan numbers.
+        """
+
+        return sorted(self.get_files())
+
+    def _build_index(self):
+
+        source_dir = str(PosixPath(self._source_dir).expanduser())
+        try:
+            names = list_files(source_dir, self._recursive)
+        except OSError as error:
+            Logger.warning("SourceIndex: Cannot list the source directory {}: {}"\
+                           .format(source_dir, error))
+            return {}
+
+        names = sorted(names, key=natural_sort_key)
+        pattern = self._pattern
+
+        if pattern and pattern.startswith(g_regexp_prefix):
+            regexp = re.compile(pattern[len(g_regexp_prefix):])
+            matches = [(name, regexp.fullmatch(name)) for name in names]
+            matches = [(name, m) for name, m in matches if m]
+            if regexp.groups:
+                numbered = [(int(m.group(1)), name) for name, m in matches]
+            else:
+                numbered = list(enumerate(name for name, m in matches))
+
+        elif pattern:
+            numbered = list(enumerate(name for name in names
+                                      if fnmatchcase(name, pattern)))
+
+        else:
+            # Only the names given by the format are scans:
+            # with scan%03d.png scan 4 is scan004.png -
+            # neither scan4.png nor scan0004.png
+            regexp = format_to_regexp(self._source_file_format)
+            if regexp is None:
+                return {}
+            conversion = get_scan_conversion(self._source_file_format)
+            numbered = []
+            for name in names:
+                m = regexp.fullmatch(name)
+                if m and is_formatted_scan_number(conversion, m.group(1)):
+                    numbered.append((int(m.group(1)), name))
+
+        files = {}
+        for scan, name in numbered:
+            if scan in files:
+                Logger.warning("SourceIndex: Ignoring {} - scan {} is {} already"\
+                               .format(name, scan, files[scan]))
+                continue
+            files[scan] = name
+
+        Logger.debug("SourceIndex: {} scans found in {}".format(len(files), source_dir))
+        return files
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -30,6 +30,8 @@ import sys, os, click
 
 from newskylabs.tools.bookblock.utils.settings import Settings
 from newskylabs.tools.bookblock.utils.generic import get_version_long
+from newskylabs.tools.bookblock.utils.logger import configure_logger
+from newskylabs.tools.bookblock.utils.config import load_saved_geometry
 
 # -i, --source-dir
 option_source_dir_help = "Directory where the scans are stored."
@@ -52,7 +54,9 @@ option_pages_help = "Specification of the pages to be cut out."
 option_pages_default = '1r,2-9lr,10l'
 
 # -g, --geometry
-option_geometry_help = "Geometry of the pages."
+option_geometry_help = "Geometry of the pages " + \
+    "(default: the geometry saved in the GUI for the source directory, " + \
+    "otherwise 600x800+10+20)."
 option_geometry_default = '600x800+10+20'
 
 # -c, --image-mode
@@ -67,6 +71,101 @@ option_view_mode_help = "View mode: " + \
 option_view_mode_choice = ['scan', 'page']
 option_view_mode_default = 'page'
 
+# -b, --batch
+option_batch_help = "Batch mode: " + \
+    "cut out the pages and store them " + \
+    "without starting the GUI."
+option_batch_default = False
+
+# -j, --jobs
+option_jobs_help = "Number of worker processes " + \
+    "used to generate the pages."
+option_jobs_default = 1
+
+# -P, --pipeline
+option_pipeline_help = "Generate the pages in a pipeline " + \
+    "of reader, decoder and writer threads " + \
+    "overlapping disk I/O with decoding and encoding " + \
+    "(cannot be combined with --jobs > 1)."
+option_pipeline_default = False
+
+# -q, --queue-depth
+option_queue_depth_help = "Number of scans buffered between " + \
+    "the pipeline stages."
+option_queue_depth_default = 2
+
+# -m, --cache-size
+option_cache_size_help = "Memory budget in MB " + \
+    "for caching decoded scans."
+option_cache_size_default = 512
+
+# -A, --prefetch-ahead
+option_prefetch_ahead_help = "Number of pages ahead " + \
+    "in the direction of navigation " + \
+    "which are decoded in the background."
+option_prefetch_ahead_default = 2
+
+# -B, --prefetch-behind
+option_prefetch_behind_help = "Number of pages behind " + \
+    "the direction of navigation " + \
+    "which are decoded in the background."
+option_prefetch_behind_default = 1
+
+# -I, --incremental
+option_incremental_help = "Only generate the pages " + \
+    "whose scan, geometry, side, image mode or format " + \
+    "has changed since they have been generated last."
+option_incremental_default = False
+
+# -D, --disk-cache-dir
+option_disk_cache_dir_help = "Directory of the persistent cache " + \
+    "of decoded scans.  " + \
+    "The GUI uses ~/.bookblock/cache by default, " + \
+    "batch mode only uses a persistent cache when it is given."
+option_disk_cache_dir_default = None
+
+# -M, --disk-cache-size
+option_disk_cache_size_help = "Size limit in MB " + \
+    "of the persistent cache of decoded scans " + \
+    "(0 disables the cache)."
+option_disk_cache_size_default = 2048
+
+# -n, --dry-run
+option_dry_run_help = "Check the scans and pages " + \
+    "and estimate the amounts of data and the runtime " + \
+    "without generating any page."
+option_dry_run_default = False
+
+# -S, --source-pattern
+option_source_pattern_help = "Find the scans by a glob pattern (*.png) " + \
+    "numbering them in natural sort order " + \
+    "or by a regular expression prefixed with re: " + \
+    "whose first group is the scan number " + \
+    "(re:scan-(\\d+)\\.tif) " + \
+    "instead of the source file format."
+option_source_pattern_default = None
+
+# -R, --recursive
+option_source_recursive_help = "Also find the scans " + \
+    "in the subdirectories of the source directory."
+option_source_recursive_default = False
+
+# -r, --report
+option_report_path_help = "Path of the JSON run report " + \
+    "with the per-stage timing statistics " + \
+    "(default: ~/.bookblock/reports/bookblock-<mode>-<time>-<pid>.json)."
+option_report_path_default = None
+
+# -X, --profile
+option_profile_help = "Profile the session (session), " + \
+    "only loading and showing pages in the GUI (navigation) " + \
+    "or only generating the pages (apply) " + \
+    "with cProfile and a stack sampler. " + \
+    "The .pstats profile and the collapsed stacks for flame graphs " + \
+    "are written to ~/.bookblock/profiles/ " + \
+    "(worker processes are not profiled)."
+option_profile_default = None
+
 # -e, --examples
 option_examples_help = "Show some usage examples."
 option_examples_default = False
@@ -103,7 +202,6 @@ command_context_settings={'help_option_names': ['-h', '--help']}
               help=option_pages_help)
   
 @click.option('-g', '--geometry',
-              default=option_geometry_default,
               help=option_geometry_help)
 
 @click.option('-c', '--image-mode', 
@@ -116,6 +214,80 @@ command_context_settings={'help_option_names': ['-h', '--help']}
               default=option_view_mode_default, 
               help=option_view_mode_help)
 
+@click.option('-b', '--batch',
+              is_flag=True,
+              default=option_batch_default,
+              help=option_batch_help)
+
+@click.option('-j', '--jobs',
+              type=click.IntRange(min=1),
+              default=option_jobs_default,
+              help=option_jobs_help)
+
+@click.option('-P', '--pipeline',
+              is_flag=True,
+              default=option_pipeline_default,
+              help=option_pipeline_help)
+
+@click.option('-q', '--queue-depth',
+              type=click.IntRange(min=1),
+              default=option_queue_depth_default,
+              help=option_queue_depth_help)
+
+@click.option('-m', '--cache-size',
+              type=click.IntRange(min=0),
+              default=option_cache_size_default,
+              help=option_cache_size_help)
+
+@click.option('-A', '--prefetch-ahead',
+              type=click.IntRange(min=0),
+              default=option_prefetch_ahead_default,
+              help=option_prefetch_ahead_help)
+
+@click.option('-B', '--prefetch-behind',
+              type=click.IntRange(min=0),
+              default=option_prefetch_behind_default,
+              help=option_prefetch_behind_help)
+
+@click.option('-I', '--incremental',
+              is_flag=True,
+              default=option_incremental_default,
+              help=option_incremental_help)
+
+@click.option('-D', '--disk-cache-dir',
+              type=click.Path(file_okay=False),
+              default=option_disk_cache_dir_default,
+              help=option_disk_cache_dir_help)
+
+@click.option('-M', '--disk-cache-size',
+              type=click.IntRange(min=0),
+              default=option_disk_cache_size_default,
+              help=option_disk_cache_size_help)
+
+@click.option('-n', '--dry-run',
+              is_flag=True,
+              default=option_dry_run_default,
+              help=option_dry_run_help)
+
+@click.option('-S', '--source-pattern',
+              default=option_source_pattern_default,
+              help=option_source_pattern_help)
+
+@click.option('-R', '--recursive', 'source_recursive',
+              is_flag=True,
+              default=option_source_recursive_default,
+              help=option_source_recursive_help)
+
+@click.option('-r', '--report', 'report_path',
+              type=click.Path(dir_okay=False),
+              default=option_report_path_default,
+              help=option_report_path_help)
+
+@click.option('-X', '--profile',
+              type=click.Choice(['session', 'navigation', 'apply']),
+              default=option_profile_default,
+              help=option_profile_help)
+
 @click.option('-e', '--examples',
               is_flag=True,
               default=option_examples_default,
@@ -134,6 +306,21 @@ def bookblock(source_dir, target_dir,
               geometry,
               image_mode, 
               view_mode,
+              batch,
+              jobs,
+              pipeline,
+              queue_depth,
+              cache_size,
+              prefetch_ahead,
+              prefetch_behind,
+              incremental,
+              disk_cache_dir,
+              disk_cache_size,
+              dry_run,
+              source_pattern,
+              source_recursive,
+              report_path,
+              profile,
               examples, 
               debug):
     """Cut out pages from book scans.
@@ -174,6 +361,21 @@ def bookblock(source_dir, target_dir,
         print("  - geometry:           {}".format(geometry))
         print("  - image_mode:         {}".format(image_mode))
         print("  - view_mode:          {}".format(view_mode))
+        print("  - batch:              {}".format(batch))
+        print("  - jobs:               {}".format(jobs))
+        print("  - pipeline:           {}".format(pipeline))
+        print("  - queue_depth:        {}".format(queue_depth))
+        print("  - cache_size:         {}".format(cache_size))
+        print("  - prefetch_ahead:     {}".format(prefetch_ahead))
+        print("  - prefetch_behind:    {}".format(prefetch_behind))
+        print("  - incremental:        {}".format(incremental))
+        print("  - disk_cache_dir:     {}".format(disk_cache_dir))
+        print("  - disk_cache_size:    {}".format(disk_cache_size))
+        print("  - dry_run:            {}".format(dry_run))
+        print("  - source_pattern:     {}".format(source_pattern))
+        print("  - source_recursive:   {}".format(source_recursive))
+        print("  - report_path:        {}".format(report_path))
+        print("  - profile:            {}".format(profile))
         print("  - examples:           {}".format(examples))
         print("  - debug:              {}".format(debug))
 
@@ -182,6 +384,25 @@ def bookblock(source_dir, target_dir,
         print_examples()
         exit()
 
+    # The worker processes and the pipeline 
+    # are alternative ways to generate the pages
+    if pipeline and jobs and jobs > 1:
+        raise click.UsageError("--pipeline cannot be combined with --jobs {}".format(jobs))
+
+    # Use the geometry saved in the GUI for the source directory
+    # when no geometry is given
+    if geometry is None:
+        geometry = load_saved_geometry(source_dir)
+        if geometry is not None:
+            print("Using the geometry saved for {}: {}".format(source_dir, geometry))
+        else:
+            geometry = option_geometry_default
+
+    # Check the geometry and the page specification
+    # before starting a session
+    check_geometry(geometry)
+    check_pages(pages)
+
     # Settings
     settings = Settings() \
         .set_debug_level(debug) \
@@ -192,11 +413,47 @@ def bookblock(source_dir, target_dir,
         .set_source_file_format(source_file_format) \
         .set_target_file_format(target_file_format) \
         .set_geometry(geometry) \
-        .set_pages(pages)
+        .set_pages(pages) \
+        .set_jobs(jobs) \
+        .set_pipeline(pipeline) \
+        .set_queue_depth(queue_depth) \
+        .set_cache_size(cache_size) \
+        .set_prefetch_ahead(prefetch_ahead) \
+        .set_prefetch_behind(prefetch_behind) \
+        .set_incremental(incremental) \
+        .set_disk_cache_dir(disk_cache_dir) \
+        .set_disk_cache_size(disk_cache_size) \
+        .set_dry_run(dry_run) \
+        .set_source_pattern(source_pattern) \
+        .set_source_recursive(source_recursive) \
+        .set_report_path(report_path) \
+        .set_profile(profile)
 
     # Print settings
     settings.print_settings()
 
+    # The logic layer logs to stderr
+    # (the GUI logs via Kivy's handlers instead)
+    configure_logger(debug)
+
+    # Profiling:
+    # Start the profiler before the session starts
+    if profile:
+        from newskylabs.tools.bookblock.logic.profiler import get_profiler
+        get_profiler().start(profile)
+
+    # Batch mode:
+    # Cut out the pages without starting the GUI -
+    # no Kivy window, texture or event loop is created
+    if batch or dry_run:
+        try:
+            success = run_batch(settings)
+        except (ValueError, OSError) as error:
+            print("ERROR {}".format(error), file=sys.stderr)
+            exit(2)
+        write_profile('batch')
+        exit(0 if success else 1)
+
     # Hack to silently import Kivy's noisy logger:
     # The logger prints all kind of messages before the log level can be set
     # and seems to ignore its config file log level settings as well
@@ -222,6 +479,7 @@ def bookblock(source_dir, target_dir,
     from newskylabs.tools.bookblock.gui.main import BookBlockApp
     app = BookBlockApp(settings)
     app.run()
+    write_profile('gui')
 
     # done :)
     print("")
@@ -230,7 +488,79 @@ def bookblock(source_dir, target_dir,
     exit()
            
 ## =========================================================
-## Main
+## Checking the options
+## ---------------------------------------------------------
+
+def check_geometry(geometry):
+    """Raise a usage error when GEOMETRY is malformed."""
+
+    from newskylabs.tools.bookblock.logic.page import parse_geometry
+
+    try:
+        parse_geometry(geometry)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="'-g' / '--geometry'")
+
+def check_pages(pages):
+    """Raise a usage error when the page specification PAGES is malformed."""
+
+    from newskylabs.tools.bookblock.logic.pages import parse_page_spec
+
+    try:
+        for page_spec in pages.split(","):
+            parse_page_spec(page_spec)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="'-p' / '--pages'")
+
+## =========================================================
+## Batch mode
+## ---------------------------------------------------------
+
+def run_batch(settings):
+    """Cut out all pages and store them without starting the GUI."""
+
+    # Only the logic layer is needed in batch mode
+    from newskylabs.tools.bookblock.logic.bookblock import BookBlock
+
+    bookblock = BookBlock(settings)
+
+    # Dry run:
+    # Only check the pages and estimate the work to be done
+    if settings.get_dry_run():
+        return bookblock.dry_run()
+
+    print("Generating pages:")
+    success = bookblock.store_pages()
+    print("Done.")
+
+    # Report the time spent in each stage
+    report_path = bookblock.write_run_report('batch')
+    if report_path is not None:
+        print("Run report: {}".format(report_path))
+
+    return success
+
+## =========================================================
+## Profiling
+## ---------------------------------------------------------
+
+def write_profile(mode):
+    """Write the profile of the session - when profiling."""
+
+    from newskylabs.tools.bookblock.logic.profiler import get_profiler
+
+    profiler = get_profiler()
+    if not profiler.is_active():
+        return
+
+    paths = profiler.write(mode)
+    if paths is not None:
+        pstats_path, collapsed_path = paths
+        print("Profile:          {}".format(pstats_path))
+        print("Collapsed stacks: {}".format(collapsed_path))
+
+## =========================================================
+## Examples
 ## ---------------------------------------------------------
  
 def print_examples():
@@ -299,6 +629,57 @@ bookblock \\
   --image-mode         grayscale \\
   --view-mode          scan
 
+Generate the pages of scan 0 to 99
+in batch mode without starting the GUI
+(for example from cron or a job scheduler):
+
+bookblock \\
+  --source-dir         ~/home/tmp/the-secret-garden/png \\
+  --target-dir         ~/home/tmp/pages \\
+  --source-file-format the-secret-garden.%02d.png \\
+  --target-file-format page%02d.png \\
+  --geometry           1000x1600+22+41 \\
+  --pages              0-99lr \\
+  --batch
+
+The same using 8 worker processes:
+
+bookblock \\
+  --source-dir         ~/home/tmp/the-secret-garden/png \\
+  --target-dir         ~/home/tmp/pages \\
+  --source-file-format the-secret-garden.%02d.png \\
+  --target-file-format page%02d.png \\
+  --geometry           1000x1600+22+41 \\
+  --pages              0-99lr \\
+  --jobs               8 \\
+  --batch
+
+Regenerate only the pages
+whose scans have been changed since the last run:
+
+bookblock \\
+  --source-dir         ~/home/tmp/the-secret-garden/png \\
+  --target-dir         ~/home/tmp/pages \\
+  --source-file-format the-secret-garden.%02d.png \\
+  --target-file-format page%02d.png \\
+  --geometry           1000x1600+22+41 \\
+  --pages              0-99lr \\
+  --incremental \\
+  --batch
+
+Check all scans and pages and estimate
+the amount of data and the runtime
+without generating any page:
+
+bookblock \\
+  --source-dir         ~/home/tmp/the-secret-garden/png \\
+  --target-dir         ~/home/tmp/pages \\
+  --source-file-format the-secret-garden.%02d.png \\
+  --target-file-format page%02d.png \\
+  --geometry           1000x1600+22+41 \\
+  --pages              0-99lr \\
+  --dry-run
+
 """)
 
 ## =========================================================
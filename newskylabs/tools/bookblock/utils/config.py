@@ -0,0 +1,67 @@
+"""newskylabs/tools/bookblock/utils/config.py
+
+The bookblock config file ~/.bookblock/config.ini.
+
+The file is written by the GUI (see BookBlockApp.build_config()).
+The command line interface reads the geometries saved in the GUI
+from it - without importing Kivy.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+from pathlib import Path
+from configparser import ConfigParser, Error as ConfigError
+
+from newskylabs.tools.bookblock.utils.logger import Logger
+
+## =========================================================
+## Saved geometries
+## ---------------------------------------------------------
+
+# The config file of the GUI
+g_config_file = '~/.bookblock/config.ini'
+
+# The geometry of each source directory is saved in a section
+# `geometry:<absolute path of the source directory>'
+g_geometry_section_prefix = 'geometry:'
+
+def get_geometry_section(source_dir):
+    """
+    Return the name of the config section
+    holding the geometry of the scans in SOURCE_DIR.
+    """
+
+    source_dir = str(Path(source_dir).expanduser().resolve())
+    return g_geometry_section_prefix + source_dir
+
+def load_saved_geometry(source_dir, config_file=g_config_file):
+    """
+    Return the geometry saved for the scans in SOURCE_DIR -
+    or None when no geometry has been saved.
+    """
+
+    config_path = Path(config_file).expanduser()
+    if not config_path.exists():
+        return None
+
+    # Kivy's log file name contains `%' -
+    # do not interpolate the values
+    config = ConfigParser(interpolation=None)
+    try:
+        config.read(str(config_path))
+    except ConfigError as error:
+        Logger.warning("Config: Ignoring malformed config file {}: {}"\
+                       .format(config_path, error))
+        return None
+
+    return config.get(get_geometry_section(source_dir), 'geometry', fallback=None)
+
+## =========================================================
+## =========================================================
+
+## fin.
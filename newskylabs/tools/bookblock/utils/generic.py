@@ -10,7 +10,7 @@ __copyright__   = "Copyright 2019 Dietrich Bollmann"
 __license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
 __date__        = "2019/10/16"
 
-import os, sys, re
+import os, platform
 from os.path import join, dirname, isfile
 import pathlib
 
@@ -19,23 +19,15 @@ import pathlib
 ## ---------------------------------------------------------
 
 def get_version():
-    """Return package version as defined in `setup.py` (ex: 1.2.3)."""
-
-    package_base_dir = get_package_base_dir()
-    
-    main_file = os.path.join(package_base_dir, 'bookblock/__main__.py')
-    init_py = open(main_file).read()
-    match = re.search("__version__\s*=\s*['\"]([^'\"]+)['\"]", init_py)
-    if match:
-        version = match.group(1)
-        return version
-    else:
-        raise RuntimeError("Unable to find version string in %s." % main_file)
+    """Return package version as defined in `__about__.py` (ex: 1.2.3)."""
+
+    from newskylabs.tools.bookblock.__about__ import __version__
+    return __version__
 
 def get_version_long():
     """Return long package version (ex: 1.2.3 (Python 3.4.5))."""
 
-    return '{} (Python {})'.format(get_version(), sys.version[:5])
+    return '{} (Python {})'.format(get_version(), platform.python_version())
 
 ## =========================================================
 ## Tools for files and directories
@@ -0,0 +1,99 @@
+"""newskylabs/tools/bookblock/utils/logger.py
+
+Logging facade.
+
+The logic layer logs via the standard logging module - without
+importing Kivy, whose initialization is slow and noisy.
+
+Messages follow Kivy's convention `Tag: message'.  In batch mode
+they are printed to stderr (see configure_logger()); the GUI attaches
+Kivy's console and file handlers instead (see use_handlers()).
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import sys, logging
+
+## =========================================================
+## Log levels
+## ---------------------------------------------------------
+
+# Kivy's additional level below DEBUG
+TRACE = 9
+logging.addLevelName(TRACE, 'TRACE')
+
+# Log level names => log levels (the names of Kivy's LOG_LEVELS)
+LOG_LEVELS = {
+    'trace':    TRACE,
+    'debug':    logging.DEBUG,
+    'info':     logging.INFO,
+    'warning':  logging.WARNING,
+    'error':    logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
+## =========================================================
+## Logger
+## ---------------------------------------------------------
+
+class BookBlockLogger(logging.Logger):
+    """
+    A standard logger with Kivy's additional trace level.
+    """
+
+    def trace(self, msg, *args, **kwargs):
+        if self.isEnabledFor(TRACE):
+            self._log(TRACE, msg, args, **kwargs)
+
+def create_logger(name):
+    """
+    Return the BookBlockLogger NAME.
+    """
+
+    logger_class = logging.getLoggerClass()
+    logging.setLoggerClass(BookBlockLogger)
+    try:
+        return logging.getLogger(name)
+    finally:
+        logging.setLoggerClass(logger_class)
+
+# The logger of bookblock
+Logger = create_logger('bookblock')
+
+## =========================================================
+## Configuration
+## ---------------------------------------------------------
+
+def configure_logger(log_level='warning'):
+    """
+    Print the messages of LOG_LEVEL and above to stderr.
+    """
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('[%(levelname)-7s] %(message)s'))
+    use_handlers([handler], LOG_LEVELS.get(log_level, logging.WARNING))
+
+def use_handlers(handlers, level):
+    """
+    Replace the handlers of the logger by HANDLERS
+    and set its LEVEL - used by the GUI to log via Kivy's handlers.
+    """
+
+    for handler in list(Logger.handlers):
+        Logger.removeHandler(handler)
+
+    for handler in handlers:
+        Logger.addHandler(handler)
+
+    Logger.setLevel(level)
+    Logger.propagate = False
+
+## =========================================================
+## =========================================================
+
+## fin.
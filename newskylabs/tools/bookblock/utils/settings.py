@@ -31,6 +31,21 @@ class Settings:
         self._target_file_format = None
         self._geometry           = None
         self._pages              = None
+        self._jobs               = 1
+        self._pipeline           = False
+        self._queue_depth        = 2
+        self._cache_size         = 512
+        self._prefetch_ahead     = 2
+        self._prefetch_behind    = 1
+        self._preview_size       = None
+        self._incremental        = False
+        self._disk_cache_dir     = None
+        self._disk_cache_size    = 2048
+        self._dry_run            = False
+        self._source_pattern     = None
+        self._source_recursive   = False
+        self._report_path        = None
+        self._profile            = None
 
     def print_settings(self):
 
@@ -45,6 +60,20 @@ class Settings:
         print("  - geometry:           ", self._geometry)
         print("  - image mode:         ", self._image_mode)
         print("  - view mode:          ", self._view_mode)        
+        print("  - jobs:               ", self._jobs)
+        print("  - pipeline:           ", self._pipeline)
+        print("  - queue depth:        ", self._queue_depth)
+        print("  - cache size (MB):    ", self._cache_size)
+        print("  - prefetch ahead:     ", self._prefetch_ahead)
+        print("  - prefetch behind:    ", self._prefetch_behind)
+        print("  - incremental:        ", self._incremental)
+        print("  - disk cache dir:     ", self._disk_cache_dir)
+        print("  - disk cache (MB):    ", self._disk_cache_size)
+        print("  - dry run:            ", self._dry_run)
+        print("  - source pattern:     ", self._source_pattern)
+        print("  - source recursive:   ", self._source_recursive)
+        print("  - report path:        ", self._report_path)
+        print("  - profile:            ", self._profile)
         print("  - debug_level:        ", self._debug_level)
         print("")
 
@@ -86,6 +115,66 @@ class Settings:
         self._pages = pages
         return self
 
+    def set_jobs(self, jobs):
+        self._jobs = jobs
+        return self
+
+    def set_pipeline(self, pipeline):
+        self._pipeline = pipeline
+        return self
+
+    def set_queue_depth(self, queue_depth):
+        self._queue_depth = queue_depth
+        return self
+
+    def set_cache_size(self, cache_size):
+        self._cache_size = cache_size
+        return self
+
+    def set_prefetch_ahead(self, prefetch_ahead):
+        self._prefetch_ahead = prefetch_ahead
+        return self
+
+    def set_prefetch_behind(self, prefetch_behind):
+        self._prefetch_behind = prefetch_behind
+        return self
+
+    def set_preview_size(self, preview_size):
+        self._preview_size = preview_size
+        return self
+
+    def set_incremental(self, incremental):
+        self._incremental = incremental
+        return self
+
+    def set_disk_cache_dir(self, disk_cache_dir):
+        self._disk_cache_dir = disk_cache_dir
+        return self
+
+    def set_disk_cache_size(self, disk_cache_size):
+        self._disk_cache_size = disk_cache_size
+        return self
+
+    def set_dry_run(self, dry_run):
+        self._dry_run = dry_run
+        return self
+
+    def set_source_pattern(self, source_pattern):
+        self._source_pattern = source_pattern
+        return self
+
+    def set_source_recursive(self, source_recursive):
+        self._source_recursive = source_recursive
+        return self
+
+    def set_report_path(self, report_path):
+        self._report_path = report_path
+        return self
+
+    def set_profile(self, profile):
+        self._profile = profile
+        return self
+
     ## Getters
 
     def get_debug_level(self):
@@ -115,6 +204,51 @@ class Settings:
     def get_pages(self):
         return self._pages
 
+    def get_jobs(self):
+        return self._jobs
+
+    def get_pipeline(self):
+        return self._pipeline
+
+    def get_queue_depth(self):
+        return self._queue_depth
+
+    def get_cache_size(self):
+        return self._cache_size
+
+    def get_prefetch_ahead(self):
+        return self._prefetch_ahead
+
+    def get_prefetch_behind(self):
+        return self._prefetch_behind
+
+    def get_preview_size(self):
+        return self._preview_size
+
+    def get_incremental(self):
+        return self._incremental
+
+    def get_disk_cache_dir(self):
+        return self._disk_cache_dir
+
+    def get_disk_cache_size(self):
+        return self._disk_cache_size
+
+    def get_dry_run(self):
+        return self._dry_run
+
+    def get_source_pattern(self):
+        return self._source_pattern
+
+    def get_source_recursive(self):
+        return self._source_recursive
+
+    def get_report_path(self):
+        return self._report_path
+
+    def get_profile(self):
+        return self._profile
+
 ## =========================================================
 ## =========================================================
 
@@ -0,0 +1,107 @@
+"""tests/test_imageheader.py
+
+Tests of reading the image size from the image header.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import struct
+
+import pytest
+
+from newskylabs.tools.bookblock.logic.imageheader import probe_image_size
+
+## =========================================================
+## Image headers
+## ---------------------------------------------------------
+
+def png_header(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + b'\0\0\0\0'
+
+def jpeg_segment(marker, payload):
+    return bytes([0xff, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+def jpeg_header(width, height, sof_marker=0xc0):
+    app0 = jpeg_segment(0xe0, b'JFIF\0\x01\x01\0\0\x01\0\x01\0\0')
+    dqt  = jpeg_segment(0xdb, bytes(65))
+    sof  = jpeg_segment(sof_marker, struct.pack('>BHHB', 8, height, width, 3) + bytes(9))
+    return b'\xff\xd8' + app0 + dqt + b'\xff\xff' + sof + b'\xff\xda'
+
+def tiff_header(width, height, byte_order=b'II', width_type=3):
+    endian = '<' if byte_order == b'II' else '>'
+
+    def entry(tag, field_type, value):
+        if field_type == 3:
+            value = struct.pack(endian + 'HH', value, 0)
+        else:
+            value = struct.pack(endian + 'I', value)
+        return struct.pack(endian + 'HHI', tag, field_type, 1) + value
+
+    entries = [
+        entry(254, 4, 0),                   # NewSubfileType
+        entry(256, width_type, width),      # ImageWidth
+        entry(257, 4, height),              # ImageLength
+    ]
+    magic = b'*\x00' if byte_order == b'II' else b'\x00*'
+    return byte_order + magic + struct.pack(endian + 'I', 8) + \
+        struct.pack(endian + 'H', len(entries)) + b''.join(entries) + bytes(4)
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+## =========================================================
+## probe_image_size()
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('name, data', [
+    ('scan.png',        png_header(3508, 2480)),
+    ('scan.jpg',        jpeg_header(3508, 2480)),
+    ('progressive.jpg', jpeg_header(3508, 2480, sof_marker=0xc2)),
+    ('scan-le.tif',     tiff_header(3508, 2480, b'II')),
+    ('scan-be.tif',     tiff_header(3508, 2480, b'MM')),
+    ('scan-long.tif',   tiff_header(3508, 2480, b'II', width_type=4)),
+])
+def test_probe_image_size(tmp_path, name, data):
+    assert probe_image_size(write(tmp_path, name, data)) == (2480, 3508)
+
+@pytest.mark.parametrize('name, data', [
+
+    # Unsupported formats
+    ('scan.gif',       b'GIF89a' + bytes(16)),
+    ('empty.png',      b''),
+
+    # Malformed headers
+    ('no-ihdr.png',    png_header(10, 20).replace(b'IHDR', b'IDAT')),
+    ('no-sof.jpg',     b'\xff\xd8' + jpeg_segment(0xe0, bytes(14)) + b'\xff\xda'),
+    ('no-size.tif',    tiff_header(10, 20).replace(b'\x00\x01\x03\x00', b'\x10\x01\x03\x00')),
+
+    # Truncated headers
+    ('truncated.png',  png_header(10, 20)[:14]),
+    ('truncated.jpg',  jpeg_header(10, 20)[:30]),
+    ('truncated.tif',  tiff_header(10, 20)[:12]),
+])
+def test_probe_unknown_image_size(tmp_path, name, data):
+    assert probe_image_size(write(tmp_path, name, data)) is None
+
+@pytest.mark.parametrize('extension', ['.png', '.jpg', '.tif'])
+def test_probe_image_size_of_encoded_image(tmp_path, extension):
+    np = pytest.importorskip('numpy')
+    cv2 = pytest.importorskip('cv2')
+
+    path = str(tmp_path / ('scan' + extension))
+    assert cv2.imwrite(path, np.zeros((30, 70, 3), dtype=np.uint8))
+
+    assert probe_image_size(path) == (30, 70)
+
+## =========================================================
+## =========================================================
+
+## fin.
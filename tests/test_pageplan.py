@@ -0,0 +1,193 @@
+"""tests/test_pageplan.py
+
+Tests of the page plan - compared with a naive expansion of the
+page specification.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import pickle
+
+import pytest
+
+from newskylabs.tools.bookblock.logic.pageplan import PagePlan
+
+## =========================================================
+## Helpers
+## ---------------------------------------------------------
+
+# Mixed segments: 0l,1-3lr,4r,5-6l,7-8rl
+g_segments = [
+    (range(0, 1), ['left']),
+    (range(1, 4), ['left', 'right']),
+    (range(4, 5), ['right']),
+    (range(5, 7), ['left']),
+    (range(7, 9), ['right', 'left']),
+]
+
+def make_plan(segments=g_segments):
+    plan = PagePlan('scans', 'scan%03d.png', 'pages', 'page%03d.png')
+    for scans, sides in segments:
+        plan.append_segment(scans, sides)
+    return plan
+
+def expand(segments=g_segments):
+    """
+    Return the naive expansion of SEGMENTS:
+    a list of (scan, side, page) triples.
+    """
+
+    pages = []
+    for scans, sides in segments:
+        for scan in scans:
+            for side in sides:
+                pages.append((scan, side, len(pages) + 1))
+    return pages
+
+def triples(page_specs):
+    return [(spec['scan'], spec['side'], spec['page']) for spec in page_specs]
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_len_and_iteration():
+    plan = make_plan()
+    expected = expand()
+
+    assert len(plan) == len(expected) == 14
+    assert triples(plan) == expected
+
+def test_empty_segments_are_skipped():
+    plan = make_plan([(range(0, 0), ['left']), (range(3, 5), [])])
+
+    assert len(plan) == 0
+    assert list(plan) == []
+
+def test_index():
+    plan = make_plan()
+    expected = expand()
+
+    for index, (scan, side, page) in enumerate(expected):
+        assert (plan.get_scan(index), plan.get_side(index), plan.get_page(index)) \
+            == (scan, side, page)
+        assert triples([plan[index]]) == [(scan, side, page)]
+
+def test_negative_index():
+    plan = make_plan()
+    expected = expand()
+
+    for index in range(1, len(expected) + 1):
+        assert triples([plan[-index]]) == [expected[-index]]
+
+@pytest.mark.parametrize('index', [14, 100, -15])
+def test_index_out_of_range(index):
+    with pytest.raises(IndexError):
+        make_plan()[index]
+
+def test_file_infos():
+    page_spec = make_plan()[4]
+
+    assert page_spec['scan-path'] == 'scans/scan002.png'
+    assert page_spec['page-path'] == 'pages/page005.png'
+
+@pytest.mark.parametrize('start, stop', [
+    (None, None), (0, 14), (3, 9), (2, 3), (5, 5), (-4, None), (None, -6), (20, 30),
+])
+def test_slice(start, stop):
+    plan = make_plan()
+    expected = expand()
+    sliced = plan[start:stop]
+
+    assert len(sliced) == len(expected[start:stop])
+    assert triples(sliced) == expected[start:stop]
+    assert [sliced.get_page(i) for i in range(len(sliced))] \
+        == [page for scan, side, page in expected[start:stop]]
+
+def test_slice_of_slice():
+    assert triples(make_plan()[2:12][3:-2]) == expand()[2:12][3:-2]
+
+def test_slice_with_step():
+    with pytest.raises(ValueError):
+        make_plan()[::2]
+
+def test_get_index_of_page():
+    plan = make_plan()
+
+    for index, (scan, side, page) in enumerate(expand()):
+        assert plan.get_index_of_page(page) == index
+
+    for page in (0, 15):
+        with pytest.raises(IndexError):
+            plan.get_index_of_page(page)
+
+def test_get_index_of_page_in_slice():
+    sliced = make_plan()[3:9]
+
+    assert sliced.get_index_of_page(4) == 0
+    assert sliced.get_index_of_page(9) == 5
+
+    for page in (3, 10):
+        with pytest.raises(IndexError):
+            sliced.get_index_of_page(page)
+
+def test_get_index_of_scan():
+    plan = make_plan()
+
+    assert plan.get_index_of_scan(2) == 3
+    assert plan.get_index_of_scan(2, 'right') == 4
+    assert plan.get_index_of_scan(4, 'right') == 7
+    assert plan.get_index_of_scan(8, 'left') == 13
+
+    with pytest.raises(IndexError):
+        plan.get_index_of_scan(4, 'left')
+    with pytest.raises(IndexError):
+        plan.get_index_of_scan(9)
+
+def test_iter_scans():
+    plan = make_plan()
+
+    pages = [(scan, side, page + i)
+             for scan, sides, page in plan.iter_scans()
+             for i, side in enumerate(sides)]
+    assert pages == expand()
+
+    # A slice starting and ending in the middle of a scan
+    sliced = plan[4:6]
+    assert list(sliced.iter_scans()) == [(2, ('right',), 5), (3, ('left',), 6)]
+
+def test_iter_scan_groups():
+    groups = list(make_plan().iter_scan_groups())
+
+    assert [scan for scan, page_specs in groups] == list(range(9))
+    assert [triple for scan, page_specs in groups for triple in triples(page_specs)] \
+        == expand()
+
+def test_iter_scan_groups_merges_adjacent_segments():
+    plan = make_plan([(range(5, 6), ['left']), (range(5, 6), ['right'])])
+
+    groups = list(plan.iter_scan_groups())
+    assert [(scan, len(page_specs)) for scan, page_specs in groups] == [(5, 2)]
+
+def test_huge_plan_is_lazy():
+    plan = make_plan([(range(0, 10**9), ['left', 'right'])])
+
+    assert len(plan) == 2 * 10**9
+    assert triples([plan[-1]]) == [(10**9 - 1, 'right', 2 * 10**9)]
+    assert plan.get_index_of_page(10**9) == 10**9 - 1
+
+def test_pickle():
+    plan = make_plan()[2:12]
+    plan[0]
+
+    assert triples(pickle.loads(pickle.dumps(plan))) == expand()[2:12]
+
+## =========================================================
+## =========================================================
+
+## fin.
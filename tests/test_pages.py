@@ -0,0 +1,75 @@
+"""tests/test_pages.py
+
+Tests of parsing page specifications
+and the targets of jumps to a page.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import pytest
+
+from newskylabs.tools.bookblock.logic.pages import parse_page_spec, parse_page_target
+
+## =========================================================
+## parse_page_spec()
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('page_spec, expected', [
+    ('0l',    (range(0, 1), ['left'])),
+    ('1-3lr', (range(1, 4), ['left', 'right'])),
+    ('56r',   (range(56, 57), ['right'])),
+])
+def test_parse_page_spec(page_spec, expected):
+    assert parse_page_spec(page_spec) == expected
+
+@pytest.mark.parametrize('page_spec', ['', 'l', 'x1', '-3lr'])
+def test_parse_malformed_page_spec(page_spec):
+    with pytest.raises(ValueError):
+        parse_page_spec(page_spec)
+
+## =========================================================
+## parse_page_target()
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('target, expected', [
+
+    # Page numbers
+    ('730',     ('page', 730)),
+    ('0',       ('page', 0)),
+    (' 12 ',    ('page', 12)),
+
+    # Scan and side
+    ('12l',     ('scan', (12, 'left'))),
+    ('12r',     ('scan', (12, 'right'))),
+    ('s12l',    ('scan', (12, 'left'))),
+    ('12 r',    ('scan', (12, 'right'))),
+
+    # First page of a scan
+    ('s12',     ('scan', (12, None))),
+    (' s0 ',    ('scan', (0, None))),
+
+    # Fractions of the book
+    ('50%',     ('fraction', 0.5)),
+    ('0%',      ('fraction', 0.0)),
+    ('100%',    ('fraction', 1.0)),
+    ('12.5 %',  ('fraction', 0.125)),
+    ('50.%',    ('fraction', 0.5)),
+])
+def test_parse_page_target(target, expected):
+    assert parse_page_target(target) == expected
+
+@pytest.mark.parametrize('target', [
+    '', ' ', 'abc', '12x', '12lr', 's', 'sl', '-3', '1.5', '%', '.5%', 's12%', '12 13',
+])
+def test_parse_malformed_page_target(target):
+    assert parse_page_target(target) is None
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,72 @@
+"""tests/test_sourceindex.py
+
+Tests of the index mapping scan numbers to scan file names.
+
+"""
+
+__author__      = "Dietrich Bollmann"
+__email__       = "dietrich@formgames.org"
+__copyright__   = "Copyright 2019 Dietrich Bollmann"
+__license__     = "Apache License 2.0, http://www.apache.org/licenses/LICENSE-2.0"
+__date__        = "2019/10/18"
+
+import pytest
+
+from newskylabs.tools.bookblock.logic.sourceindex import SourceIndex
+
+## =========================================================
+## Helpers
+## ---------------------------------------------------------
+
+def make_index(tmp_path, names, file_format='scan%03d.png', pattern=None):
+    for name in names:
+        (tmp_path / name).write_bytes(b'')
+    return SourceIndex(str(tmp_path), file_format, pattern)
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('file_format, names, expected', [
+
+    # The zero padding of the scan number is honored
+    ('scan%03d.png', ['scan004.png', 'scan0005.png', 'scan6.png', 'scan1234.png'],
+     {4: 'scan004.png', 1234: 'scan1234.png'}),
+
+    # The exact name is preferred to names with a different padding
+    ('scan%03d.png', ['scan0004.png', 'scan004.png', 'scan04.png'],
+     {4: 'scan004.png'}),
+
+    # Without padding
+    ('scan%d.png', ['scan4.png', 'scan04.png', 'scan10.png'],
+     {4: 'scan4.png', 10: 'scan10.png'}),
+
+    # Padded with spaces
+    ('scan%3d.png', ['scan  4.png', 'scan004.png', 'scan4.png'],
+     {4: 'scan  4.png'}),
+
+    # Other files are ignored
+    ('scan%03d.png', ['scan001.tif', 'page001.png', 'scan.png'],
+     {}),
+])
+def test_file_format_names(tmp_path, file_format, names, expected):
+    index = make_index(tmp_path, names, file_format)
+
+    assert index.get_files() == expected
+
+@pytest.mark.parametrize('pattern, expected', [
+
+    # Glob and regular expression patterns match loosely
+    ('scan*.png',               {0: 'scan4.png', 1: 'scan0005.png', 2: 'scan10.png'}),
+    (r're:scan(\d+)\.png',      {4: 'scan4.png', 5: 'scan0005.png', 10: 'scan10.png'}),
+])
+def test_patterns(tmp_path, pattern, expected):
+    index = make_index(tmp_path, ['scan4.png', 'scan0005.png', 'scan10.png', 'page1.png'],
+                       pattern=pattern)
+
+    assert index.get_files() == expected
+
+## =========================================================
+## =========================================================
+
+## fin.